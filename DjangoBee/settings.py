@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.instrumentation.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +59,8 @@ ROOT_URLCONF = 'DjangoBee.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates s měřením doby vykreslení pro RequestInstrumentationMiddleware
+        'BACKEND': 'myapp.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,6 +87,15 @@ PORT = config.get("DB_PORT")
 NAME = config.get("DB_NAME")
 USER = config.get("DB_USER")
 
+# Trvalá spojení: DB_CONN_MAX_AGE v sekundách (0 = nové spojení pro každý požadavek, none = bez omezení),
+# znovu použité spojení se před prvním dotazem požadavku ověří (DB_CONN_HEALTH_CHECKS).
+# Za poolerem v transakčním režimu (DB_POOLER=transaction, např. PgBouncer) nelze držet kurzory
+# na straně serveru mezi transakcemi. Export pak načte celý výsledek dotazu do paměti procesu
+# (po částech se jen převádí na řádky), velké exporty proto mají vést na databázi mimo pooler.
+CONN_MAX_AGE = (config.get("DB_CONN_MAX_AGE") or '60').lower()
+CONN_HEALTH_CHECKS = (config.get("DB_CONN_HEALTH_CHECKS") or 'true').lower() == 'true'
+POOLER = (config.get("DB_POOLER") or '').lower()
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -93,9 +104,60 @@ DATABASES = {
         'USER': USER,
         'PORT': PORT,
         'PASSWORD': PASSWORD,
+        'CONN_MAX_AGE': None if CONN_MAX_AGE == 'none' else int(CONN_MAX_AGE),
+        'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+        'DISABLE_SERVER_SIDE_CURSORS': POOLER == 'transaction',
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Bez nastavení v .env se použije lokální paměť procesu, v produkci sdílený backend
+# (např. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...)
+
+CACHES = {
+    'default': {
+        'BACKEND': config.get("CACHE_BACKEND") or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': config.get("CACHE_LOCATION") or '',
     }
 }
 
+# Doba platnosti uloženého přehledu stanovišť v sekundách (zneplatňuje se i při každém zápisu)
+OVERVIEW_CACHE_TIMEOUT = int(config.get("OVERVIEW_CACHE_TIMEOUT") or 60 * 60)
+
+
+# Stránkování historie prohlídek (výchozí a maximální počet prohlídek na stránku)
+VISITS_PAGE_SIZE = 50
+VISITS_MAX_PAGE_SIZE = 200
+
+# Stránkování JSON API (výchozí a maximální počet záznamů na stránku)
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Synchronizace offline klientů: maximální počet změn v jedné odpovědi a v jedné odeslané dávce
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_BATCH = 200
+
+# Maximální počet generací procházených při sestavování rodokmenu matky
+GENEALOGY_MAX_DEPTH = 30
+
+# Počet pokusů o očíslování nových včelstev při kolizi s unique_place_hive_number
+HIVE_NUMBER_ATTEMPTS = 3
+
+# Import historických prohlídek: velikost dávky pro bulk_create, počet uchovaných chyb v hlášení
+# a maximální délka jednoho JSON záznamu (delší se nenačítá celý do paměti a hlásí se jako chybný)
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+IMPORT_MAX_RECORD_SIZE = 64 * 1024
+
+# Export: počet řádků načítaných najednou kurzorem na straně serveru
+EXPORT_CHUNK_SIZE = 2000
+
+# Analytika: výchozí a maximální počet období klouzavého průměru
+ANALYTICS_ROLLING_WINDOW = 3
+ANALYTICS_MAX_ROLLING_WINDOW = 52
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -142,3 +204,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # DEFAULT LOGIN PAGE TO BE SHOW
 LOGIN_URL = '/login_required_message'
+
+
+# Měření požadavků (myapp.instrumentation): hlavička Server-Timing a řádek logu za každý požadavek,
+# požadavky delší než SLOW_REQUEST_THRESHOLD_MS se logují i se seznamem prvních SLOW_REQUEST_MAX_QUERIES dotazů
+SERVER_TIMING_HEADER = (config.get("SERVER_TIMING_HEADER") or 'true').lower() == 'true'
+SLOW_REQUEST_THRESHOLD_MS = int(config.get("SLOW_REQUEST_THRESHOLD_MS") or 500)
+SLOW_REQUEST_MAX_QUERIES = int(config.get("SLOW_REQUEST_MAX_QUERIES") or 200)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'myapp.requests': {
+            'handlers': ['console'],
+            'level': config.get("REQUEST_LOG_LEVEL") or 'INFO',
+        },
+    },
+}
@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from myapp import views
+from myapp import api, sync, views
 from django.contrib.auth.decorators import login_required
 
 
@@ -51,6 +51,15 @@ urlpatterns = [
 
     path('visits/<str:hive_id>/', login_required(views.visits), name='visits'),
     path('add_visit/<str:hive_id>/', login_required(views.add_visit), name='add_visit'),
+    path('add_visits/<int:hives_place_id>/', login_required(views.add_visits), name='add_visits'),
+    path('import_visits/', login_required(views.import_visits), name='import_visits'),
+    path('export/<str:kind>/<str:fmt>/', login_required(views.export_records), name='export_records'),
+    path('analytics/', login_required(views.analytics), name='analytics'),
+    path('analytics/<str:scope>/<int:object_id>/', login_required(views.analytics), name='analytics_scope'),
     path('remove_visit/<str:visit_id>/', login_required(views.remove_visit), name='remove_visit'),
     path('edit_visit/<str:visit_id>/', login_required(views.edit_visit), name='edit_visit'),
+
+    path(f'api/{api.API_VERSION}/sync/', sync.sync, name='api_sync'),
+    path(f'api/{api.API_VERSION}/<str:resource>/', api.collection, name='api_collection'),
+    path(f'api/{api.API_VERSION}/<str:resource>/<int:object_id>/', api.item, name='api_item'),
 ]
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.db import connection
+from myapp.models import Hives, HivesPlaces, Visits, HiveSeasonRollup, PlaceSeasonRollup
+
+# Období agregace: týden, měsíc a včelařská sezóna (kalendářní rok)
+BUCKETS = {
+    'week': 'week',
+    'month': 'month',
+    'season': 'year',
+}
+SERIES_COLUMNS = [
+    'period', 'visits', 'honey_yield', 'condition', 'mite_drop',
+    'honey_yield_rolling', 'condition_rolling', 'mite_drop_rolling',
+    'honey_yield_previous_year', 'condition_previous_year', 'mite_drop_previous_year',
+]
+
+# Období z jednotlivých prohlídek (týden, měsíc)
+VISIT_BUCKETS_SQL = '''
+    SELECT
+        date_trunc(%(bucket)s, v.date)::date AS period,
+        COUNT(*) AS visits,
+        SUM(v.honey_yield) AS honey_yield,
+        AVG(v.condition)::float AS condition,
+        AVG(v.mite_drop)::float AS mite_drop
+    FROM {visits} v
+    JOIN {hives} h ON h.id = v.hive_id
+    JOIN {places} p ON p.id = h.place_id
+    WHERE p.beekeeper_id = %(beekeeper_id)s AND v.active {scope}
+    GROUP BY 1
+'''
+
+# Sezóny se čtou z předpočítaných souhrnů (včelstvo ze souhrnů včelstev, stanoviště a celý
+# včelař ze souhrnů stanovišť), prohlídky se tak vůbec neprocházejí.
+ROLLUP_BUCKETS_SQL = '''
+    SELECT
+        make_date(r.season, 1, 1) AS period,
+        SUM(r.visits_count)::integer AS visits,
+        CASE WHEN SUM(r.honey_yield_count) > 0 THEN SUM(r.honey_yield_sum) END AS honey_yield,
+        SUM(r.condition_sum)::float / NULLIF(SUM(r.condition_count), 0) AS condition,
+        SUM(r.mite_drop_sum)::float / NULLIF(SUM(r.mite_drop_count), 0) AS mite_drop
+    FROM {source}
+    WHERE p.beekeeper_id = %(beekeeper_id)s {scope}
+    GROUP BY 1
+'''
+HIVE_ROLLUPS = '{hive_rollups} r JOIN {hives} h ON h.id = r.hive_id JOIN {places} p ON p.id = h.place_id'
+PLACE_ROLLUPS = '{place_rollups} r JOIN {places} p ON p.id = r.place_id'
+
+# Časová řada prohlídek: součet medného výnosu, průměrná kondice a spad za období,
+# klouzavé průměry přes posledních N období a hodnoty stejného období předchozího roku.
+# Okno se vymezuje časem (RANGE), ne počtem řádků, aby se přes zimní mezeru bez prohlídek
+# nezapočítala období z předchozí sezóny.
+TIME_SERIES_SQL = '''
+WITH buckets AS ({buckets})
+SELECT
+    b.period, b.visits, b.honey_yield, b.condition, b.mite_drop,
+    AVG(b.honey_yield) OVER rolling AS honey_yield_rolling,
+    AVG(b.condition) OVER rolling AS condition_rolling,
+    AVG(b.mite_drop) OVER rolling AS mite_drop_rolling,
+    previous.honey_yield AS honey_yield_previous_year,
+    previous.condition AS condition_previous_year,
+    previous.mite_drop AS mite_drop_previous_year
+FROM buckets b
+LEFT JOIN buckets previous ON previous.period = date_trunc(%(bucket)s, b.period - INTERVAL '1 year')::date
+WINDOW rolling AS (ORDER BY b.period RANGE BETWEEN (%(preceding)s * INTERVAL '1 {unit}') PRECEDING AND CURRENT ROW)
+ORDER BY b.period
+'''
+
+
+def time_series(beekeeper, bucket='month', window=None, place_id=None, hive_id=None):
+    """
+    Vrátí časovou řadu prohlídek včelaře, stanoviště nebo včelstva jako slovník sloupců
+    (název sloupce -> seznam hodnot), vše spočítané v jednom SQL dotazu.
+    """
+    if window is None:
+        window = settings.ANALYTICS_ROLLING_WINDOW
+    if bucket not in BUCKETS:
+        raise ValueError(f'Nepodporované období: {bucket}')
+    if window < 1:
+        raise ValueError('Klouzavé okno musí zahrnovat alespoň jedno období.')
+
+    tables = {
+        'visits': Visits._meta.db_table,
+        'hives': Hives._meta.db_table,
+        'places': HivesPlaces._meta.db_table,
+        'hive_rollups': HiveSeasonRollup._meta.db_table,
+        'place_rollups': PlaceSeasonRollup._meta.db_table,
+    }
+    params = {'bucket': BUCKETS[bucket], 'beekeeper_id': beekeeper.pk, 'preceding': window - 1,
+              'hive_id': hive_id, 'place_id': place_id}
+    if bucket != 'season':
+        if hive_id is not None:
+            scope = 'AND h.id = %(hive_id)s'
+        elif place_id is not None:
+            scope = 'AND h.place_id = %(place_id)s'
+        else:
+            scope = ''
+        buckets = VISIT_BUCKETS_SQL.format(scope=scope, **tables)
+    elif hive_id is not None:
+        buckets = ROLLUP_BUCKETS_SQL.format(source=HIVE_ROLLUPS.format(**tables), scope='AND r.hive_id = %(hive_id)s')
+    else:
+        scope = 'AND r.place_id = %(place_id)s' if place_id is not None else ''
+        buckets = ROLLUP_BUCKETS_SQL.format(source=PLACE_ROLLUPS.format(**tables), scope=scope)
+    sql = TIME_SERIES_SQL.format(buckets=buckets, unit=BUCKETS[bucket])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    series = {column: [] for column in SERIES_COLUMNS}
+    for row in rows:
+        for column, value in zip(SERIES_COLUMNS, row):
+            series[column].append(value)
+    return series
@@ -0,0 +1,367 @@
+import json
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Optional
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
+from myapp.bulk import create_hive_batch
+from myapp.caching import invalidate_overview
+from myapp.deactivation import deactivate_hive, deactivate_mother, deactivate_place, deactivate_visit
+from myapp.forms import AddHive, AddHivesPlace, AddMother, EditHivesPlace, EditVisit
+from myapp.importing import ImportVisitRow
+from myapp.models import HivesPlaces, Hives, Mothers, Visits, Tasks, HiveStatus, refresh_hive_summaries
+from myapp.ownership import OWNED_OBJECTS
+
+API_VERSION = 'v1'
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class Resource:
+    model: type
+    # Cesta k včelaři (None = společný číselník pro všechny včelaře)
+    owner: Optional[str]
+    fields: tuple
+    # Pole, podle kterých lze filtrovat výpis (?hive=<id>)
+    filters: tuple = ()
+    # Vypočtená pole: název -> výraz pro annotate
+    annotations: dict = field(default_factory=dict)
+    # include=<název> -> (zdroj, lookup zdroje na id primárních záznamů[, podmínka na přiložené záznamy])
+    includes: dict = field(default_factory=dict)
+    # Zápis: create(user, data), update(user, obj, data), delete(user, obj); bez nich jen ke čtení
+    create: Optional[Callable] = None
+    update: Optional[Callable] = None
+    delete: Optional[Callable] = None
+
+    @property
+    def pk(self):
+        return self.model._meta.pk.name
+
+    def owned(self, user):
+        # Všechny záznamy včelaře včetně zrušených (active=False)
+        queryset = self.model.objects.all()
+        if self.owner:
+            queryset = queryset.filter(**{self.owner: user})
+        return queryset
+
+    def queryset(self, user):
+        queryset = self.owned(user)
+        if any(model_field.name == 'active' for model_field in self.model._meta.fields):
+            queryset = queryset.filter(active=True)
+        return queryset
+
+    def rows(self, queryset, fields, **extra):
+        annotations = {name: self.annotations[name] for name in fields if name in self.annotations}
+        return list(queryset.annotate(**annotations, **extra).values(*fields, *extra))
+
+
+def _owned(kind, user, object_id, name):
+    # Nadřazený záznam zadaný v těle požadavku musí patřit přihlášenému včelaři
+    model, owner_path, _ = OWNED_OBJECTS[kind]
+    try:
+        return model.objects.get(pk=object_id, active=True, **{owner_path: user})
+    except (model.DoesNotExist, ValueError, TypeError):
+        raise ApiError('Nadřazený záznam neexistuje.', errors={name: ['Neplatný záznam.']})
+
+
+def _merged(instance, form_class, data, **renamed):
+    # Částečná úprava (PATCH): neuvedená pole si ponechají uložené hodnoty
+    fields = form_class._meta.fields
+    merged = {}
+    for name, value in model_to_dict(instance, fields=fields).items():
+        merged[name] = [item.pk for item in value] if isinstance(value, list) else value
+    for api_name, form_name in renamed.items():
+        if api_name in data:
+            data = {**data, form_name: data[api_name]}
+    merged.update({name: value for name, value in data.items() if name in fields})
+    return merged
+
+
+def _valid(form):
+    if not form.is_valid():
+        raise ApiError('Neplatná data.', errors=form.errors.get_json_data())
+    return form
+
+
+def create_place(user, data):
+    place = _valid(AddHivesPlace(data)).save(commit=False)
+    place.beekeeper_id = user.pk
+    place.save()
+    return place
+
+
+def update_place(user, place, data):
+    return _valid(EditHivesPlace(_merged(place, EditHivesPlace, data), instance=place)).save()
+
+
+def create_hive(user, data):
+    place = _owned('place', user, data.get('place'), 'place')
+    form = _valid(AddHive(data))
+    return create_hive_batch(place.id, hive_type=form.cleaned_data['type'], comment=form.cleaned_data['comment'],
+                             count=1)[0]
+
+
+def update_hive(user, hive, data):
+    return _valid(AddHive(_merged(hive, AddHive, data), instance=hive)).save()
+
+
+def create_mother(user, data):
+    hive = _owned('hive', user, data.get('hive'), 'hive')
+    mother = _valid(AddMother(user, data)).save(commit=False)
+    mother.hive = hive
+    mother.save()
+    return mother
+
+
+def update_mother(user, mother, data):
+    return _valid(AddMother(user, _merged(mother, AddMother, data), instance=mother)).save()
+
+
+def create_visit(user, data):
+    hive = _owned('hive', user, data.get('hive'), 'hive')
+    # Stejná pravidla jako import prohlídek (povinná síla včelstva, volitelná poznámka)
+    form = _valid(ImportVisitRow({**data, 'performed_tasks': data.get('tasks', [])},
+                                 task_choices=Tasks.objects.values_list('id', 'name')))
+    visit = form.save(commit=False)
+    visit.hive = hive
+    visit.save()
+    visit.performed_tasks.set(form.cleaned_data['performed_tasks'])
+    refresh_hive_summaries([hive.id], [visit.date.year])
+    return visit
+
+
+def update_visit(user, visit, data):
+    old_season = visit.date.year
+    visit = _valid(EditVisit(_merged(visit, EditVisit, data, tasks='performed_tasks'), instance=visit)).save()
+    refresh_hive_summaries([visit.hive_id], [old_season, visit.date.year])
+    return visit
+
+
+# Jen aktuální matka každého včelstva, stejně jako ve výpisech a exportech
+CURRENT_MOTHER = Q(id=Subquery(Mothers.objects.current().filter(hive=OuterRef('hive')).values('id')[:1]))
+
+RESOURCES = {
+    'places': Resource(
+        model=HivesPlaces,
+        owner=OWNED_OBJECTS['place'][1],
+        fields=('id', 'name', 'type', 'location', 'comment', 'active'),
+        includes={
+            'hives': ('hives', 'place__in'),
+            'mothers': ('mothers', 'hive__place__in', CURRENT_MOTHER),
+            'statuses': ('statuses', 'hive__place__in'),
+        },
+        create=create_place,
+        update=update_place,
+        delete=lambda user, place: deactivate_place(place),
+    ),
+    'hives': Resource(
+        model=Hives,
+        owner=OWNED_OBJECTS['hive'][1],
+        fields=('id', 'place', 'number', 'type', 'comment', 'active'),
+        filters=('place',),
+        includes={
+            'place': ('places', 'hives__in'),
+            'mothers': ('mothers', 'hive__in', CURRENT_MOTHER),
+            'statuses': ('statuses', 'hive__in'),
+        },
+        create=create_hive,
+        update=update_hive,
+        delete=lambda user, hive: deactivate_hive(hive),
+    ),
+    'mothers': Resource(
+        model=Mothers,
+        owner=OWNED_OBJECTS['mother'][1],
+        fields=('id', 'hive', 'ancestor', 'mark', 'year', 'female_line', 'male_line', 'comment', 'active'),
+        filters=('hive',),
+        includes={
+            'hive': ('hives', 'mothers__in'),
+        },
+        create=create_mother,
+        update=update_mother,
+        delete=lambda user, mother: deactivate_mother(mother),
+    ),
+    'visits': Resource(
+        model=Visits,
+        owner=OWNED_OBJECTS['visit'][1],
+        fields=('id', 'hive', 'date', 'inspection_type', 'condition', 'hive_body_size', 'honey_supers_size',
+                'honey_yield', 'medication_application', 'disease', 'mite_drop', 'comment', 'tasks', 'active'),
+        filters=('hive',),
+        annotations={
+            'tasks': ArrayAgg('performed_tasks', filter=Q(performed_tasks__isnull=False), default=[]),
+        },
+        includes={
+            'hive': ('hives', 'visits__in'),
+        },
+        create=create_visit,
+        update=update_visit,
+        delete=lambda user, visit: deactivate_visit(visit),
+    ),
+    # Úkony jsou společný číselník všech včelařů bez vlastníka (spravuje se v administraci).
+    # Úprava přes API by změnila úkony i ostatním včelařům, zdroj je proto jen ke čtení.
+    'tasks': Resource(
+        model=Tasks,
+        owner=None,
+        fields=('id', 'name'),
+    ),
+    # Souhrnný stav včelstva (poslední prohlídka a poslední hodnoty), jen ke čtení
+    'statuses': Resource(
+        model=HiveStatus,
+        owner='hive__place__beekeeper',
+        fields=tuple(model_field.name for model_field in HiveStatus._meta.concrete_fields),
+        filters=('hive',),
+    ),
+}
+
+
+def _split(value):
+    return [item for item in (value or '').split(',') if item]
+
+
+def _fields(request, resource, param='fields'):
+    # fields= pro primární záznamy, fields[<zdroj>]= pro přiložené; id se vrací vždy
+    requested = _split(request.GET.get(param))
+    unknown = [item for item in requested if item not in resource.fields]
+    if unknown:
+        raise ApiError(f'Neznámá pole: {", ".join(unknown)}.')
+    if not requested:
+        return list(resource.fields)
+    return [resource.pk] + [item for item in requested if item != resource.pk]
+
+
+def int_param(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f'Parametr {name} musí být celé číslo.')
+
+
+def _included(request, user, resource, ids):
+    """
+    Přiložené záznamy (include=hives,mothers,...): jeden dotaz na každý přiložený zdroj
+    bez ohledu na počet primárních záznamů.
+    """
+    included = {}
+    for name in _split(request.GET.get('include')):
+        if name not in resource.includes:
+            raise ApiError(f'Nelze přiložit: {name}.')
+        target_name, lookup, *conditions = resource.includes[name]
+        target = RESOURCES[target_name]
+        queryset = target.queryset(user).filter(*conditions, **{lookup: ids}).distinct().order_by(target.pk)
+        included[target_name] = target.rows(queryset, _fields(request, target, f'fields[{target_name}]'))
+    return included
+
+
+def json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except (UnicodeDecodeError, ValueError):
+        raise ApiError('Tělo požadavku není platný JSON.')
+    if not isinstance(data, dict):
+        raise ApiError('Tělo požadavku musí být JSON objekt.')
+    return data
+
+
+def _write(request, resource, action, *args):
+    if action is None:
+        raise ApiError('Zdroj je jen ke čtení.', status=405)
+    try:
+        with transaction.atomic():
+            result = action(request.user, *args)
+    except IntegrityError:
+        raise ApiError('Záznam je v konfliktu s existujícími daty.', status=409)
+    invalidate_overview(request.user.pk)
+    return result
+
+
+def api_view(view):
+    # Přihlášení, neznámý zdroj a chyby API vrací JSON místo přesměrování nebo HTML stránky
+    @wraps(view)
+    def wrapper(request, resource, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Přihlaste se.'}, status=401)
+        if resource not in RESOURCES:
+            return JsonResponse({'error': 'Neznámý zdroj.'}, status=404)
+        try:
+            return view(request, RESOURCES[resource], *args, **kwargs)
+        except ApiError as error:
+            return error_response(error)
+    return wrapper
+
+
+def error_response(error):
+    content = {'error': str(error)}
+    if error.errors:
+        content['errors'] = error.errors
+    return JsonResponse(content, status=error.status)
+
+
+@api_view
+@require_http_methods(['GET', 'POST'])
+def collection(request, resource):
+    """
+    GET: stránka záznamů včelaře seřazená podle id. Kurzor (cursor=) je id posledního záznamu
+    předchozí stránky, limit= omezuje velikost stránky, filtr podle nadřazeného záznamu např. ?hive=<id>.
+    POST: založení záznamu z JSON těla.
+    """
+    if request.method == 'POST':
+        obj = _write(request, resource, resource.create, json_body(request))
+        return JsonResponse({'data': _detail(request, resource, obj.pk)}, status=201)
+
+    queryset = resource.queryset(request.user).order_by(resource.pk)
+    for name in resource.filters:
+        if name in request.GET:
+            queryset = queryset.filter(**{name: int_param(request.GET[name], name)})
+    if request.GET.get('cursor'):
+        queryset = queryset.filter(pk__gt=int_param(request.GET['cursor'], 'cursor'))
+    limit = int_param(request.GET.get('limit', settings.API_PAGE_SIZE), 'limit')
+    limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+    # O řádek navíc pro zjištění, zda existuje další stránka
+    rows = resource.rows(queryset[:limit + 1], _fields(request, resource))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1][resource.pk])
+    return JsonResponse({
+        'data': rows,
+        'included': _included(request, request.user, resource, [row[resource.pk] for row in rows]),
+        'next': next_cursor,
+    })
+
+
+def _detail(request, resource, object_id):
+    rows = resource.rows(resource.queryset(request.user).filter(pk=object_id), _fields(request, resource))
+    if not rows:
+        raise ApiError('Záznam neexistuje.', status=404)
+    return rows[0]
+
+
+@api_view
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+def item(request, resource, object_id):
+    if request.method == 'GET':
+        return JsonResponse({
+            'data': _detail(request, resource, object_id),
+            'included': _included(request, request.user, resource, [object_id]),
+        })
+
+    obj = resource.queryset(request.user).filter(pk=object_id).first()
+    if obj is None:
+        raise ApiError('Záznam neexistuje.', status=404)
+    if request.method == 'DELETE':
+        _write(request, resource, resource.delete, obj)
+        return HttpResponse(status=204)
+
+    _write(request, resource, resource.update, obj, json_body(request))
+    return JsonResponse({'data': _detail(request, resource, object_id)})
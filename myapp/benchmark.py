@@ -0,0 +1,173 @@
+import statistics
+import time
+from dataclasses import dataclass
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from myapp.models import HivesPlaces, Hives, Mothers, Visits
+
+
+@dataclass
+class EndpointResult:
+    name: str
+    requests: int
+    p50: float
+    p95: float
+    p99: float
+    throughput: float
+    queries: float
+    max_queries: int
+    errors: int
+
+
+def endpoints(beekeeper):
+    """
+    Čtecí stránky včelaře pro měření: (název, URL). Měří se stanoviště s nejvíce včelstvy,
+    včelstvo s nejvíce prohlídkami a nejstarší matka (s největším stromem potomků).
+    """
+    place = (
+        HivesPlaces.objects.filter(beekeeper=beekeeper, active=True)
+        .annotate(hives_count=Count('hives')).order_by('-hives_count', 'id').first()
+    )
+    hive = (
+        Hives.objects.filter(place=place, active=True)
+        .annotate(visits_count=Count('visits')).order_by('-visits_count', 'number').first()
+    ) if place else None
+    mother = Mothers.objects.filter(hive__place__beekeeper=beekeeper).order_by('year', 'id').first()
+    visit = Visits.objects.filter(hive=hive, active=True).order_by('-date').first() if hive else None
+
+    result = [
+        ('overview', reverse('overview')),
+        ('analytics', reverse('analytics')),
+        ('export_records', reverse('export_records', args=['visits', 'csv'])),
+    ]
+    if place:
+        result += [
+            ('hives_place', reverse('hives_place', args=[place.id])),
+            ('add_visits', reverse('add_visits', args=[place.id])),
+            ('analytics_place', reverse('analytics_scope', args=['place', place.id])),
+        ]
+    if hive:
+        result += [
+            ('visits', reverse('visits', args=[hive.id])),
+            ('add_visit', reverse('add_visit', args=[hive.id])),
+        ]
+    if mother:
+        result.append(('mothers', reverse('mothers', args=[mother.id])))
+    if visit:
+        result.append(('edit_visit', reverse('edit_visit', args=[visit.id])))
+    return result
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ClientTransport:
+    # Testovací klient Djanga (spojení s databází mezi požadavky nezavírá)
+    def __init__(self, beekeeper, host):
+        self.client = Client(SERVER_NAME=host)
+        self.client.force_login(beekeeper)
+
+    def get(self, url):
+        return _consume(self.client.get(url)).status_code
+
+
+class WsgiTransport:
+    # Požadavky přímo přes WSGI aplikaci včetně signálů request_started/request_finished,
+    # projeví se tak správa spojení s databází (CONN_MAX_AGE), kterou testovací klient vypíná
+    def __init__(self, beekeeper, host):
+        client = Client()
+        client.force_login(beekeeper)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        self.host = host
+        self.handler = WSGIHandler()
+
+    def get(self, url):
+        path, _, query = url.partition('?')
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': self.host, 'HTTP_COOKIE': self.cookie}
+        setup_testing_defaults(environ)
+        status = []
+        body = self.handler(environ, lambda value, headers, exc_info=None: status.append(value))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        return int(status[0].split()[0])
+
+
+TRANSPORTS = {
+    'client': ClientTransport,
+    'wsgi': WsgiTransport,
+}
+
+
+def run(beekeeper, iterations=20, warmup=2, names=None, host='localhost', transport='client'):
+    """
+    Projde stránky přihlášeného včelaře (testovacím klientem nebo přes WSGI) a vrátí EndpointResult
+    s latencemi (p50/p95/p99 v ms), propustností (požadavky/s), počty dotazů a chybových odpovědí.
+    """
+    transport = TRANSPORTS[transport](beekeeper, host)
+    results = []
+    for name, url in endpoints(beekeeper):
+        if names and name not in names:
+            continue
+        for _ in range(warmup):
+            transport.get(url)
+
+        latencies = []
+        queries = []
+        errors = 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status_code = transport.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            errors += status_code >= 400
+
+        results.append(EndpointResult(
+            name=name,
+            requests=iterations,
+            p50=percentile(latencies, 50),
+            p95=percentile(latencies, 95),
+            p99=percentile(latencies, 99),
+            throughput=iterations / (sum(latencies) / 1000),
+            queries=statistics.mean(queries),
+            max_queries=max(queries),
+            errors=errors,
+        ))
+    return results
+
+
+def compare_conn_max_age(beekeeper, values, **kwargs):
+    """
+    Změří stránky přes WSGI postupně pro každou hodnotu CONN_MAX_AGE (např. 0 a 60)
+    a vrátí slovník hodnota -> výsledky. Původní nastavení spojení se nakonec obnoví.
+    """
+    original = connection.settings_dict['CONN_MAX_AGE']
+    results = {}
+    try:
+        for value in values:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = value
+            results[value] = run(beekeeper, transport='wsgi', **kwargs)
+    finally:
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = original
+    return results
+
+
+def _consume(response):
+    # Streamované odpovědi se musí dočíst, jinak by se dotazy exportu neprovedly
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
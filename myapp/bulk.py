@@ -0,0 +1,55 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from myapp.models import Hives, Mothers, Visits, refresh_hive_summaries
+from myapp.numbering import create_hives
+
+FIRST_VISIT_INSPECTION_TYPE = 'Založení včelstva'
+
+
+def create_hive_batch(place_id, hive_type, comment, count, mother_data=None, visit_data=None):
+    """
+    Založí count včelstev na stanovišti v jedné transakci, volitelně i s matkami
+    (značka = předpona + číslo včelstva) a první prohlídkou. Nová včelstva dostanou první úsek
+    po sobě jdoucích volných čísel, mezery menší než dávka se nevyplňují. Vše se vkládá přes bulk_create.
+    """
+    with transaction.atomic():
+        hives = create_hives(place_id, [Hives(type=hive_type, comment=comment) for _ in range(count)],
+                             contiguous=True)
+
+        if mother_data:
+            marks = {hive.id: f"{mother_data['mark_prefix']}{hive.number}" for hive in hives}
+            taken_marks = list(Mothers.objects.filter(mark__in=marks.values()).values_list('mark', flat=True))
+            if taken_marks:
+                raise ValidationError(f'Značky matek již existují: {", ".join(sorted(taken_marks))}.')
+            try:
+                # Značku mohl mezi kontrolou a vložením obsadit souběžný zápis
+                with transaction.atomic():
+                    Mothers.objects.bulk_create([
+                        Mothers(
+                            hive=hive,
+                            mark=marks[hive.id],
+                            year=mother_data['year'],
+                            female_line=mother_data['female_line'],
+                            male_line=mother_data['male_line'],
+                            comment='',
+                        )
+                        for hive in hives
+                    ])
+            except IntegrityError:
+                taken_marks = Mothers.objects.filter(mark__in=marks.values()).values_list('mark', flat=True)
+                raise ValidationError(f'Značky matek již existují: {", ".join(sorted(taken_marks))}.')
+
+        if visit_data:
+            Visits.objects.bulk_create([
+                Visits(
+                    hive=hive,
+                    date=visit_data['date'],
+                    inspection_type=FIRST_VISIT_INSPECTION_TYPE,
+                    hive_body_size=visit_data['hive_body_size'],
+                    honey_supers_size=visit_data['honey_supers_size'],
+                )
+                for hive in hives
+            ])
+            refresh_hive_summaries(hive.id for hive in hives)
+
+    return hives
@@ -0,0 +1,103 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from myapp.dashboard import overview_summary
+from myapp.models import Change
+
+OVERVIEW_VERSION_KEY = 'overview:version:{beekeeper_id}'
+OVERVIEW_SUMMARY_KEY = 'overview:summary:{beekeeper_id}:{version}'
+OVERVIEW_STATS_KEY = 'overview:stats:{name}'
+
+
+def _incr(key):
+    # incr na neexistujícím klíči vyhazuje ValueError, klíč se proto nejprve založí
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def overview_version(beekeeper_id):
+    key = OVERVIEW_VERSION_KEY.format(beekeeper_id=beekeeper_id)
+    cache.add(key, 1, timeout=None)
+    return cache.get(key, 1)
+
+
+def bump_overview_version(beekeeper_id):
+    return _incr(OVERVIEW_VERSION_KEY.format(beekeeper_id=beekeeper_id))
+
+
+def invalidate_overview(beekeeper_id):
+    """
+    Zneplatní uložený přehled včelaře. Verze se zvyšuje až po potvrzení transakce,
+    aby souběžný požadavek neuložil pod novou verzi ještě stará data.
+    """
+    transaction.on_commit(lambda: bump_overview_version(beekeeper_id))
+
+
+def cached_overview_summary(beekeeper):
+    key = OVERVIEW_SUMMARY_KEY.format(beekeeper_id=beekeeper.pk, version=overview_version(beekeeper.pk))
+    summary = cache.get(key)
+    if summary is not None:
+        _incr(OVERVIEW_STATS_KEY.format(name='hits'))
+        return summary
+
+    _incr(OVERVIEW_STATS_KEY.format(name='misses'))
+    summary = overview_summary(beekeeper)
+    cache.set(key, summary, timeout=settings.OVERVIEW_CACHE_TIMEOUT)
+    return summary
+
+
+def overview_cache_stats():
+    stats = {name: cache.get(OVERVIEW_STATS_KEY.format(name=name), 0) for name in ('hits', 'misses')}
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else None
+    return stats
+
+
+def reset_overview_cache_stats():
+    cache.delete_many([OVERVIEW_STATS_KEY.format(name=name) for name in ('hits', 'misses')])
+
+
+def conditional_page(view):
+    """
+    Podmíněný GET pro stránky přihlášeného včelaře. ETag se skládá z verze dat včelaře v databázi
+    (Change.objects.data_version, mění ji každý zápis v jeho transakci) a CSRF cookie, platí tak
+    pro všechny procesy i po restartu. Při shodě vrací 304 bez volání view.
+    Stránky s čekajícími zprávami a stránky během nedokončeného staršího zápisu se vykreslí vždy
+    a bez ETagu, prohlížeč by jinak zprávu nebo stará data zobrazoval znovu z uložené kopie.
+    Last-Modified se neposílá, čas změny v pořadí potvrzení transakcí databáze neuchovává.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return view(request, *args, **kwargs)
+
+        beekeeper_id = request.user.pk
+        version = Change.objects.data_version(beekeeper_id)
+        if version is None:
+            return view(request, *args, **kwargs)
+        # Uložená stránka obsahuje CSRF token formulářů, po změně cookie ji nelze znovu použít
+        # (get_token založí tajemství hned, aby ETag první odpovědi platil i pro další požadavky)
+        get_token(request)
+        csrf = hashlib.sha256(request.META['CSRF_COOKIE'].encode()).hexdigest()[:8]
+        etag = quote_etag(f'{beekeeper_id}-{version}-{csrf}')
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.headers.setdefault('ETag', etag)
+        # Prohlížeč si stránku uloží jen pro sebe a před každým použitím ji ověří
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
@@ -0,0 +1,168 @@
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional
+from django.db import connection
+from django.db.models import Prefetch
+from myapp.models import HivesPlaces, Hives, Mothers, Visits, VisitsQuerySet, Tasks, HiveStatus, PlaceSeasonRollup
+
+
+@dataclass
+class PlaceSummary:
+    id: int
+    name: str
+    type: str
+    location: str
+    comment: str
+    hives_count: int = 0
+    mothers_count: int = 0
+    avg_honey_yield: Optional[float] = None
+    avg_condition: Optional[float] = None
+    avg_mite_drop: Optional[float] = None
+    last_visit_date: Optional[date] = None
+    last_tasks: list = field(default_factory=list)
+    last_medication: Optional[str] = None
+    last_medication_date: Optional[date] = None
+
+
+@dataclass(slots=True)
+class HiveRow:
+    id: int
+    number: int
+    type: str
+    comment: str
+    mother: Optional[Mothers] = None
+    last_visit_date: Optional[date] = None
+    hive_size: Optional[str] = None
+    condition: Optional[int] = None
+    # Poslední zaznamenané hodnoty prohlídek: pole -> {'value': ..., 'date': ...}
+    observations: dict = field(default_factory=dict)
+
+
+def _tables():
+    performed_tasks = Visits.performed_tasks.through
+    return {
+        'places': HivesPlaces._meta.db_table,
+        'hives': Hives._meta.db_table,
+        'mothers': Mothers._meta.db_table,
+        'visits': Visits._meta.db_table,
+        'tasks': Tasks._meta.db_table,
+        'status': HiveStatus._meta.db_table,
+        'place_rollups': PlaceSeasonRollup._meta.db_table,
+        'performed_tasks': performed_tasks._meta.db_table,
+    }
+
+
+# Souhrn všech aktivních stanovišť včelaře jedním dotazem. Počty se počítají v CTE seskupených
+# podle stanoviště, průměry ze sezónních souhrnů stanovišť, poslední léčivo a poslední úkony
+# přes LATERAL poddotazy.
+PLACE_SUMMARY_SQL = '''
+WITH places AS (
+    SELECT id, name, type, location, comment
+    FROM {places}
+    WHERE beekeeper_id = %(beekeeper_id)s AND active
+),
+hive_counts AS (
+    SELECT h.place_id, COUNT(DISTINCT h.id) AS hives_count, COUNT(DISTINCT m.id) AS mothers_count
+    FROM {hives} h
+    JOIN places p ON p.id = h.place_id
+    LEFT JOIN {mothers} m ON m.hive_id = h.id AND m.active
+    WHERE h.active
+    GROUP BY h.place_id
+),
+visit_averages AS (
+    SELECT r.place_id,
+           SUM(r.honey_yield_sum) / NULLIF(SUM(r.honey_yield_count), 0) AS avg_honey_yield,
+           SUM(r.condition_sum)::float / NULLIF(SUM(r.condition_count), 0) AS avg_condition
+    FROM {place_rollups} r
+    JOIN places p ON p.id = r.place_id
+    GROUP BY r.place_id
+),
+status_stats AS (
+    SELECT h.place_id, MAX(s.last_visit_date) AS last_visit_date, AVG(s.mite_drop)::float AS avg_mite_drop
+    FROM {status} s
+    JOIN {hives} h ON h.id = s.hive_id
+    JOIN places p ON p.id = h.place_id
+    WHERE h.active
+    GROUP BY h.place_id
+)
+SELECT
+    p.id, p.name, p.type, p.location, p.comment,
+    COALESCE(hc.hives_count, 0) AS hives_count,
+    COALESCE(hc.mothers_count, 0) AS mothers_count,
+    va.avg_honey_yield, va.avg_condition,
+    ss.avg_mite_drop, ss.last_visit_date,
+    COALESCE(lt.last_tasks, ARRAY[]::varchar[]) AS last_tasks,
+    lm.medication_application AS last_medication,
+    lm.medication_application_date AS last_medication_date
+FROM places p
+LEFT JOIN hive_counts hc ON hc.place_id = p.id
+LEFT JOIN visit_averages va ON va.place_id = p.id
+LEFT JOIN status_stats ss ON ss.place_id = p.id
+LEFT JOIN LATERAL (
+    SELECT s.medication_application, s.medication_application_date
+    FROM {status} s
+    JOIN {hives} h ON h.id = s.hive_id
+    WHERE h.place_id = p.id AND s.medication_application > ''
+    ORDER BY s.medication_application_date DESC
+    LIMIT 1
+) lm ON TRUE
+LEFT JOIN LATERAL (
+    SELECT ARRAY_AGG(t.name ORDER BY t.id) AS last_tasks
+    FROM (
+        SELECT v.id
+        FROM {visits} v
+        JOIN {hives} h ON h.id = v.hive_id
+        WHERE h.place_id = p.id AND h.active AND v.active
+          AND EXISTS (SELECT 1 FROM {performed_tasks} pt WHERE pt.visits_id = v.id)
+        ORDER BY v.date DESC, h.number
+        LIMIT 1
+    ) lv
+    JOIN {performed_tasks} pt ON pt.visits_id = lv.id
+    JOIN {tasks} t ON t.id = pt.tasks_id
+) lt ON TRUE
+ORDER BY p.id
+'''
+
+
+def place_summaries(beekeeper):
+    """
+    Vrátí seznam PlaceSummary pro všechna aktivní stanoviště včelaře (jeden SQL dotaz).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(PLACE_SUMMARY_SQL.format(**_tables()), {'beekeeper_id': beekeeper.pk})
+        columns = [column[0] for column in cursor.description]
+        return [PlaceSummary(**dict(zip(columns, row))) for row in cursor.fetchall()]
+
+
+def overview_summary(beekeeper):
+    summaries = place_summaries(beekeeper)
+    return {
+        'hives_places_count': len(summaries),
+        'hives_count': sum(summary.hives_count for summary in summaries),
+        'place_summaries': summaries,
+    }
+
+
+def hive_rows(place):
+    """
+    Řádky tabulky včelstev stanoviště (HiveRow): včelstva se souhrnem stavu jedním dotazem,
+    aktivní matky druhým (prefetch). U více aktivních matek platí ta s nejnižším id.
+    """
+    hives = (
+        Hives.objects.filter(place=place, active=True)
+        .select_related('status')
+        .prefetch_related(Prefetch('mothers', queryset=Mothers.objects.current(), to_attr='active_mothers'))
+        .order_by('number')
+    )
+    rows = []
+    for hive in hives:
+        row = HiveRow(id=hive.id, number=hive.number, type=hive.type, comment=hive.comment,
+                      mother=hive.active_mothers[0] if hive.active_mothers else None)
+        status = getattr(hive, 'status', None)
+        if status is not None:
+            row.last_visit_date = status.last_visit_date
+            row.hive_size = status.hive_size
+            row.condition = status.condition
+            row.observations = {field: status.observation(field) for field in VisitsQuerySet.OBSERVATION_FIELDS}
+        rows.append(row)
+    return rows
@@ -0,0 +1,43 @@
+from django.db import transaction
+from myapp.models import (
+    Hives, Mothers, Visits, HiveStatus, HiveSeasonRollup, PlaceSeasonRollup, refresh_hive_summaries
+)
+
+
+def deactivate_place(place):
+    # Zrušení stanoviště včetně jeho včelstev, matek a prohlídek
+    with transaction.atomic():
+        place.active = False
+        place.save()
+
+        hives_in_place = place.hives.all()
+        Hives.objects.filter(id__in=hives_in_place).update(active=False)
+        Mothers.objects.filter(hive__in=hives_in_place).update(active=False)
+        Visits.objects.filter(hive__in=hives_in_place).update(active=False)
+        HiveStatus.objects.filter(hive__in=hives_in_place).delete()
+        HiveSeasonRollup.objects.filter(hive__in=hives_in_place).delete()
+        PlaceSeasonRollup.objects.filter(place=place).delete()
+
+
+def deactivate_hive(hive):
+    # Zrušení včelstva včetně matky a prohlídek
+    with transaction.atomic():
+        hive.active = False
+        hive.save()
+
+        Mothers.objects.filter(hive=hive).update(active=False)
+        Visits.objects.filter(hive=hive).update(active=False)
+        HiveStatus.objects.filter(hive=hive).delete()
+        HiveSeasonRollup.objects.refresh([hive.id])
+
+
+def deactivate_mother(mother):
+    mother.active = False
+    mother.save()
+
+
+def deactivate_visit(visit):
+    with transaction.atomic():
+        visit.active = False
+        visit.save()
+        refresh_hive_summaries([visit.hive_id], [visit.date.year])
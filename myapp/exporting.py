@@ -0,0 +1,94 @@
+import csv
+import json
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Q, Subquery
+from myapp.importing import TASKS_SEPARATOR
+from myapp.models import Hives, Mothers, Visits
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+def visits_export(beekeeper):
+    # Sloupce odpovídají importu, export je tak možné znovu naimportovat
+    current_mother = Mothers.objects.current().filter(hive=OuterRef('hive_id')).values('mark')[:1]
+    rows = (
+        Visits.objects
+        .filter(hive__place__beekeeper=beekeeper, active=True)
+        .annotate(tasks=ArrayAgg('performed_tasks__name', filter=Q(performed_tasks__isnull=False), default=[]),
+                  mother=Subquery(current_mother))
+        .order_by('hive__place__name', 'hive__number', 'date', 'id')
+        .values_list('hive__place__name', 'hive__number', 'mother', 'date', 'inspection_type', 'condition',
+                     'hive_body_size', 'honey_supers_size', 'honey_yield', 'medication_application', 'disease',
+                     'mite_drop', 'comment', 'tasks')
+    )
+    columns = ['place', 'hive', 'mother', 'date', 'inspection_type', 'condition', 'hive_body_size',
+               'honey_supers_size', 'honey_yield', 'medication_application', 'disease', 'mite_drop', 'comment',
+               'tasks']
+    return columns, rows
+
+
+def hives_export(beekeeper):
+    current_mother = Mothers.objects.current().filter(hive=OuterRef('pk')).values('mark')[:1]
+    rows = (
+        Hives.objects
+        .filter(place__beekeeper=beekeeper, active=True)
+        .annotate(mother=Subquery(current_mother))
+        .order_by('place__name', 'number')
+        .values_list('place__name', 'place__location', 'number', 'type', 'mother', 'comment')
+    )
+    return ['place', 'location', 'hive', 'type', 'mother', 'comment'], rows
+
+
+def mothers_export(beekeeper):
+    rows = (
+        Mothers.objects
+        .filter(hive__place__beekeeper=beekeeper, active=True)
+        .order_by('year', 'mark')
+        .values_list('mark', 'year', 'female_line', 'male_line', 'ancestor__mark', 'hive__place__name',
+                     'hive__number', 'comment')
+    )
+    return ['mark', 'year', 'female_line', 'male_line', 'ancestor', 'place', 'hive', 'comment'], rows
+
+
+EXPORTS = {
+    'visits': visits_export,
+    'hives': hives_export,
+    'mothers': mothers_export,
+}
+
+
+class Echo:
+    # Pseudo-soubor pro csv.writer, který zapsaný řádek rovnou vrací
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, list):
+        return TASKS_SEPARATOR.join(value)
+    return value
+
+
+def stream_export(kind, beekeeper, fmt, chunk_size=None):
+    """
+    Generátor řádků exportu (CSV nebo NDJSON). Data se čtou kurzorem na straně serveru
+    po chunk_size řádcích, v paměti tak nikdy není celý export. Bez kurzorů na straně serveru
+    (DB_POOLER=transaction) načte databázový ovladač celý výsledek najednou.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    columns, rows = EXPORTS[kind](beekeeper)
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield writer.writerow([_plain(value) for value in row])
+    elif fmt == 'ndjson':
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Nepodporovaný formát exportu: {fmt}')
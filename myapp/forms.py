@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from django.core.validators import MinValueValidator
+from django.forms.utils import ErrorDict
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db.models import Q
 from django.utils import timezone
 from datetime import date
@@ -47,10 +48,72 @@ class AddHive(forms.ModelForm):
     type = forms.CharField(label='Typ úlové sestavy:')
     comment = forms.CharField(label='Komentář:', required=False)
 
+    # Hromadné založení: počet včelstev, volitelně s matkami a první prohlídkou
+    count = forms.IntegerField(
+        label='Počet včelstev:',
+        validators=[MinValueValidator(1), MaxValueValidator(200)],
+        initial=1,
+        required=False
+    )
+    mother_mark_prefix = forms.CharField(
+        label='Předpona značek matek (značka = předpona + číslo včelstva):',
+        required=False
+    )
+    mother_year = forms.IntegerField(label='Rok matek:', required=False)
+    mother_female_line = forms.CharField(label='Linie matek:', required=False)
+    mother_male_line = forms.CharField(label='Trubčí linie matek:', initial='volně pářená', required=False)
+    visit_date = forms.DateField(
+        label='Datum první prohlídky:',
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        required=False
+    )
+    visit_hive_body_size = forms.IntegerField(
+        label='Velikost plodiště:',
+        validators=[MinValueValidator(0)],
+        required=False
+    )
+    visit_honey_supers_size = forms.IntegerField(
+        label='Velikost medníku:',
+        validators=[MinValueValidator(0)],
+        required=False
+    )
+
     class Meta:
         model = Hives
         fields = ['type', 'comment']
 
+    def clean(self):
+        cleaned_data = super().clean()
+
+        if cleaned_data.get('mother_mark_prefix') and cleaned_data.get('mother_year') is None:
+            self.add_error('mother_year', 'Pro založení matek je nutné vyplnit rok.')
+
+        if cleaned_data.get('visit_date'):
+            for field in ('visit_hive_body_size', 'visit_honey_supers_size'):
+                if cleaned_data.get(field) is None:
+                    self.add_error(field, 'Pro zápis první prohlídky je nutné vyplnit velikost.')
+
+        return cleaned_data
+
+    def mother_data(self):
+        if not self.cleaned_data.get('mother_mark_prefix'):
+            return None
+        return {
+            'mark_prefix': self.cleaned_data['mother_mark_prefix'],
+            'year': self.cleaned_data['mother_year'],
+            'female_line': self.cleaned_data.get('mother_female_line') or '',
+            'male_line': self.cleaned_data.get('mother_male_line') or '',
+        }
+
+    def visit_data(self):
+        if not self.cleaned_data.get('visit_date'):
+            return None
+        return {
+            'date': self.cleaned_data['visit_date'],
+            'hive_body_size': self.cleaned_data['visit_hive_body_size'],
+            'honey_supers_size': self.cleaned_data['visit_honey_supers_size'],
+        }
+
 
 class AddMother(forms.ModelForm):
     class Meta:
@@ -72,6 +135,15 @@ class AddMother(forms.ModelForm):
         self.fields['ancestor'].queryset = mothers_queryset
         self.fields['ancestor'].label_from_instance = lambda obj: obj.display_name()
 
+    def clean_ancestor(self):
+        ancestor = self.cleaned_data.get('ancestor')
+
+        # Kontrola, zda by změna předka nevytvořila v rodokmenu cyklus
+        if ancestor and self.instance.pk and f'/{self.instance.pk}/' in f'{ancestor.lineage_path}/{ancestor.pk}/':
+            raise forms.ValidationError("Předkem matky nemůže být ona sama ani její potomek.")
+
+        return ancestor
+
 
 class AddVisit(forms.ModelForm):
 
@@ -143,6 +215,51 @@ class AddVisit(forms.ModelForm):
                   'disease', 'mite_drop', 'performed_tasks']
 
 
+class BulkVisitHeader(forms.Form):
+    # Společné údaje hromadné prohlídky stanoviště
+    date = AddVisit.base_fields['date']
+    inspection_type = AddVisit.base_fields['inspection_type']
+
+
+class BulkVisitRow(AddVisit):
+    # Řádek hromadné prohlídky jednoho včelstva, datum a typ prohlídky jsou v BulkVisitHeader
+    date = None
+    inspection_type = None
+
+    hive = forms.IntegerField(widget=forms.HiddenInput())
+    include = forms.BooleanField(label='Zapsat:', initial=True, required=False)
+
+    class Meta(AddVisit.Meta):
+        fields = ['condition', 'hive_body_size', 'honey_supers_size', 'honey_yield',
+                  'medication_application', 'disease', 'mite_drop', 'comment']
+
+    def __init__(self, *args, task_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Úkony se načtou jednou pro celý formset místo dotazu v každém řádku
+        self.fields['performed_tasks'] = forms.TypedMultipleChoiceField(
+            choices=task_choices,
+            coerce=int,
+            widget=forms.CheckboxSelectMultiple,
+            required=False,
+            label='Provedené úkony:'
+        )
+
+    def clean_performed_tasks(self):
+        # Úkony se ukládají hromadně do spojovací tabulky, opakované id by porušilo její unikátnost
+        return list(dict.fromkeys(self.cleaned_data['performed_tasks']))
+
+    def full_clean(self):
+        # Nevybraná včelstva se nevalidují ani neukládají
+        if self.is_bound and not self['include'].value():
+            self._errors = ErrorDict()
+            self.cleaned_data = {'include': False}
+            return
+        super().full_clean()
+
+
+BulkVisitFormSet = forms.formset_factory(BulkVisitRow, extra=0)
+
+
 class EditVisit(forms.ModelForm):
 
     CONDITION_CHOICES = [
@@ -278,7 +395,7 @@ class ChangeMotherHive(forms.Form):
             queryset=Hives.objects.filter(
                 Q(mothers__isnull=True) | Q(mothers__active=False),
                 place__beekeeper=user,
-                active=True),
+                active=True).select_related('place'),
             label='Vyberte nové včelstvo:',
             widget=CustomHiveWidget()
         )
@@ -289,5 +406,12 @@ class ChangeMotherHive(forms.Form):
         return f"{obj.place} - č. {obj}"
 
 
+class ImportVisits(forms.Form):
+    FORMAT_CHOICES = [
+        ('', 'podle přípony souboru'),
+        ('csv', 'CSV'),
+        ('json', 'JSON / JSON Lines'),
+    ]
 
-
+    file = forms.FileField(label='Soubor s prohlídkami:')
+    format = forms.ChoiceField(label='Formát:', choices=FORMAT_CHOICES, required=False)
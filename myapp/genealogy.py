@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field
+from django.conf import settings
+from myapp.models import Mothers
+
+
+@dataclass
+class Lineage:
+    ancestors: list = field(default_factory=list)
+    descendants: list = field(default_factory=list)
+    sisters: list = field(default_factory=list)
+    collaterals: list = field(default_factory=list)
+
+
+def _path_ids(path):
+    return [int(mother_id) for mother_id in path.strip('/').split('/')]
+
+
+def lineage(mother, max_depth=None):
+    """
+    Vrátí předky, potomky, sestry a ostatní příbuzné matky (Lineage) jedním dotazem přes
+    materializované cesty rodokmenu (Mothers.lineage_path):
+     - ancestors: přímá linie předků (generation = počet generací nahoru),
+     - descendants: celý strom potomků (generation = počet generací dolů),
+     - collaterals: potomci předků mimo přímou linii (degree = vzdálenost společného předka,
+       generation = počet generací pod ním; sestry mají degree 1 a generation 1).
+    Všichni příbuzní do hloubky max_depth leží v podstromu nejvyššího předka v dosahu,
+    ten se načte podle předpony cesty (indexovaný dotaz LIKE 'předpona%').
+    """
+    if max_depth is None:
+        max_depth = settings.GENEALOGY_MAX_DEPTH
+    line = _path_ids(mother.lineage_path or f'/{mother.pk}/')
+    depth = len(line) - 1
+    top_path = '/' + '/'.join(str(mother_id) for mother_id in line[:max(0, depth - max_depth) + 1]) + '/'
+
+    relatives = []
+    for relative in Mothers.objects.filter(lineage_path__startswith=top_path).exclude(pk=mother.pk):
+        path = _path_ids(relative.lineage_path)
+        common = 0
+        while common < min(len(path), len(line)) and path[common] == line[common]:
+            common += 1
+        relative.degree = None
+        if common == len(path):
+            relative.relation, relative.generation = 'ancestor', depth - common + 1
+        elif common == len(line):
+            relative.relation, relative.generation = 'descendant', len(path) - common
+            if relative.generation > max_depth:
+                continue
+        else:
+            relative.relation, relative.generation = 'collateral', len(path) - common
+            relative.degree = len(line) - common
+            if relative.generation > 1 and relative.degree + relative.generation > max_depth:
+                continue
+        relatives.append(relative)
+    relatives.sort(key=lambda relative: (relative.degree is not None, relative.degree or 0, relative.generation,
+                                         relative.year, relative.pk))
+
+    result = Lineage()
+    for relative in relatives:
+        if relative.relation == 'ancestor':
+            result.ancestors.append(relative)
+        elif relative.relation == 'descendant':
+            result.descendants.append(relative)
+        elif relative.degree == 1 and relative.generation == 1:
+            result.sisters.append(relative)
+        else:
+            result.collaterals.append(relative)
+    return result
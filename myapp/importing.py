@@ -0,0 +1,244 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from django import forms
+from django.conf import settings
+from django.db import transaction
+from myapp.forms import AddVisit
+from myapp.models import Hives, Tasks, Visits, refresh_hive_summaries
+
+IMPORT_COLUMNS = ['place', 'hive', 'date', 'inspection_type', 'condition', 'hive_body_size', 'honey_supers_size',
+                  'honey_yield', 'medication_application', 'disease', 'mite_drop', 'comment', 'tasks']
+TASKS_SEPARATOR = ';'
+JSON_SEPARATORS = ' \t\r\n,[]'
+
+
+class ImportVisitRow(AddVisit):
+    # Pravidla AddVisit, úkony se ale ověřují proti seznamu načtenému jednou pro celý import
+    class Meta(AddVisit.Meta):
+        fields = AddVisit.Meta.fields + ['comment']
+
+    def __init__(self, *args, task_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['performed_tasks'] = forms.TypedMultipleChoiceField(choices=task_choices, coerce=int,
+                                                                        required=False)
+
+    def clean_performed_tasks(self):
+        # Opakovaný úkon by v hromadném zápisu porušil unikátnost spojovací tabulky
+        return list(dict.fromkeys(self.cleaned_data['performed_tasks']))
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message, max_errors):
+        self.failed += 1
+        # Uchovává se jen omezený počet chyb, aby paměť nerostla s velikostí souboru
+        if len(self.errors) < max_errors:
+            self.errors.append((line, message))
+
+
+@dataclass
+class InvalidRecord:
+    # Záznam, který nejde přečíst, import ho nahlásí jako chybný řádek
+    message: str
+
+
+def iter_csv(stream):
+    """
+    Vrací dvojice (řádek, záznam). Soubor, který modul csv nepřečte (např. příliš dlouhé pole),
+    se nahlásí jako InvalidRecord na daném řádku a čtení končí, další řádek spolehlivě najít nelze.
+    """
+    reader = csv.DictReader(stream)
+    line = 2
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            yield line, InvalidRecord(f'Neplatné CSV: {error}. Zbytek souboru se nenačetl.')
+            return
+        yield line, record
+        line += 1
+
+
+def iter_json(stream, chunk_size=64 * 1024, max_record_size=None):
+    """
+    Postupně čte JSON pole objektů nebo JSON Lines (objekt na řádek), v paměti je vždy jen
+    rozpracovaný kus souboru. Vrací dvojice (pořadí záznamu, záznam). Neplatný řádek JSON Lines
+    se vrátí jako InvalidRecord a čte se dál, v poli další záznam spolehlivě najít nelze a čtení končí.
+    """
+    max_record_size = max_record_size or settings.IMPORT_MAX_RECORD_SIZE
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    index = 0
+    eof = False
+    array = None
+    while True:
+        # Přeskočení oddělovačů mezi záznamy
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            if array is None and buffer[position] == '[':
+                array = True
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer = stream.read(chunk_size)
+            position = 0
+            eof = not buffer
+            continue
+        if array is None:
+            array = False
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            # Řádek JSON Lines je celý, pokud za ním následuje konec řádku
+            newline = -1 if array else buffer.find('\n', position)
+            if newline < 0 and not eof and len(buffer) - position <= max_record_size:
+                chunk = stream.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            index += 1
+            if newline < 0 and not eof:
+                message = f'Záznam je delší než {max_record_size} znaků.'
+            else:
+                message = f'Neplatný JSON: {error.msg}.'
+            if array:
+                yield index, InvalidRecord(f'{message} Zbytek souboru se nenačetl.')
+                return
+            yield index, InvalidRecord(message)
+            # Zbytek chybného řádku se přeskočí, příliš dlouhý řádek se zahazuje po kusech
+            while newline < 0 and not eof:
+                buffer = stream.read(chunk_size)
+                eof = not buffer
+                newline = buffer.find('\n')
+            position = len(buffer) if newline < 0 else newline + 1
+            continue
+        index += 1
+        yield index, record
+        position = end
+
+
+def iter_records(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt == 'json':
+        return iter_json(stream)
+    raise ValueError(f'Nepodporovaný formát importu: {fmt}')
+
+
+def detect_format(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'json'
+
+
+def text_stream(binary_file):
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+def _hive_number(value):
+    # Jen celé číslo nebo řetězec číslic, 1.7 ani true se na číslo včelstva nezkracují
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def _flush(batch, touched_hive_ids, touched_seasons):
+    if not batch:
+        return
+    with transaction.atomic():
+        new_visits = Visits.objects.bulk_create([visit for visit, task_ids in batch])
+        PerformedTasks = Visits.performed_tasks.through
+        PerformedTasks.objects.bulk_create([
+            PerformedTasks(visits_id=visit.id, tasks_id=task_id)
+            for visit, (_, task_ids) in zip(new_visits, batch)
+            for task_id in task_ids
+        ])
+    touched_hive_ids.update(visit.hive_id for visit in new_visits)
+    touched_seasons.update(visit.date.year for visit in new_visits)
+    batch.clear()
+
+
+def import_visits(beekeeper, records, batch_size=None, max_errors=None):
+    """
+    Importuje prohlídky včelaře ze záznamů (pořadí, slovník). Včelstva se dohledávají podle
+    (název stanoviště, číslo včelstva), chybné řádky se přeskočí a nahlásí v ImportResult.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    max_errors = max_errors or settings.IMPORT_MAX_ERRORS
+    result = ImportResult()
+
+    # Vyhledávací tabulky se sestaví jednou pro celý import
+    hives = {
+        (place_name, number): hive_id
+        for hive_id, place_name, number in Hives.objects
+        .filter(place__beekeeper=beekeeper, place__active=True, active=True)
+        .values_list('id', 'place__name', 'number')
+    }
+    tasks = {name: task_id for task_id, name in Tasks.objects.values_list('id', 'name')}
+    task_choices = [(task_id, name) for name, task_id in tasks.items()]
+
+    batch = []
+    touched_hive_ids = set()
+    touched_seasons = set()
+    try:
+        for line, record in records:
+            if isinstance(record, InvalidRecord):
+                result.add_error(line, record.message, max_errors)
+                continue
+            if not isinstance(record, dict):
+                result.add_error(line, 'Záznam není objekt.', max_errors)
+                continue
+            record = {key: '' if value is None else value for key, value in record.items()}
+
+            number = _hive_number(record.get('hive'))
+            if number is None:
+                result.add_error(line, f"Neplatné číslo včelstva: {record.get('hive')!r}.", max_errors)
+                continue
+            hive_id = hives.get((str(record.get('place', '')).strip(), number))
+            if hive_id is None:
+                result.add_error(
+                    line, f"Včelstvo {record.get('hive')} na stanovišti {record.get('place')} neexistuje.", max_errors
+                )
+                continue
+
+            task_names = record.get('tasks') or []
+            if isinstance(task_names, str):
+                task_names = [name.strip() for name in task_names.split(TASKS_SEPARATOR) if name.strip()]
+            unknown_tasks = [name for name in task_names if name not in tasks]
+            if unknown_tasks:
+                result.add_error(line, f'Neznámé úkony: {", ".join(unknown_tasks)}.', max_errors)
+                continue
+
+            form = ImportVisitRow(
+                data=dict(record, performed_tasks=[tasks[name] for name in task_names]),
+                task_choices=task_choices
+            )
+            if not form.is_valid():
+                message = '; '.join(f'{name}: {" ".join(errors)}' for name, errors in form.errors.items())
+                result.add_error(line, message, max_errors)
+                continue
+
+            visit = form.save(commit=False)
+            visit.hive_id = hive_id
+            batch.append((visit, form.cleaned_data['performed_tasks']))
+            result.created += 1
+            if len(batch) >= batch_size:
+                _flush(batch, touched_hive_ids, touched_seasons)
+
+        _flush(batch, touched_hive_ids, touched_seasons)
+    finally:
+        # Uložené dávky zůstávají i při chybě čtení souboru, jejich souhrny se proto přepočítají vždy
+        touched_hive_ids = sorted(touched_hive_ids)
+        for start in range(0, len(touched_hive_ids), batch_size):
+            refresh_hive_summaries(touched_hive_ids[start:start + batch_size], touched_seasons)
+    return result
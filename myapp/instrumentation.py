@@ -0,0 +1,162 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.functional import empty
+
+logger = logging.getLogger('myapp.requests')
+
+# Měření právě zpracovávaného požadavku (None mimo požadavek, např. v příkazech)
+current_stats = ContextVar('request_stats', default=None)
+
+
+@dataclass
+class RequestStats:
+    started: float = field(default_factory=time.perf_counter)
+    view_started: Optional[float] = None
+    view_time: float = 0
+    template_time: float = 0
+    total_time: float = 0
+    query_count: int = 0
+    db_time: float = 0
+    # Počty provedení podle SQL a podle (SQL, otisk parametrů), parametry samotné se neuchovávají
+    sql_counts: Counter = field(default_factory=Counter)
+    query_counts: Counter = field(default_factory=Counter)
+    # Prvních max_queries dotazů (SQL, parametry, doba v sekundách) pro log pomalého požadavku,
+    # paměť tak neroste s počtem dotazů (import vkládá dávky s tisíci parametry)
+    queries: list = field(default_factory=list)
+    max_queries: int = field(default_factory=lambda: settings.SLOW_REQUEST_MAX_QUERIES)
+
+    def record(self, sql, params, duration):
+        self.query_count += 1
+        self.db_time += duration
+        self.sql_counts[sql] += 1
+        self.query_counts[sql, hash(repr(params))] += 1
+        if len(self.queries) < self.max_queries:
+            self.queries.append((sql, params, duration))
+
+    def duplicate_queries(self):
+        # Počet opakování stejného dotazu se stejnými parametry
+        return sum(count - 1 for count in self.query_counts.values())
+
+    def similar_queries(self):
+        # Stejné SQL s různými parametry (typicky N+1 dotazy v cyklu) -> počet provedení
+        return {sql: count for sql, count in self.sql_counts.items() if count > 1}
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def _record_query(stats):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.record(sql, params, time.perf_counter() - started)
+    return wrapper
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Měří každý požadavek: dotazy do databáze (počet, čas, opakované dotazy), dobu view
+    a vykreslování šablon. Výsledek posílá v hlavičce Server-Timing a jako řádek logu v JSON;
+    u požadavků nad SLOW_REQUEST_THRESHOLD_MS loguje i seznam dotazů (nejvýše SLOW_REQUEST_MAX_QUERIES).
+    Obsah streamovaných odpovědí se generuje až po průchodu middlewarem a do měření nespadá.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_record_query(stats)))
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        finished = time.perf_counter()
+        stats.total_time = finished - stats.started
+        if stats.view_started is not None:
+            stats.view_time = finished - stats.view_started
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = stats.server_timing()
+        self.log(request, response, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
+
+    @staticmethod
+    def user_id(request):
+        # Uživatel se loguje jen pokud ho požadavek už načetl, měření nesmí přidávat dotazy
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return None
+        return user.pk
+
+    def log(self, request, response, stats):
+        similar = stats.similar_queries()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user': self.user_id(request),
+            'total_ms': round(stats.total_time * 1000, 1),
+            'view_ms': round(stats.view_time * 1000, 1),
+            'template_ms': round(stats.template_time * 1000, 1),
+            'db_ms': round(stats.db_time * 1000, 1),
+            'queries': stats.query_count,
+            'duplicate_queries': stats.duplicate_queries(),
+            'similar_queries': sum(similar.values()) - len(similar),
+        }
+        if stats.total_time * 1000 < settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.info(json.dumps(record))
+            return
+
+        record['slow'] = True
+        record['query_list'] = [
+            {'sql': sql, 'params': params, 'ms': round(duration * 1000, 2)}
+            for sql, params, duration in stats.queries
+        ]
+        if stats.query_count > len(stats.queries):
+            record['query_list_omitted'] = stats.query_count - len(stats.queries)
+        logger.warning(json.dumps(record, default=str, ensure_ascii=False))
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = current_stats.get()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # Šablonový backend Djanga, který započítává dobu vykreslení do měření požadavku
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
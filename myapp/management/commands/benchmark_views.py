@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp import benchmark
+from myapp.models import Beekeepers
+
+
+class Command(BaseCommand):
+    help = 'Změří latenci (p50/p95/p99), propustnost a počty dotazů stránek včelaře.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--beekeeper', required=True, help='Uživatelské jméno včelaře.')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help='Měřit jen vybrané stránky.')
+        parser.add_argument('--host', default='localhost', help='Hodnota Host, musí projít ALLOWED_HOSTS.')
+        parser.add_argument('--transport', choices=sorted(benchmark.TRANSPORTS), default='client',
+                            help='wsgi prochází celou WSGI aplikací včetně správy spojení s databází.')
+        parser.add_argument('--compare-conn-max-age', type=int, nargs='+', metavar='SECONDS',
+                            help='Porovná zadané hodnoty CONN_MAX_AGE (měří se přes WSGI), např. 0 60.')
+
+    def handle(self, *args, **options):
+        try:
+            beekeeper = Beekeepers.objects.get(username=options['beekeeper'])
+        except Beekeepers.DoesNotExist:
+            raise CommandError(f"Včelař {options['beekeeper']} neexistuje.")
+
+        kwargs = {'iterations': options['iterations'], 'warmup': options['warmup'], 'names': options['endpoints'],
+                  'host': options['host']}
+        if options['compare_conn_max_age']:
+            for value, results in benchmark.compare_conn_max_age(beekeeper, options['compare_conn_max_age'],
+                                                                 **kwargs).items():
+                self.stdout.write(f'CONN_MAX_AGE={value}')
+                self.write_results(results)
+        else:
+            self.write_results(benchmark.run(beekeeper, transport=options['transport'], **kwargs))
+
+    def write_results(self, results):
+        self.stdout.write(
+            f"{'stránka':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'dotazy':>7} {'chyby':>6}"
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result.name:<16} {result.p50:8.1f} {result.p95:8.1f} {result.p99:8.1f} '
+                f'{result.throughput:8.1f} {result.max_queries:7d} {result.errors:6d}'
+            )
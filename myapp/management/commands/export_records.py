@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.exporting import EXPORTS, EXPORT_FORMATS, stream_export
+from myapp.models import Beekeepers
+
+
+class Command(BaseCommand):
+    help = 'Exportuje prohlídky, včelstva nebo matky včelaře do CSV nebo NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--beekeeper', required=True, help='Uživatelské jméno včelaře.')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='Cílový soubor, výchozí je standardní výstup.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            beekeeper = Beekeepers.objects.get(username=options['beekeeper'])
+        except Beekeepers.DoesNotExist:
+            raise CommandError(f"Včelař {options['beekeeper']} neexistuje.")
+
+        lines = stream_export(options['kind'], beekeeper, options['format'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
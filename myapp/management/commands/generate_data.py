@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from myapp.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = 'Vygeneruje reprodukovatelná syntetická data (včelaři, stanoviště, včelstva, matky, prohlídky).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--beekeepers', type=int, default=1)
+        parser.add_argument('--places', type=int, default=3, help='Počet stanovišť na včelaře.')
+        parser.add_argument('--hives', type=int, default=10, help='Počet včelstev na stanovišti.')
+        parser.add_argument('--seasons', type=int, default=3)
+        parser.add_argument('--last-season', type=int, help='Výchozí je předchozí rok.')
+        parser.add_argument('--password', default='bee')
+        parser.add_argument('--prefix', default='synth', help='Předpona uživatelských jmen a značek matek.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        result = generate(
+            seed=options['seed'],
+            beekeepers=options['beekeepers'],
+            places=options['places'],
+            hives=options['hives'],
+            seasons=options['seasons'],
+            last_season=options['last_season'],
+            password=options['password'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Vytvořeno včelařů: {result.beekeepers}, stanovišť: {result.places}, včelstev: {result.hives}, '
+            f'matek: {result.mothers}, prohlídek: {result.visits}, úkonů: {result.performed_tasks}.'
+        ))
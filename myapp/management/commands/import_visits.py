@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.caching import invalidate_overview
+from myapp.importing import detect_format, import_visits, iter_records
+from myapp.models import Beekeepers
+
+
+class Command(BaseCommand):
+    help = 'Importuje historické prohlídky včelaře ze souboru CSV nebo JSON (pole i JSON Lines).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--beekeeper', required=True, help='Uživatelské jméno včelaře.')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Výchozí je podle přípony souboru.')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            beekeeper = Beekeepers.objects.get(username=options['beekeeper'])
+        except Beekeepers.DoesNotExist:
+            raise CommandError(f"Včelař {options['beekeeper']} neexistuje.")
+
+        fmt = options['format'] or detect_format(options['path'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            try:
+                result = import_visits(beekeeper, iter_records(stream, fmt), batch_size=options['batch_size'])
+            except ValueError as error:
+                raise CommandError(f'Soubor se nepodařilo načíst: {error}')
+        invalidate_overview(beekeeper.pk)
+
+        for line, message in result.errors:
+            self.stderr.write(f'{line}: {message}')
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... a dalších {result.failed - len(result.errors)} chyb.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Importováno {result.created} prohlídek, chybných záznamů: {result.failed}.'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from myapp.caching import overview_cache_stats, reset_overview_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Vypíše počty zásahů a výpadků cache přehledu stanovišť.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Po vypsání počitadla vynuluje.')
+
+    def handle(self, *args, **options):
+        stats = overview_cache_stats()
+        hit_ratio = '-' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.1%}"
+        self.stdout.write(f"hits: {stats['hits']}, misses: {stats['misses']}, hit ratio: {hit_ratio}")
+        if options['reset']:
+            reset_overview_cache_stats()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from myapp.models import Mothers
+
+
+class Command(BaseCommand):
+    help = 'Přepočítá materializované cesty rodokmenu (Mothers.lineage_path) ze vztahů na předky.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = Mothers.objects.rebuild_lineage_paths()
+        self.stdout.write(self.style.SUCCESS(f'Přepočítáno {count} cest rodokmenu matek.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from myapp.caching import invalidate_overview
+from myapp.models import HiveSeasonRollup, HivesPlaces
+
+
+class Command(BaseCommand):
+    help = 'Přepočítá sezónní souhrny včelstev a stanovišť z historie prohlídek.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = HiveSeasonRollup.objects.rebuild(batch_size=options['batch_size'])
+            for beekeeper_id in HivesPlaces.objects.values_list('beekeeper_id', flat=True).distinct():
+                invalidate_overview(beekeeper_id)
+        self.stdout.write(self.style.SUCCESS(f'Přepočítáno {count} sezónních souhrnů včelstev.'))
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Poslední vyplněná hodnota se hledá zvlášť pro každé sledované pole (u textových se prázdný text nepočítá)
+OBSERVATION_FIELDS = {
+    'honey_yield': 'o.honey_yield IS NOT NULL',
+    'mite_drop': 'o.mite_drop IS NOT NULL',
+    'medication_application': "COALESCE(o.medication_application, '') <> ''",
+    'disease': "COALESCE(o.disease, '') <> ''",
+    'comment': "COALESCE(o.comment, '') <> ''",
+}
+
+# Souhrny existujících včelstev, jinak by po nasazení až do rebuild_hive_status žádné neměla
+FILL_HIVE_STATUS_SQL = '''
+    WITH latest AS (
+        SELECT DISTINCT ON (hive_id) hive_id, date, hive_body_size, honey_supers_size, condition
+        FROM myapp_visits
+        WHERE active AND hive_id IS NOT NULL
+        ORDER BY hive_id, date DESC, id DESC
+    )
+    INSERT INTO myapp_hivestatus (hive_id, last_visit_date, hive_body_size, honey_supers_size, condition, {columns})
+    SELECT l.hive_id, l.date, l.hive_body_size, l.honey_supers_size, l.condition, {values}
+    FROM latest l
+    {joins}
+'''.format(
+    columns=', '.join(f'{field}, {field}_date' for field in OBSERVATION_FIELDS),
+    values=', '.join(f'{field}.value, {field}.date' for field in OBSERVATION_FIELDS),
+    joins='\n'.join(f'''
+    LEFT JOIN LATERAL (
+        SELECT o.{field} AS value, o.date
+        FROM myapp_visits o
+        WHERE o.hive_id = l.hive_id AND o.active AND {condition}
+        ORDER BY o.date DESC, o.id DESC
+        LIMIT 1
+    ) {field} ON true''' for field, condition in OBSERVATION_FIELDS.items()),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_alter_beekeepers_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HiveStatus',
+            fields=[
+                ('hive', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status', serialize=False, to='myapp.hives')),
+                ('last_visit_date', models.DateField()),
+                ('hive_body_size', models.IntegerField()),
+                ('honey_supers_size', models.IntegerField()),
+                ('condition', models.IntegerField(blank=True, null=True)),
+                ('honey_yield', models.FloatField(blank=True, null=True)),
+                ('honey_yield_date', models.DateField(blank=True, null=True)),
+                ('mite_drop', models.IntegerField(blank=True, null=True)),
+                ('mite_drop_date', models.DateField(blank=True, null=True)),
+                ('medication_application', models.CharField(blank=True, max_length=255, null=True)),
+                ('medication_application_date', models.DateField(blank=True, null=True)),
+                ('disease', models.CharField(blank=True, max_length=255, null=True)),
+                ('disease_date', models.DateField(blank=True, null=True)),
+                ('comment', models.CharField(blank=True, max_length=255, null=True)),
+                ('comment_date', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunSQL(sql=FILL_HIVE_STATUS_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_hivestatus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mothers',
+            name='lineage_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.RunSQL(
+            sql='''
+                WITH RECURSIVE tree(id, path) AS (
+                        SELECT id, '/' || id || '/'
+                        FROM myapp_mothers
+                        WHERE ancestor_id IS NULL
+                    UNION ALL
+                        SELECT m.id, t.path || m.id || '/'
+                        FROM myapp_mothers m
+                        JOIN tree t ON m.ancestor_id = t.id
+                )
+                UPDATE myapp_mothers
+                SET lineage_path = COALESCE(
+                    (SELECT path FROM tree WHERE tree.id = myapp_mothers.id),
+                    '/' || myapp_mothers.id || '/'
+                )
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_mothers_lineage_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceSeasonRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.IntegerField()),
+                ('visits_count', models.IntegerField(default=0)),
+                ('honey_yield_sum', models.FloatField(default=0)),
+                ('honey_yield_count', models.IntegerField(default=0)),
+                ('condition_sum', models.IntegerField(default=0)),
+                ('condition_count', models.IntegerField(default=0)),
+                ('mite_drop_sum', models.IntegerField(default=0)),
+                ('mite_drop_count', models.IntegerField(default=0)),
+                ('place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_rollups', to='myapp.hivesplaces')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HiveSeasonRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.IntegerField()),
+                ('visits_count', models.IntegerField(default=0)),
+                ('honey_yield_sum', models.FloatField(default=0)),
+                ('honey_yield_count', models.IntegerField(default=0)),
+                ('condition_sum', models.IntegerField(default=0)),
+                ('condition_count', models.IntegerField(default=0)),
+                ('mite_drop_sum', models.IntegerField(default=0)),
+                ('mite_drop_count', models.IntegerField(default=0)),
+                ('hive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_rollups', to='myapp.hives')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='placeseasonrollup',
+            constraint=models.UniqueConstraint(fields=('place', 'season'), name='unique_place_season_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='hiveseasonrollup',
+            constraint=models.UniqueConstraint(fields=('hive', 'season'), name='unique_hive_season_rollup'),
+        ),
+        migrations.RunSQL(
+            sql='''
+                INSERT INTO myapp_hiveseasonrollup (hive_id, season, visits_count, honey_yield_sum,
+                    honey_yield_count, condition_sum, condition_count, mite_drop_sum, mite_drop_count)
+                SELECT hive_id, EXTRACT(YEAR FROM date)::integer, COUNT(*), COALESCE(SUM(honey_yield), 0),
+                    COUNT(honey_yield), COALESCE(SUM(condition), 0), COUNT(condition),
+                    COALESCE(SUM(mite_drop), 0), COUNT(mite_drop)
+                FROM myapp_visits
+                WHERE active AND hive_id IS NOT NULL
+                GROUP BY 1, 2;
+
+                INSERT INTO myapp_placeseasonrollup (place_id, season, visits_count, honey_yield_sum,
+                    honey_yield_count, condition_sum, condition_count, mite_drop_sum, mite_drop_count)
+                SELECT h.place_id, r.season, SUM(r.visits_count), SUM(r.honey_yield_sum), SUM(r.honey_yield_count),
+                    SUM(r.condition_sum), SUM(r.condition_count), SUM(r.mite_drop_sum), SUM(r.mite_drop_count)
+                FROM myapp_hiveseasonrollup r
+                JOIN myapp_hives h ON h.id = r.hive_id
+                GROUP BY 1, 2;
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_season_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mothers',
+            index=models.Index(condition=models.Q(('active', True)), fields=['hive', '-id'], name='mothers_hive_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visits',
+            index=models.Index(condition=models.Q(('active', True)), fields=['hive', '-date', '-id'], name='visits_hive_active_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visits',
+            index=models.Index(condition=models.Q(('active', True), ('mite_drop__isnull', False)), fields=['hive', '-date', '-id'], name='visits_hive_mite_drop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visits',
+            index=models.Index(condition=models.Q(('active', True), ('honey_yield__isnull', False)), fields=['hive', '-date', '-id'], name='visits_hive_honey_yield_idx'),
+        ),
+    ]
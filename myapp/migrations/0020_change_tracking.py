@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Tabulka -> (zdroj API, dotaz nad změněnými řádky vracející id záznamu a id včelaře)
+TRACKED_TABLES = {
+    'myapp_hivesplaces': ('places', 'SELECT r.id, r.beekeeper_id FROM changed_rows r'),
+    'myapp_hives': ('hives', """
+        SELECT r.id, p.beekeeper_id
+        FROM changed_rows r
+        LEFT JOIN myapp_hivesplaces p ON p.id = r.place_id"""),
+    'myapp_mothers': ('mothers', """
+        SELECT r.id, p.beekeeper_id
+        FROM changed_rows r
+        LEFT JOIN myapp_hives h ON h.id = r.hive_id
+        LEFT JOIN myapp_hivesplaces p ON p.id = h.place_id"""),
+    'myapp_visits': ('visits', """
+        SELECT r.id, p.beekeeper_id
+        FROM changed_rows r
+        LEFT JOIN myapp_hives h ON h.id = r.hive_id
+        LEFT JOIN myapp_hivesplaces p ON p.id = h.place_id"""),
+    # Změna provedených úkonů je změnou prohlídky
+    'myapp_visits_performed_tasks': ('visits', """
+        SELECT DISTINCT r.visits_id, p.beekeeper_id
+        FROM changed_rows r
+        LEFT JOIN myapp_visits v ON v.id = r.visits_id
+        LEFT JOIN myapp_hives h ON h.id = v.hive_id
+        LEFT JOIN myapp_hivesplaces p ON p.id = h.place_id"""),
+    'myapp_tasks': ('tasks', 'SELECT r.id, NULL::integer FROM changed_rows r'),
+}
+
+# Triggery nad celým příkazem (s tabulkou změněných řádků), hromadné zápisy tak vedou na jeden INSERT.
+# Beekeeper se při mazání nemusí dohledat (rodič už je smazaný), zůstává proto původní.
+TRACKING_FUNCTION_SQL = """
+CREATE FUNCTION {table}_track_changes() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO myapp_change (resource, object_id, beekeeper_id, xid)
+    SELECT '{resource}', changed.object_id, changed.beekeeper_id, pg_current_xact_id()::text::bigint
+    FROM ({rows}) changed(object_id, beekeeper_id)
+    ON CONFLICT (resource, object_id) DO UPDATE
+    SET beekeeper_id = COALESCE(EXCLUDED.beekeeper_id, myapp_change.beekeeper_id),
+        xid = EXCLUDED.xid;
+    RETURN NULL;
+END
+$$;
+"""
+TRACKING_TRIGGER_SQL = """
+CREATE TRIGGER {table}_track_{event} AFTER {event} ON {table}
+REFERENCING {transition} TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION {table}_track_changes();
+"""
+# Výchozí stav: všechny existující záznamy jako změněné v transakci migrace
+BACKFILL_SQL = """
+INSERT INTO myapp_change (resource, object_id, beekeeper_id, xid)
+SELECT '{resource}', changed.object_id, changed.beekeeper_id, pg_current_xact_id()::text::bigint
+FROM ({rows}) changed(object_id, beekeeper_id)
+ON CONFLICT (resource, object_id) DO NOTHING;
+"""
+
+
+def tracking_sql():
+    statements = []
+    for table, (resource, rows) in TRACKED_TABLES.items():
+        statements.append(TRACKING_FUNCTION_SQL.format(table=table, resource=resource, rows=rows))
+        for event, transition in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            statements.append(TRACKING_TRIGGER_SQL.format(table=table, event=event, transition=transition))
+        statements.append(BACKFILL_SQL.format(resource=resource, rows=rows.replace('changed_rows', table)))
+    return '\n'.join(statements)
+
+
+def drop_tracking_sql():
+    return '\n'.join(f'DROP FUNCTION {table}_track_changes() CASCADE;' for table in TRACKED_TABLES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('xid', models.BigIntegerField()),
+                ('beekeeper', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='myapp.beekeepers')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['beekeeper', 'xid', 'id'], name='changes_beekeeper_xid_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('resource', 'object_id'), name='unique_change_resource_object'),
+        ),
+        migrations.RunSQL(sql=tracking_sql(), reverse_sql=drop_tracking_sql()),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When, Window
+from django.db.models.functions import Concat, ExtractYear, FirstValue, RowNumber, Substr
 from django.contrib.auth.models import User
 from django.contrib.auth.models import UserManager
 
@@ -57,29 +59,61 @@ class Hives(models.Model):
         return str(self.number)
 
     def last_honey_yield(self):
-        return self.visits.filter(honey_yield__isnull=False, active=True).order_by('-date').first()
+        return self.visits.latest_observation('honey_yield')
 
     def last_medication_application(self):
-        return (
-            self.visits
-            .filter(medication_application__isnull=False, active=True)
-            .exclude(medication_application='')
-            .order_by('-date')
-            .first()
-        )
+        return self.visits.latest_observation('medication_application')
 
     def last_mite_drop(self):
-        return self.visits.filter(mite_drop__isnull=False, active=True).order_by('-date').first()
+        return self.visits.latest_observation('mite_drop')
 
     def last_disease(self):
-        return self.visits\
-            .filter(disease__isnull=False, active=True) \
-            .exclude(disease='') \
-            .order_by('-date') \
-            .first()
+        return self.visits.latest_observation('disease')
 
     def last_comment(self):
-        return self.visits.filter(comment__isnull=False, active=True).exclude(comment='').order_by('-date').first()
+        return self.visits.latest_observation('comment')
+
+
+# Materializovaná cesta "/<id zakladatelky>/.../<id matky>/" pro všechny matky najednou.
+# Matky v cyklu (nedosažitelné z kořenů) dostanou cestu jen se svým id.
+REBUILD_LINEAGE_PATHS_SQL = '''
+WITH RECURSIVE tree(id, path) AS (
+        SELECT id, '/' || id || '/'
+        FROM {mothers}
+        WHERE ancestor_id IS NULL
+    UNION ALL
+        SELECT m.id, t.path || m.id || '/'
+        FROM {mothers} m
+        JOIN tree t ON m.ancestor_id = t.id
+)
+UPDATE {mothers}
+SET lineage_path = COALESCE((SELECT path FROM tree WHERE tree.id = {mothers}.id), '/' || {mothers}.id || '/')
+'''
+
+
+class MothersQuerySet(models.QuerySet):
+    def current(self):
+        # Aktuální matka včelstva je první aktivní podle id, všechny výpisy a exporty ji určují stejně
+        return self.filter(active=True).order_by('id')
+
+
+class MothersManager(models.Manager.from_queryset(MothersQuerySet)):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create nevolá save(), cesty rodokmenu se proto doplní hromadně
+        # (předci musí být uloženi dříve než vkládaná dávka)
+        with transaction.atomic():
+            objs = super().bulk_create(objs, *args, **kwargs)
+            ancestor_ids = {obj.ancestor_id for obj in objs if obj.ancestor_id}
+            ancestor_paths = dict(self.filter(id__in=ancestor_ids).values_list('id', 'lineage_path'))
+            for obj in objs:
+                obj.lineage_path = f'{ancestor_paths.get(obj.ancestor_id) or "/"}{obj.pk}/'
+            self.bulk_update(objs, ['lineage_path'])
+        return objs
+
+    def rebuild_lineage_paths(self):
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_LINEAGE_PATHS_SQL.format(mothers=self.model._meta.db_table))
+            return cursor.rowcount
 
 
 class Mothers(models.Model):
@@ -91,6 +125,18 @@ class Mothers(models.Model):
     female_line = models.CharField(max_length=255)
     comment = models.TextField()
     active = models.BooleanField(default=True)
+    # Cesta "/<id zakladatelky>/.../<id matky>/" udržovaná v save() a delete() a v hromadném
+    # vkládání MothersManager.bulk_create. QuerySet.update() ani QuerySet.delete() nad předkem
+    # (ancestor) ji nepřepočítají, po takové změně je potřeba spustit rebuild_lineage_paths.
+    lineage_path = models.CharField(max_length=1000, blank=True, default='', db_index=True, editable=False)
+
+    objects = MothersManager()
+
+    class Meta:
+        indexes = [
+            # Aktuální matka včelstva (první aktivní podle id, MothersQuerySet.current)
+            models.Index(fields=['hive', '-id'], condition=models.Q(active=True), name='mothers_hive_active_idx'),
+        ]
 
     def display_name(self):
         if self.female_line:
@@ -100,6 +146,53 @@ class Mothers(models.Model):
     def __str__(self):
         return self.mark
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_lineage_path()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Potomci smazané matky se stávají zakladatelkami svých podstromů
+            if self.lineage_path:
+                self.lineage_descendants().update(
+                    lineage_path=Concat(Value('/'), Substr('lineage_path', len(self.lineage_path) + 1))
+                )
+            return super().delete(*args, **kwargs)
+
+    def update_lineage_path(self):
+        prefix = '/'
+        if self.ancestor_id:
+            prefix = Mothers.objects.filter(pk=self.ancestor_id).values_list('lineage_path', flat=True).first() or '/'
+        if f'/{self.pk}/' in prefix:
+            raise ValueError(f'Matka {self.mark} nemůže být svým vlastním předkem.')
+
+        path = f'{prefix}{self.pk}/'
+        if path == self.lineage_path:
+            return
+        if self.lineage_path:
+            # Přepsání cesty matky i celého jejího podstromu jedním dotazem
+            Mothers.objects.filter(lineage_path__startswith=self.lineage_path).update(
+                lineage_path=Concat(Value(path), Substr('lineage_path', len(self.lineage_path) + 1))
+            )
+        else:
+            Mothers.objects.filter(pk=self.pk).update(lineage_path=path)
+        self.lineage_path = path
+
+    def lineage_ancestor_ids(self):
+        return [int(mother_id) for mother_id in self.lineage_path.strip('/').split('/')[:-1]]
+
+    def lineage_ancestors(self):
+        return Mothers.objects.filter(id__in=self.lineage_ancestor_ids())
+
+    def lineage_descendants(self):
+        if not self.lineage_path:
+            return Mothers.objects.none()
+        return Mothers.objects.filter(lineage_path__startswith=self.lineage_path).exclude(pk=self.pk)
+
+    def female_line_founder_id(self):
+        return int(self.lineage_path.strip('/').split('/')[0]) if self.lineage_path else self.pk
+
 
 class Tasks(models.Model):
     name = models.CharField(max_length=255)
@@ -108,6 +201,79 @@ class Tasks(models.Model):
         return self.name
 
 
+class VisitsQuerySet(models.QuerySet):
+    # Pole prohlídek, u kterých se zobrazuje poslední vyplněná hodnota
+    OBSERVATION_FIELDS = ('honey_yield', 'mite_drop', 'medication_application', 'disease', 'comment')
+    TEXT_OBSERVATION_FIELDS = ('medication_application', 'disease', 'comment')
+
+    @classmethod
+    def observed(cls, field):
+        condition = Q(**{f'{field}__isnull': False})
+        if field in cls.TEXT_OBSERVATION_FIELDS:
+            condition &= ~Q(**{field: ''})
+        return condition
+
+    def older_than(self, cursor):
+        # Keyset stránkování podle (date, id) od nejnovějších prohlídek
+        if cursor is None:
+            return self.order_by('-date', '-id')
+        cursor_date, cursor_id = cursor
+        return (
+            self
+            .filter(Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id))
+            .order_by('-date', '-id')
+        )
+
+    def latest_observation(self, field):
+        return self.filter(self.observed(field), active=True).order_by('-date', '-id').first()
+
+    def latest_observations(self, hive_ids):
+        """
+        Vrátí pro každé včelstvo poslední prohlídku a poslední vyplněnou hodnotu
+        každého pole z OBSERVATION_FIELDS, vše jedním dotazem nad okenními funkcemi.
+        """
+        newest_first = [F('date').desc(), F('id').desc()]
+        annotations = {
+            'position': Window(RowNumber(), partition_by=F('hive_id'), order_by=newest_first),
+        }
+        for field in self.OBSERVATION_FIELDS:
+            observed = self.observed(field)
+            # Vyplněné hodnoty se řadí před prázdné, první řádek okna je tedy poslední vyplněná hodnota
+            order_by = [Case(When(observed, then=Value(0)), default=Value(1)), *newest_first]
+            for suffix, source in (('visit', F('id')), ('value', F(field)), ('date', F('date'))):
+                annotations[f'{field}_{suffix}'] = Window(
+                    FirstValue(Case(When(observed, then=source))),
+                    partition_by=F('hive_id'),
+                    order_by=order_by,
+                )
+
+        rows = (
+            self
+            .filter(hive_id__in=hive_ids, active=True)
+            .annotate(**annotations)
+            .filter(position=1)
+            .values('hive_id', 'date', 'hive_body_size', 'honey_supers_size', 'condition', *annotations)
+        )
+
+        observations = {}
+        for row in rows:
+            item = {
+                'date': row['date'],
+                'hive_body_size': row['hive_body_size'],
+                'honey_supers_size': row['honey_supers_size'],
+                'hive_size': f"{row['hive_body_size']}+{row['honey_supers_size']}",
+                'condition': row['condition'],
+            }
+            for field in self.OBSERVATION_FIELDS:
+                item[field] = {
+                    'visit_id': row[f'{field}_visit'],
+                    'value': row[f'{field}_value'],
+                    'date': row[f'{field}_date'],
+                }
+            observations[row['hive_id']] = item
+        return observations
+
+
 class Visits(models.Model):
     hive = models.ForeignKey(Hives, on_delete=models.SET_NULL, null=True, related_name='visits')
     date = models.DateField()
@@ -123,8 +289,320 @@ class Visits(models.Model):
     active = models.BooleanField(default=True)
     comment = models.CharField(max_length=255, null=True, blank=True)
 
+    objects = VisitsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Aktivní prohlídky včelstva od nejnovější (výpis, stránkování, poslední prohlídka)
+            models.Index(fields=['hive', '-date', '-id'], condition=models.Q(active=True),
+                         name='visits_hive_active_date_idx'),
+            # Poslední vyplněný spad a medný výnos včelstva
+            models.Index(fields=['hive', '-date', '-id'], condition=models.Q(active=True, mite_drop__isnull=False),
+                         name='visits_hive_mite_drop_idx'),
+            models.Index(fields=['hive', '-date', '-id'], condition=models.Q(active=True, honey_yield__isnull=False),
+                         name='visits_hive_honey_yield_idx'),
+        ]
+
     def __str__(self):
         return f"{self.date}"
 
 
+class HiveStatusManager(models.Manager):
+    def refresh(self, hive_ids):
+        """
+        Přepočítá souhrnný stav zadaných včelstev z jejich aktivních prohlídek.
+        Včelstva bez aktivní prohlídky souhrn nemají.
+        """
+        hive_ids = list(hive_ids)
+        with transaction.atomic(savepoint=False):
+            lock_places(Hives.objects.filter(id__in=hive_ids).values('place_id'))
+            return self.recompute(hive_ids)
+
+    def recompute(self, hive_ids):
+        # Volající musí mít stanoviště včelstev zamčená přes lock_places, souběžný zápis prohlídky
+        # by jinak mohl přepsat souhrn starším stavem
+        hive_ids = list(hive_ids)
+        observations = Visits.objects.latest_observations(hive_ids)
+        statuses = []
+        for hive_id, item in observations.items():
+            status = self.model(
+                hive_id=hive_id,
+                last_visit_date=item['date'],
+                hive_body_size=item['hive_body_size'],
+                honey_supers_size=item['honey_supers_size'],
+                condition=item['condition'],
+            )
+            for field in VisitsQuerySet.OBSERVATION_FIELDS:
+                setattr(status, field, item[field]['value'])
+                setattr(status, f'{field}_date', item[field]['date'])
+            statuses.append(status)
+
+        self.filter(hive_id__in=hive_ids).exclude(hive_id__in=observations.keys()).delete()
+        if statuses:
+            update_fields = [field.name for field in self.model._meta.concrete_fields if not field.primary_key]
+            self.bulk_create(statuses, update_conflicts=True, unique_fields=['hive'], update_fields=update_fields)
+        return statuses
+
+    def rebuild(self, batch_size=500):
+        # Kompletní přepočet souhrnů ze všech aktivních prohlídek
+        self.all().delete()
+        hive_ids = Visits.objects.filter(active=True, hive__isnull=False).values_list('hive_id', flat=True).distinct()
+        hive_ids = list(hive_ids.order_by('hive_id'))
+        count = 0
+        for start in range(0, len(hive_ids), batch_size):
+            count += len(self.refresh(hive_ids[start:start + batch_size]))
+        return count
+
+
+class HiveStatus(models.Model):
+    hive = models.OneToOneField(Hives, on_delete=models.CASCADE, primary_key=True, related_name='status')
+    last_visit_date = models.DateField()
+    hive_body_size = models.IntegerField()
+    honey_supers_size = models.IntegerField()
+    condition = models.IntegerField(null=True, blank=True)
+    honey_yield = models.FloatField(null=True, blank=True)
+    honey_yield_date = models.DateField(null=True, blank=True)
+    mite_drop = models.IntegerField(null=True, blank=True)
+    mite_drop_date = models.DateField(null=True, blank=True)
+    medication_application = models.CharField(max_length=255, null=True, blank=True)
+    medication_application_date = models.DateField(null=True, blank=True)
+    disease = models.CharField(max_length=255, null=True, blank=True)
+    disease_date = models.DateField(null=True, blank=True)
+    comment = models.CharField(max_length=255, null=True, blank=True)
+    comment_date = models.DateField(null=True, blank=True)
+
+    objects = HiveStatusManager()
+
+    def __str__(self):
+        return f"{self.hive_id}: {self.last_visit_date}"
+
+    @property
+    def hive_size(self):
+        return f"{self.hive_body_size}+{self.honey_supers_size}"
+
+    def observation(self, field):
+        return {'value': getattr(self, field), 'date': getattr(self, f'{field}_date')}
+
+
+# Součty a počty sledovaných hodnot za sezónu (kalendářní rok), z nich se skládají průměry
+ROLLUP_AGGREGATES = {
+    'visits_count': Count('id'),
+    'honey_yield_sum': Sum('honey_yield', default=0),
+    'honey_yield_count': Count('honey_yield'),
+    'condition_sum': Sum('condition', default=0),
+    'condition_count': Count('condition'),
+    'mite_drop_sum': Sum('mite_drop', default=0),
+    'mite_drop_count': Count('mite_drop'),
+}
+
+
+class SeasonRollup(models.Model):
+    season = models.IntegerField()
+    visits_count = models.IntegerField(default=0)
+    honey_yield_sum = models.FloatField(default=0)
+    honey_yield_count = models.IntegerField(default=0)
+    condition_sum = models.IntegerField(default=0)
+    condition_count = models.IntegerField(default=0)
+    mite_drop_sum = models.IntegerField(default=0)
+    mite_drop_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def average(self, field):
+        count = getattr(self, f'{field}_count')
+        return getattr(self, f'{field}_sum') / count if count else None
+
+
+def lock_places(place_ids):
+    """
+    Zamkne stanoviště (vždy ve stejném pořadí) do konce transakce. Přepočty souhrnů včelstev
+    i stanovišť na nich se tak neprolínají a každý počítá až z dat potvrzených předchozím.
+    """
+    return list(
+        HivesPlaces.objects.select_for_update(no_key=True)
+        .filter(id__in=place_ids).order_by('id').values_list('id', flat=True)
+    )
+
+
+def upsert_rollups(manager, rollups, existing, owner):
+    # Souhrny se přepíší na místě, smažou se jen sezóny, ve kterých už žádná prohlídka není
+    keys = {(getattr(rollup, f'{owner}_id'), rollup.season) for rollup in rollups}
+    stale_ids = [
+        rollup_id for rollup_id, owner_id, season in existing.values_list('id', f'{owner}_id', 'season')
+        if (owner_id, season) not in keys
+    ]
+    if stale_ids:
+        manager.filter(id__in=stale_ids).delete()
+    if rollups:
+        manager.bulk_create(rollups, update_conflicts=True, unique_fields=[owner, 'season'],
+                            update_fields=list(ROLLUP_AGGREGATES))
+
+
+def refresh_hive_summaries(hive_ids, seasons=None):
+    """
+    Po zápisu prohlídek přepočítá stav i sezónní souhrny včelstev (a jejich stanovišť)
+    pod jedním zámkem stanovišť, oba souhrny tak vycházejí ze stejných potvrzených dat.
+    """
+    hive_ids = list(hive_ids)
+    with transaction.atomic(savepoint=False):
+        place_ids = lock_places(Hives.objects.filter(id__in=hive_ids).values('place_id'))
+        HiveStatus.objects.recompute(hive_ids)
+        return HiveSeasonRollup.objects.recompute(hive_ids, place_ids, seasons)
+
+
+class HiveSeasonRollupManager(models.Manager):
+    def refresh(self, hive_ids, seasons=None):
+        """
+        Přepočítá sezónní souhrny zadaných včelstev z jejich aktivních prohlídek
+        a následně souhrny stanovišť, na kterých včelstva jsou. Se seasons se přepočítají
+        jen zadané sezóny (zápis prohlídky mění jen sezónu svého data).
+        """
+        hive_ids = list(hive_ids)
+        with transaction.atomic(savepoint=False):
+            place_ids = lock_places(Hives.objects.filter(id__in=hive_ids).values('place_id'))
+            return self.recompute(hive_ids, place_ids, seasons)
+
+    def recompute(self, hive_ids, place_ids, seasons=None):
+        # place_ids jsou stanoviště včelstev zamčená volajícím přes lock_places
+        visits = Visits.objects.filter(hive_id__in=hive_ids, active=True)
+        existing = self.filter(hive_id__in=hive_ids)
+        if seasons is not None:
+            seasons = sorted(set(seasons))
+            # Podmínka na rok se převede na rozsah dat, čte se tak jen část indexu prohlídek včelstva
+            in_seasons = Q()
+            for season in seasons:
+                in_seasons |= Q(date__year=season)
+            visits = visits.filter(in_seasons) if seasons else visits.none()
+            existing = existing.filter(season__in=seasons)
+
+        rows = visits.values('hive_id', season=ExtractYear('date')).annotate(**ROLLUP_AGGREGATES).order_by()
+        rollups = [self.model(**row) for row in rows]
+        upsert_rollups(self, rollups, existing, 'hive')
+        PlaceSeasonRollup.objects.recompute(place_ids, seasons)
+        return rollups
+
+    def rebuild(self, batch_size=500):
+        # Kompletní přepočet sezónních souhrnů včelstev i stanovišť
+        self.all().delete()
+        PlaceSeasonRollup.objects.all().delete()
+        hive_ids = Visits.objects.filter(active=True, hive__isnull=False).values_list('hive_id', flat=True).distinct()
+        hive_ids = list(hive_ids.order_by('hive_id'))
+        count = 0
+        for start in range(0, len(hive_ids), batch_size):
+            count += len(self.refresh(hive_ids[start:start + batch_size]))
+        return count
+
+
+class HiveSeasonRollup(SeasonRollup):
+    hive = models.ForeignKey(Hives, on_delete=models.CASCADE, related_name='season_rollups')
+
+    objects = HiveSeasonRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hive', 'season'], name='unique_hive_season_rollup')
+        ]
+
+    def __str__(self):
+        return f"{self.hive_id}: {self.season}"
+
+
+class PlaceSeasonRollupManager(models.Manager):
+    def refresh(self, place_ids, seasons=None):
+        place_ids = list(place_ids)
+        with transaction.atomic(savepoint=False):
+            return self.recompute(lock_places(place_ids), seasons)
+
+    def recompute(self, place_ids, seasons=None):
+        # Souhrny stanoviště se skládají ze souhrnů včelstev, která na něm aktuálně jsou
+        # (volající musí mít stanoviště zamčená přes lock_places)
+        hive_rollups = HiveSeasonRollup.objects.filter(hive__place_id__in=place_ids)
+        existing = self.filter(place_id__in=place_ids)
+        if seasons is not None:
+            hive_rollups = hive_rollups.filter(season__in=seasons)
+            existing = existing.filter(season__in=seasons)
+        rows = (
+            hive_rollups
+            .values('season', place_id=F('hive__place_id'))
+            .annotate(**{name: Sum(name) for name in ROLLUP_AGGREGATES})
+            .order_by()
+        )
+        rollups = [self.model(**row) for row in rows]
+        upsert_rollups(self, rollups, existing, 'place')
+        return rollups
+
 
+class PlaceSeasonRollup(SeasonRollup):
+    place = models.ForeignKey(HivesPlaces, on_delete=models.CASCADE, related_name='season_rollups')
+
+    objects = PlaceSeasonRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['place', 'season'], name='unique_place_season_rollup')
+        ]
+
+    def __str__(self):
+        return f"{self.place_id}: {self.season}"
+
+
+# Hranice, pod kterou jsou všechny transakce dokončené (změny s menším xid už nepřibudou)
+SYNC_WATERMARK_SQL = 'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+# Poslední změna záznamů včelaře nebo společných úkonů a hranice dokončených transakcí v jednom snímku
+DATA_VERSION_SQL = '''
+SELECT GREATEST(
+    (SELECT max(xid) FROM {change} WHERE beekeeper_id = %s),
+    (SELECT max(xid) FROM {change} WHERE beekeeper_id IS NULL AND resource = 'tasks')
+), pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+'''
+
+
+class ChangeManager(models.Manager):
+    def watermark(self):
+        with connection.cursor() as cursor:
+            cursor.execute(SYNC_WATERMARK_SQL)
+            return cursor.fetchone()[0]
+
+    def data_version(self, beekeeper_id):
+        """
+        Verze dat včelaře (xid poslední změny) pro podmíněné GET. Vrací None, dokud může doběhnout
+        transakce se starší změnou: po jejím potvrzení by se nejvyšší xid nezměnil.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(DATA_VERSION_SQL.format(change=self.model._meta.db_table), [beekeeper_id])
+            version, watermark = cursor.fetchone()
+        if version is not None and version >= watermark:
+            return None
+        return version or 0
+
+    def visible_to(self, beekeeper):
+        # Změny záznamů včelaře a společného číselníku úkonů
+        return self.filter(Q(beekeeper=beekeeper) | Q(beekeeper__isnull=True, resource='tasks'))
+
+
+class Change(models.Model):
+    """
+    Poslední změna záznamu (zdroj API a id) pro synchronizaci offline klientů. Zapisují ji triggery
+    v databázi (migrace 0020), zachytí tak i hromadné update() a bulk_create. xid je id transakce
+    poslední změny a slouží zároveň jako verze záznamu. Fyzicky smazaný záznam má změnu,
+    ale v tabulce chybí.
+    """
+    resource = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    beekeeper = models.ForeignKey(Beekeepers, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                                  related_name='+')
+    xid = models.BigIntegerField()
+
+    objects = ChangeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'object_id'], name='unique_change_resource_object')
+        ]
+        indexes = [
+            models.Index(fields=['beekeeper', 'xid', 'id'], name='changes_beekeeper_xid_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource} {self.object_id}: {self.xid}"
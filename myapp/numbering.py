@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from myapp.models import Hives, lock_places
+
+# Nejnižší volná čísla včelstev na stanovišti jedním dotazem: řada 1..(max + count)
+# bez čísel obsazených aktivními včelstvy vždy obsahuje alespoň count volných čísel.
+FREE_NUMBERS_SQL = '''
+SELECT n
+FROM generate_series(
+    1,
+    (SELECT COALESCE(MAX(number), 0) FROM {hives} WHERE place_id = %(place_id)s AND active) + %(count)s
+) AS n
+WHERE NOT EXISTS (
+    SELECT 1 FROM {hives} h WHERE h.place_id = %(place_id)s AND h.active AND h.number = n
+)
+ORDER BY n
+LIMIT %(count)s
+'''
+
+# První úsek count po sobě jdoucích volných čísel: úsek začíná buď číslem 1, nebo hned za
+# obsazeným číslem, a uvnitř nesmí být žádné číslo aktivního včelstva.
+FREE_RUN_SQL = '''
+SELECT first_number
+FROM (
+    SELECT 1 AS first_number
+    UNION
+    SELECT number + 1 FROM {hives} WHERE place_id = %(place_id)s AND active
+) AS candidates
+WHERE NOT EXISTS (
+    SELECT 1 FROM {hives} h
+    WHERE h.place_id = %(place_id)s AND h.active AND h.number BETWEEN first_number AND first_number + %(count)s - 1
+)
+ORDER BY first_number
+LIMIT 1
+'''
+
+
+def free_hive_numbers(place_id, count=1):
+    with connection.cursor() as cursor:
+        cursor.execute(FREE_NUMBERS_SQL.format(hives=Hives._meta.db_table), {'place_id': place_id, 'count': count})
+        return [row[0] for row in cursor.fetchall()]
+
+
+def free_hive_number_run(place_id, count=1):
+    with connection.cursor() as cursor:
+        cursor.execute(FREE_RUN_SQL.format(hives=Hives._meta.db_table), {'place_id': place_id, 'count': count})
+        start = cursor.fetchone()[0]
+    return list(range(start, start + count))
+
+
+def reserve_hive_numbers(place_id, count=1, contiguous=False):
+    """
+    Zamkne stanoviště do konce transakce a vrátí count nejnižších volných čísel, s contiguous
+    první úsek count po sobě jdoucích volných čísel. Souběžné rezervace na stejné stanoviště
+    tak čekají, dokud první transakce čísla nepoužije.
+    """
+    lock_places([place_id])
+    if contiguous:
+        return free_hive_number_run(place_id, count)
+    return free_hive_numbers(place_id, count)
+
+
+def create_hives(place_id, hives, attempts=None, contiguous=False):
+    """
+    Očísluje a uloží nová včelstva na stanovišti. Pokud číslo mezitím obsadil zápis, který
+    rezervaci neprošel (unique_place_hive_number), rezervace i vložení se zopakují.
+    """
+    if attempts is None:
+        attempts = settings.HIVE_NUMBER_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                numbers = reserve_hive_numbers(place_id, len(hives), contiguous)
+                for hive, number in zip(hives, numbers):
+                    hive.place_id = place_id
+                    hive.number = number
+                return Hives.objects.bulk_create(hives)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
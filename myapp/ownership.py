@@ -0,0 +1,36 @@
+from functools import wraps
+from django.contrib import messages
+from django.shortcuts import redirect
+from myapp.models import HivesPlaces, Hives, Mothers, Visits
+
+# Druh objektu -> (model, cesta k včelaři, select_related až po včelaře)
+OWNED_OBJECTS = {
+    'place': (HivesPlaces, 'beekeeper', ['beekeeper']),
+    'hive': (Hives, 'place__beekeeper', ['place__beekeeper']),
+    'mother': (Mothers, 'hive__place__beekeeper', ['hive__place__beekeeper']),
+    'visit': (Visits, 'hive__place__beekeeper', ['hive__place__beekeeper']),
+}
+
+
+def owned(kind, url_kwarg, error_message, **filters):
+    """
+    Dekorátor view: načte stanoviště, včelstvo, matku nebo prohlídku (kind) podle parametru URL
+    jedním dotazem včetně nadřazených objektů až po včelaře a ověří v SQL, že patří přihlášenému
+    uživateli (případně i další podmínky, např. active=True). View dostane místo id načtený objekt,
+    neexistující nebo cizí objekt skončí chybovou hláškou a přesměrováním na přehled.
+    """
+    model, owner_path, related = OWNED_OBJECTS[kind]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                obj = model.objects.select_related(*related).get(
+                    pk=kwargs.pop(url_kwarg), **{owner_path: request.user}, **filters
+                )
+            except (model.DoesNotExist, ValueError):
+                messages.error(request, error_message)
+                return redirect('overview')
+            return view(request, obj, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from myapp.api import RESOURCES, ApiError, error_response, int_param, json_body
+from myapp.caching import invalidate_overview
+from myapp.models import Change
+
+
+def parse_token(value):
+    """
+    Token "<xid>.<id změny>" začíná synchronizaci od dané pozice, "<xid>.<id změny>.<hranice>"
+    pokračuje další stránkou a nese hranici dokončených transakcí z první stránky.
+    Bez tokenu se vrací všechny záznamy včelaře.
+    """
+    if not value:
+        return 0, 0, None
+    try:
+        parts = [int(part) for part in value.split('.')]
+    except ValueError:
+        raise ApiError('Neplatný synchronizační token.')
+    if len(parts) == 2:
+        return parts[0], parts[1], None
+    if len(parts) == 3:
+        return tuple(parts)
+    raise ApiError('Neplatný synchronizační token.')
+
+
+def sync_rows(user, name, object_ids):
+    # Aktuální podoba záznamů (i zrušených) s verzí načtenou stejným dotazem
+    resource = RESOURCES[name]
+    version = Change.objects.filter(resource=name, object_id=OuterRef('pk')).values('xid')[:1]
+    queryset = resource.owned(user).filter(pk__in=object_ids).order_by(resource.pk)
+    return resource.rows(queryset, list(resource.fields), version=Subquery(version))
+
+
+def pull(user, since=None, limit=None):
+    """
+    Záznamy včelaře změněné od tokenu (zrušené s active=False, smazané v "deleted") a nový token.
+    Změny se čtou podle (xid, id) z indexu, cena tak odpovídá počtu změn, ne velikosti historie.
+    Stránky postupují za poslední vrácenou změnou (i za hranici dokončených transakcí), dokud je
+    more=true. Poslední stránka vrací token od hranice z první stránky: transakce, které tehdy
+    běžely, mohou své změny potvrdit později a příští synchronizace je pošle (spolu s již poslanými).
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    since_xid, since_id, low = parse_token(since)
+    watermark = Change.objects.watermark()
+    low = watermark if low is None else min(low, watermark)
+    changes = list(
+        Change.objects.visible_to(user)
+        .filter(Q(xid__gt=since_xid) | Q(xid=since_xid, id__gt=since_id))
+        .order_by('xid', 'id')
+        .values('id', 'resource', 'object_id', 'xid')[:limit + 1]
+    )
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if more:
+        token = f"{changes[-1]['xid']}.{changes[-1]['id']}.{low}"
+    else:
+        token = f'{low}.0'
+
+    object_ids = defaultdict(list)
+    for change in changes:
+        object_ids[change['resource']].append(change['object_id'])
+    records = {}
+    deleted = {}
+    for name, ids in object_ids.items():
+        records[name] = sync_rows(user, name, ids)
+        found = {row[RESOURCES[name].pk] for row in records[name]}
+        missing = [object_id for object_id in ids if object_id not in found]
+        if missing:
+            deleted[name] = missing
+    return {'token': token, 'more': more, 'changes': records, 'deleted': deleted}
+
+
+def apply_change(user, change):
+    """
+    Jedna offline úprava: bez id založení, s id úprava nebo zrušení (delete=true).
+    Úprava i zrušení musí nést verzi, ze které klient vycházel; pokud se záznam mezitím
+    změnil, vrací se konflikt s aktuální podobou záznamu a nic se neuloží.
+    """
+    if not isinstance(change, dict):
+        return {'status': 'error', 'error': 'Změna musí být JSON objekt.'}
+    name = change.get('resource')
+    result = {key: change[key] for key in ('resource', 'id', 'client_id') if key in change}
+    resource = RESOURCES.get(name)
+    try:
+        if resource is None or resource.create is None:
+            raise ApiError('Zdroj nelze synchronizovat.')
+        data = change.get('data') or {}
+        if not isinstance(data, dict):
+            raise ApiError('Data změny musí být JSON objekt.')
+
+        with transaction.atomic():
+            if change.get('id') is None:
+                obj = resource.create(user, data)
+                result.update(status='created', id=obj.pk)
+            else:
+                # Zámek záznamu, aby se mezi kontrolou verze a zápisem nemohl změnit
+                obj = (
+                    resource.owned(user).select_for_update(of=('self',))
+                    .filter(pk=int_param(change['id'], 'id')).first()
+                )
+                if obj is None:
+                    raise ApiError('Záznam neexistuje.', status=404)
+                version = Change.objects.filter(resource=name, object_id=obj.pk).values_list('xid', flat=True).first()
+                if change.get('version') != version:
+                    result.update(status='conflict', data=sync_rows(user, name, [obj.pk])[0])
+                    return result
+                if change.get('delete'):
+                    resource.delete(user, obj)
+                    result['status'] = 'deleted'
+                else:
+                    resource.update(user, obj, data)
+                    result['status'] = 'updated'
+            # Verze uloženého záznamu je id této transakce
+            result['data'] = sync_rows(user, name, [obj.pk])[0]
+    except ApiError as error:
+        result.update(status='error', error=str(error))
+        if error.errors:
+            result['errors'] = error.errors
+    except IntegrityError:
+        result.update(status='error', error='Záznam je v konfliktu s existujícími daty.')
+    return result
+
+
+def push(user, data):
+    changes = data.get('changes')
+    if not isinstance(changes, list):
+        raise ApiError('Chybí seznam změn.')
+    if len(changes) > settings.SYNC_MAX_BATCH:
+        raise ApiError(f'Najednou lze odeslat nejvýše {settings.SYNC_MAX_BATCH} změn.')
+
+    # Každá změna má vlastní transakci, chybná nebo konfliktní změna neblokuje ostatní
+    results = [apply_change(user, change) for change in changes]
+    if any(result['status'] in ('created', 'updated', 'deleted') for result in results):
+        invalidate_overview(user.pk)
+    return {'results': results}
+
+
+@require_http_methods(['GET', 'POST'])
+def sync(request):
+    """
+    GET ?since=<token>&limit=: změny od posledního tokenu (opakovat, dokud je more=true).
+    POST {"changes": [...]}: dávka offline úprav, výsledek každé změny v pořadí odeslání.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Přihlaste se.'}, status=401)
+    try:
+        if request.method == 'POST':
+            return JsonResponse(push(request.user, json_body(request)))
+        limit = int_param(request.GET.get('limit', settings.SYNC_PAGE_SIZE), 'limit')
+        return JsonResponse(pull(request.user, request.GET.get('since'), max(1, min(limit, settings.SYNC_PAGE_SIZE))))
+    except ApiError as error:
+        return error_response(error)
@@ -0,0 +1,140 @@
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from myapp.models import (
+    Beekeepers, HivesPlaces, Hives, Mothers, Tasks, Visits, refresh_hive_summaries
+)
+
+DEFAULT_TASKS = ['Krmení', 'Léčení', 'Rozšíření', 'Zúžení', 'Vytočení medu', 'Výměna matky', 'Odběr vzorku']
+FEMALE_LINES = ['Carnica', 'Buckfast', 'Vigor', 'Singer', 'Troiseck']
+PLACE_TYPES = ['Stálé', 'Kočovné']
+HIVE_TYPES = ['Langstroth', 'Optimal', 'Budečák', 'Dadant']
+INSPECTION_TYPES = ['Běžná', 'Jarní', 'Letní', 'Podzimní']
+# Prohlídky jednou týdně od začátku dubna do konce září
+SEASON_START = (4, 1)
+SEASON_WEEKS = 26
+
+
+@dataclass
+class GeneratedData:
+    beekeepers: int = 0
+    places: int = 0
+    hives: int = 0
+    mothers: int = 0
+    visits: int = 0
+    performed_tasks: int = 0
+
+
+def _visit(rng, hive_id, day, week, tasks):
+    month = day.month
+    visit = Visits(
+        hive_id=hive_id,
+        date=day,
+        inspection_type=rng.choice(INSPECTION_TYPES),
+        condition=rng.randint(1, 5) if rng.random() < 0.9 else None,
+        hive_body_size=rng.randint(1, 3),
+        honey_supers_size=rng.randint(0, 3) if 5 <= month <= 8 else 0,
+        honey_yield=round(rng.uniform(2, 25), 1) if month in (6, 7) and week % 3 == 0 else None,
+        mite_drop=rng.randint(0, 60) if month >= 8 and week % 2 == 0 else None,
+        medication_application=rng.choice(['Gabon', 'Varidol', 'Formidol']) if month == 9 and week % 4 == 0 else None,
+        disease='Nosematóza' if rng.random() < 0.005 else None,
+        comment='Klidné včelstvo' if rng.random() < 0.05 else None,
+    )
+    return visit, rng.sample(tasks, rng.randint(0, 2))
+
+
+def generate(seed=0, beekeepers=1, places=3, hives=10, seasons=3, last_season=None, password='bee',
+             prefix='synth', batch_size=5000):
+    """
+    Vygeneruje reprodukovatelná (seed) syntetická data: včelaře, stanoviště, včelstva,
+    několik generací matek a týdenní prohlídky s úkony za zadaný počet sezón.
+    Včelaři se zakládají jednotlivě (dědičnost z User bulk_create nepodporuje), vše ostatní hromadně.
+    """
+    rng = random.Random(seed)
+    last_season = last_season or date.today().year - 1
+    first_season = last_season - seasons + 1
+    result = GeneratedData()
+
+    with transaction.atomic():
+        tasks = list(Tasks.objects.values_list('id', flat=True))
+        if not tasks:
+            tasks = [task.id for task in Tasks.objects.bulk_create([Tasks(name=name) for name in DEFAULT_TASKS])]
+
+        hashed_password = make_password(password)
+        first_id = (Beekeepers.objects.aggregate(last=Max('beekeeper_id'))['last'] or 0) + 1
+        users = [
+            Beekeepers.objects.create(username=f'{prefix}{beekeeper_id}', password=hashed_password,
+                                      beekeeper_id=beekeeper_id)
+            for beekeeper_id in range(first_id, first_id + beekeepers)
+        ]
+        result.beekeepers = len(users)
+
+        new_places = HivesPlaces.objects.bulk_create([
+            HivesPlaces(beekeeper=user, name=f'Stanoviště {index}', type=rng.choice(PLACE_TYPES),
+                        location=f'Obec {rng.randint(1, 500)}', comment='')
+            for user in users for index in range(1, places + 1)
+        ], batch_size=batch_size)
+        new_hives = Hives.objects.bulk_create([
+            Hives(place=place, number=number, type=rng.choice(HIVE_TYPES), comment='')
+            for place in new_places for number in range(1, hives + 1)
+        ], batch_size=batch_size)
+        result.places, result.hives = len(new_places), len(new_hives)
+
+        # Matky po generacích: první sezóna zakládá linie, v dalších se část včelstev přematkuje
+        # dcerou některé z dosavadních matek (předci jsou tak vždy uloženi dříve než potomci)
+        current = {}
+        for season in range(first_season, last_season + 1):
+            previous = list(current.values())
+            generation = []
+            for hive in new_hives:
+                if hive.id in current and rng.random() > 0.3:
+                    continue
+                ancestor = rng.choice(previous) if previous and rng.random() < 0.8 else None
+                generation.append(Mothers(
+                    hive_id=hive.id,
+                    ancestor_id=ancestor.id if ancestor else None,
+                    mark=f'{prefix}-{hive.id}-{season}',
+                    year=season,
+                    female_line=ancestor.female_line if ancestor else rng.choice(FEMALE_LINES),
+                    male_line=rng.choice(['', 'Trubčí oblast']),
+                    comment='',
+                ))
+            generation = Mothers.objects.bulk_create(generation, batch_size=batch_size)
+            replaced = [current[mother.hive_id].id for mother in generation if mother.hive_id in current]
+            Mothers.objects.filter(id__in=replaced).update(active=False)
+            current.update({mother.hive_id: mother for mother in generation})
+            result.mothers += len(generation)
+
+        # Prohlídky se ukládají po dávkách, aby se celá historie nedržela v paměti
+        PerformedTasks = Visits.performed_tasks.through
+        batch = []
+
+        def flush():
+            new_visits = Visits.objects.bulk_create([visit for visit, _ in batch])
+            links = PerformedTasks.objects.bulk_create([
+                PerformedTasks(visits_id=visit.id, tasks_id=task_id)
+                for visit, (_, task_ids) in zip(new_visits, batch)
+                for task_id in task_ids
+            ])
+            result.visits += len(new_visits)
+            result.performed_tasks += len(links)
+            batch.clear()
+
+        for season in range(first_season, last_season + 1):
+            start = date(season, *SEASON_START)
+            for hive in new_hives:
+                offset = rng.randint(0, 6)
+                for week in range(SEASON_WEEKS):
+                    batch.append(_visit(rng, hive.id, start + timedelta(days=week * 7 + offset), week, tasks))
+                    if len(batch) >= batch_size:
+                        flush()
+        if batch:
+            flush()
+
+        hive_ids = [hive.id for hive in new_hives]
+        for start in range(0, len(hive_ids), 500):
+            refresh_hive_summaries(hive_ids[start:start + 500])
+    return result
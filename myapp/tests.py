@@ -1,8 +1,38 @@
-from django.urls import reverse
-from django.test import TestCase
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from django.urls import get_resolver, reverse
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from myapp.analytics import time_series
+from myapp.benchmark import WsgiTransport, compare_conn_max_age, run as run_benchmark
+from myapp.caching import overview_cache_stats
+from myapp.dashboard import hive_rows, place_summaries
+from myapp.genealogy import lineage
+from myapp.importing import import_visits, iter_json, iter_records
+from myapp.instrumentation import RequestStats
+from myapp.numbering import create_hives, free_hive_number_run, free_hive_numbers
+from myapp.synthetic import generate
 from myapp.forms import LoginForm, RegisterForm, AddHivesPlace, AddHive, AddMother, AddVisit, EditVisit, EditHivesPlace
-from myapp.models import Beekeepers, HivesPlaces, Hives, Mothers, Tasks, Visits
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from myapp.models import (
+    Beekeepers, HivesPlaces, Hives, Mothers, Tasks, Visits, HiveStatus, HiveSeasonRollup, PlaceSeasonRollup,
+    refresh_hive_summaries
+)
+
+
+# Řádky měření požadavků by zahltily výstup testů, zachytávají se jen přes assertLogs
+logging.getLogger('myapp.requests').setLevel(logging.ERROR)
 
 
 class MyappTestCase(TestCase):
@@ -184,3 +214,1644 @@ class FormTestCase(TestCase):
         self.task.delete()
         self.visit.delete()
 
+
+class LatestObservationsTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='TestType', comment='TestComment',
+                                         active=True)
+        self.empty_hive = Hives.objects.create(place=self.hives_place, number=2, type='TestType', comment='',
+                                               active=True)
+        self.old_visit = Visits.objects.create(hive=self.hive, date='2022-05-01', inspection_type='Jarní',
+                                               condition=3, hive_body_size=2, honey_supers_size=1, honey_yield=12.0,
+                                               medication_application='Gabon', disease='Vápenka', mite_drop=4,
+                                               comment='Starý komentář')
+        self.new_visit = Visits.objects.create(hive=self.hive, date='2022-06-01', inspection_type='Letní',
+                                               condition=4, hive_body_size=2, honey_supers_size=2, honey_yield=None,
+                                               medication_application='', disease=None, mite_drop=7, comment='')
+        Visits.objects.create(hive=self.hive, date='2022-07-01', inspection_type='Smazaná', condition=1,
+                              hive_body_size=1, honey_supers_size=0, honey_yield=99, active=False)
+
+    def test_latest_observations(self):
+        observations = Visits.objects.latest_observations([self.hive.id, self.empty_hive.id])
+
+        self.assertNotIn(self.empty_hive.id, observations)
+        hive_observations = observations[self.hive.id]
+        self.assertEqual(str(hive_observations['date']), '2022-06-01')
+        self.assertEqual(hive_observations['hive_size'], '2+2')
+        self.assertEqual(hive_observations['condition'], 4)
+        self.assertEqual(hive_observations['honey_yield']['value'], 12.0)
+        self.assertEqual(hive_observations['honey_yield']['visit_id'], self.old_visit.id)
+        self.assertEqual(hive_observations['mite_drop']['value'], 7)
+        self.assertEqual(str(hive_observations['mite_drop']['date']), '2022-06-01')
+        self.assertEqual(hive_observations['medication_application']['value'], 'Gabon')
+        self.assertEqual(hive_observations['disease']['value'], 'Vápenka')
+        self.assertEqual(hive_observations['comment']['value'], 'Starý komentář')
+
+    def test_model_methods_match_bulk_observations(self):
+        self.assertEqual(self.hive.last_honey_yield(), self.old_visit)
+        self.assertEqual(self.hive.last_mite_drop(), self.new_visit)
+        self.assertEqual(self.hive.last_medication_application(), self.old_visit)
+        self.assertIsNone(self.empty_hive.last_comment())
+
+    def test_hives_place_view(self):
+        HiveStatus.objects.refresh([self.hive.id, self.empty_hive.id])
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('hives_place', args=[self.hives_place.id]))
+        self.assertEqual(response.status_code, 200)
+        rows = {row.id: row for row in response.context['hives']}
+        self.assertEqual(rows[self.hive.id].observations['honey_yield']['value'], 12.0)
+        self.assertEqual(rows[self.empty_hive.id].observations, {})
+        self.assertEqual(rows[self.hive.id].hive_size, '2+2')
+        self.assertIsNone(rows[self.hive.id].mother)
+
+    def test_hive_rows(self):
+        HiveStatus.objects.refresh([self.hive.id])
+        older = Mothers.objects.create(hive=self.hive, mark='M1', year=2021, male_line='', female_line='',
+                                       comment='')
+        Mothers.objects.create(hive=self.hive, mark='M2', year=2022, male_line='', female_line='', comment='')
+        Mothers.objects.create(hive=self.empty_hive, mark='M3', year=2020, male_line='', female_line='', comment='',
+                               active=False)
+        with self.assertNumQueries(2):
+            rows = hive_rows(self.hives_place)
+            self.assertEqual([row.number for row in rows], [1, 2])
+            self.assertEqual(rows[0].mother, older)
+            self.assertEqual(rows[0].mother.mark, 'M1')
+            self.assertIsNone(rows[1].mother)
+            self.assertEqual(str(rows[0].last_visit_date), '2022-06-01')
+            self.assertEqual(rows[0].condition, 4)
+
+
+class HiveStatusTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='TestType', comment='TestComment',
+                                         active=True)
+        self.visit_data = {'date': '2023-04-10', 'inspection_type': 'Jarní', 'condition': 3, 'hive_body_size': 2,
+                           'honey_supers_size': 1, 'honey_yield': '', 'medication_application': '',
+                           'disease': '', 'mite_drop': 5}
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_visit_views_maintain_status(self):
+        self.client.post(reverse('add_visit', args=[self.hive.id]), self.visit_data)
+        status = HiveStatus.objects.get(hive=self.hive)
+        self.assertEqual(str(status.last_visit_date), '2023-04-10')
+        self.assertEqual(status.mite_drop, 5)
+        response = self.client.get(reverse('overview'))
+        self.assertEqual(response.context['place_summaries'][0].avg_mite_drop, 5)
+
+        visit = Visits.objects.get(hive=self.hive)
+        self.client.post(reverse('edit_visit', args=[visit.id]), dict(self.visit_data, mite_drop=9, comment='Ok'))
+        status.refresh_from_db()
+        self.assertEqual(status.mite_drop, 9)
+        self.assertEqual(status.comment, 'Ok')
+
+        self.client.get(reverse('remove_visit', args=[visit.id]))
+        self.assertFalse(HiveStatus.objects.filter(hive=self.hive).exists())
+
+    def test_remove_hive_drops_status(self):
+        self.client.post(reverse('add_visit', args=[self.hive.id]), self.visit_data)
+        self.client.get(reverse('remove_hive', args=[self.hive.id]))
+        self.assertFalse(HiveStatus.objects.filter(hive=self.hive).exists())
+
+    def test_rebuild_command(self):
+        Visits.objects.create(hive=self.hive, date='2023-05-01', inspection_type='Letní', condition=4,
+                              hive_body_size=2, honey_supers_size=2, honey_yield=8.5)
+        call_command('rebuild_hive_status', stdout=StringIO())
+        status = HiveStatus.objects.get(hive=self.hive)
+        self.assertEqual(status.hive_size, '2+2')
+        self.assertEqual(status.observation('honey_yield'), {'value': 8.5, 'date': status.last_visit_date})
+
+
+class OverviewSummaryTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.other_user = Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='',
+                                                comment='')
+        self.empty_place = HivesPlaces.objects.create(beekeeper=self.user, name='Louka', type='Kočovné',
+                                                      location='', comment='')
+        HivesPlaces.objects.create(beekeeper=self.other_user, name='Cizí', type='Stálé', location='', comment='')
+        self.hive = Hives.objects.create(place=self.place, number=1, type='Langstroth', comment='')
+        self.second_hive = Hives.objects.create(place=self.place, number=2, type='Langstroth', comment='')
+        Mothers.objects.create(hive=self.hive, mark='A1', year=2023, male_line='', female_line='', comment='')
+        self.task = Tasks.objects.create(name='Krmení')
+        Visits.objects.create(hive=self.hive, date='2023-05-01', inspection_type='Jarní', condition=4,
+                              hive_body_size=2, honey_supers_size=1, honey_yield=10, mite_drop=2,
+                              medication_application='Gabon')
+        visit = Visits.objects.create(hive=self.second_hive, date='2023-06-01', inspection_type='Letní',
+                                      condition=2, hive_body_size=2, honey_supers_size=1, honey_yield=20,
+                                      mite_drop=6)
+        visit.performed_tasks.add(self.task)
+        HiveStatus.objects.rebuild()
+        HiveSeasonRollup.objects.rebuild()
+
+    def test_place_summaries(self):
+        summaries = place_summaries(self.user)
+        self.assertEqual([summary.id for summary in summaries], [self.place.id, self.empty_place.id])
+
+        summary = summaries[0]
+        self.assertEqual((summary.hives_count, summary.mothers_count), (2, 1))
+        self.assertEqual(summary.avg_honey_yield, 15)
+        self.assertEqual(summary.avg_condition, 3)
+        self.assertEqual(summary.avg_mite_drop, 4)
+        self.assertEqual(str(summary.last_visit_date), '2023-06-01')
+        self.assertEqual(summary.last_tasks, ['Krmení'])
+        self.assertEqual(summary.last_medication, 'Gabon')
+
+        empty_summary = summaries[1]
+        self.assertEqual((empty_summary.hives_count, empty_summary.last_tasks), (0, []))
+
+    def test_overview_view(self):
+        cache.clear()
+        self.client.login(username='testuser', password='testpassword')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('overview'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['hives_places_count'], 2)
+        self.assertEqual(response.context['hives_count'], 2)
+        self.assertContains(response, 'Zahrada')
+        self.assertNotContains(response, 'Cizí')
+
+
+class OverviewCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_overview_is_served_from_cache(self):
+        self.client.get(reverse('overview'))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('overview'))
+        self.assertEqual(response.context['hives_places_count'], 1)
+        stats = overview_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_write_views_invalidate_cache(self):
+        self.client.get(reverse('overview'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_hive', args=[self.hives_place.id]), {'type': 'Langstroth'})
+        response = self.client.get(reverse('overview'))
+        self.assertEqual(response.context['hives_count'], 1)
+        self.assertEqual(overview_cache_stats()['misses'], 2)
+
+    def test_rebuild_commands_invalidate_cache(self):
+        for command in ['rebuild_hive_status', 'rebuild_season_rollups']:
+            with self.subTest(command=command):
+                self.client.get(reverse('overview'))
+                misses = overview_cache_stats()['misses']
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command(command, stdout=StringIO())
+                self.client.get(reverse('overview'))
+                self.assertEqual(overview_cache_stats()['misses'], misses + 1)
+
+
+class ConditionalGetTestCase(TransactionTestCase):
+    # Verze dat je xid poslední změny, testy proto potřebují skutečně potvrzené transakce
+    def setUp(self):
+        cache.clear()
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='Langstroth', comment='')
+        self.mother = Mothers.objects.create(hive=self.hive, mark='M1', year=2023, male_line='', female_line='',
+                                             comment='')
+        self.client.login(username='testuser', password='testpassword')
+        self.urls = [reverse('hives_place', args=[self.hives_place.id]), reverse('visits', args=[self.hive.id]),
+                     reverse('mothers', args=[self.mother.id])]
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                # Session, uživatel a verze dat, data stránky se nenačítají
+                with self.assertNumQueries(3):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+        # Verze je v databázi, vyprázdnění cache (jiný proces, restart) ETag nemění
+        etag = self.client.get(self.urls[0])['ETag']
+        cache.clear()
+        self.assertEqual(self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.urls[0])['ETag']
+        self.client.post(reverse('add_hive', args=[self.hives_place.id]), {'type': 'Langstroth'})
+        # Zpráva o založení včelstva se musí zobrazit i při shodném ETagu
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['hives']), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Hromadný update() bez volání invalidate_overview ETag také změní
+        etag = response['ETag']
+        Hives.objects.filter(place=self.hives_place).update(comment='Silné')
+        self.assertEqual(self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_etag_while_older_write_is_open(self):
+        etag = self.client.get(self.urls[0])['ETag']
+        written = threading.Event()
+        finish = threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    Hives.objects.filter(id=self.hive.id).update(comment='Rojí se')
+                    written.set()
+                    finish.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        written.wait(5)
+        # Zápis v jiné transakci po něm zvýší nejvyšší xid, starší zápis ale ještě může doběhnout
+        HivesPlaces.objects.filter(id=self.hives_place.id).update(comment='Nový')
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        finish.set()
+        thread.join()
+
+        response = self.client.get(self.urls[0])
+        self.assertEqual(response.context['hives'][0].comment, 'Rojí se')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_beekeeper_gets_no_etag(self):
+        etag = self.client.get(self.urls[0])['ETag']
+        Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        self.client.login(username='other', password='testpassword')
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertRedirects(response, reverse('overview'), fetch_redirect_response=False)
+        self.assertNotIn('ETag', response)
+
+
+class VisitsPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='TestType', comment='TestComment',
+                                         active=True)
+        task = Tasks.objects.create(name='Krmení')
+        # Dvě prohlídky ve stejný den ověřují řazení podle id
+        dates = ['2023-04-01', '2023-04-08', '2023-04-08', '2023-04-15', '2023-04-22']
+        self.visits = []
+        for visit_date in dates:
+            visit = Visits.objects.create(hive=self.hive, date=visit_date, inspection_type='Běžná',
+                                          hive_body_size=2, honey_supers_size=1)
+            visit.performed_tasks.add(task)
+            self.visits.append(visit)
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_keyset_pages_cover_history(self):
+        url = reverse('visits', args=[self.hive.id])
+        response = self.client.get(url, {'page_size': 2})
+        seen = [visit.id for visit in response.context['user_visits']]
+        while response.context['next_cursor']:
+            response = self.client.get(url, {'page_size': 2, 'before': response.context['next_cursor']})
+            seen += [visit.id for visit in response.context['user_visits']]
+
+        expected = [visit.id for visit in sorted(self.visits, key=lambda visit: (str(visit.date), visit.id),
+                                                 reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = reverse('visits', args=[self.hive.id])
+        with self.assertNumQueries(7):
+            self.client.get(url, {'page_size': 1})
+        with self.assertNumQueries(7):
+            response = self.client.get(url, {'page_size': 5})
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class GenealogyTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='TestType', comment='TestComment',
+                                         active=True)
+        self.root = self.create_mother('R', 2018)
+        self.grandmother = self.create_mother('A', 2019, self.root)
+        self.aunt = self.create_mother('A2', 2019, self.root)
+        self.mother = self.create_mother('M', 2020, self.grandmother, hive=self.hive)
+        self.sister = self.create_mother('S', 2020, self.grandmother)
+        self.cousin = self.create_mother('C', 2020, self.aunt)
+        self.daughter = self.create_mother('D1', 2021, self.mother)
+        self.granddaughter = self.create_mother('D2', 2022, self.daughter)
+
+    def create_mother(self, mark, year, ancestor=None, hive=None):
+        return Mothers.objects.create(hive=hive, ancestor=ancestor, mark=mark, year=year, male_line='',
+                                      female_line='', comment='')
+
+    def test_lineage(self):
+        with self.assertNumQueries(1):
+            result = lineage(self.mother)
+        self.assertEqual([(m.mark, m.generation) for m in result.ancestors], [('A', 1), ('R', 2)])
+        self.assertEqual([(m.mark, m.generation) for m in result.descendants], [('D1', 1), ('D2', 2)])
+        self.assertEqual([m.mark for m in result.sisters], ['S'])
+        self.assertEqual([(m.mark, m.degree, m.generation) for m in result.collaterals],
+                         [('A2', 2, 1), ('C', 2, 2)])
+
+    def test_depth_limit_and_cycle(self):
+        result = lineage(self.mother, max_depth=1)
+        self.assertEqual([m.mark for m in result.ancestors], ['A'])
+        self.assertEqual([m.mark for m in result.descendants], ['D1'])
+
+        # QuerySet.update() cesty nepřepočítá, rodokmen se řídí cestami až do rebuild_lineage_paths
+        Mothers.objects.filter(id=self.root.id).update(ancestor=self.granddaughter)
+        result = lineage(self.mother)
+        self.assertEqual([m.mark for m in result.ancestors], ['A', 'R'])
+        self.assertEqual([m.mark for m in result.descendants], ['D1', 'D2'])
+
+        # Po přepočtu má každá matka v cyklu cestu jen se svým id
+        Mothers.objects.rebuild_lineage_paths()
+        self.mother.refresh_from_db()
+        result = lineage(self.mother)
+        self.assertEqual((result.ancestors, result.descendants), ([], []))
+
+    def test_mothers_view(self):
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('mothers', args=[self.mother.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'D2(2022, F2)')
+
+
+class LineagePathTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hive = Hives.objects.create(place=self.hives_place, number=1, type='TestType', comment='TestComment',
+                                         active=True)
+        self.root = self.create_mother('R')
+        self.other_root = self.create_mother('O')
+        self.mother = self.create_mother('M', self.root)
+        self.daughter = self.create_mother('D', self.mother)
+
+    def create_mother(self, mark, ancestor=None):
+        return Mothers.objects.create(hive=self.hive, ancestor=ancestor, mark=mark, year=2022, male_line='',
+                                      female_line='', comment='')
+
+    def test_paths_follow_ancestor_changes(self):
+        self.assertEqual(self.daughter.lineage_path, f'/{self.root.id}/{self.mother.id}/{self.daughter.id}/')
+        self.assertEqual(self.daughter.female_line_founder_id(), self.root.id)
+        self.assertEqual(set(self.root.lineage_descendants()), {self.mother, self.daughter})
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.daughter.lineage_ancestors()), {self.root, self.mother})
+
+        self.mother.ancestor = self.other_root
+        self.mother.save()
+        self.daughter.refresh_from_db()
+        self.assertEqual(self.daughter.female_line_founder_id(), self.other_root.id)
+        self.assertFalse(self.root.lineage_descendants().exists())
+
+        self.other_root.delete()
+        self.daughter.refresh_from_db()
+        self.assertEqual(self.daughter.lineage_path, f'/{self.mother.id}/{self.daughter.id}/')
+
+    def test_rebuild_command(self):
+        Mothers.objects.update(lineage_path='')
+        call_command('rebuild_lineage_paths', stdout=StringIO())
+        self.daughter.refresh_from_db()
+        self.assertEqual(self.daughter.lineage_path, f'/{self.root.id}/{self.mother.id}/{self.daughter.id}/')
+
+    def test_form_rejects_descendant_as_ancestor(self):
+        form = AddMother(self.user, data={'ancestor': self.daughter.id, 'mark': 'R', 'year': 2022},
+                         instance=self.root)
+        self.assertFalse(form.is_valid())
+        self.assertIn('ancestor', form.errors)
+
+
+class MoveHiveTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.source = HivesPlaces.objects.create(beekeeper=self.user, name='Zdroj', type='Stálé', location='',
+                                                 comment='')
+        self.target = HivesPlaces.objects.create(beekeeper=self.user, name='Cíl', type='Kočovné', location='',
+                                                 comment='')
+        self.hives = [Hives.objects.create(place=self.source, number=number, type='Langstroth', comment='')
+                      for number in range(1, 8)]
+        Hives.objects.create(place=self.target, number=2, type='Langstroth', comment='')
+        self.client.login(username='testuser', password='testpassword')
+
+    def move(self, hives):
+        return self.client.post(reverse('move_hive', args=[self.source.id]), {
+            'selected_hives': [hive.id for hive in hives],
+            'new_hives_place': self.target.id,
+        })
+
+    def test_move_fills_gaps_in_target_numbers(self):
+        response = self.move(self.hives[:3])
+        self.assertRedirects(response, reverse('hives_place', args=[self.target.id]), fetch_redirect_response=False)
+        numbers = sorted(Hives.objects.filter(place=self.target, active=True).values_list('number', flat=True))
+        self.assertEqual(numbers, [1, 2, 3, 4])
+
+    def test_query_count_does_not_grow_with_selection(self):
+        with CaptureQueriesContext(connection) as small_move:
+            self.move(self.hives[:1])
+        with CaptureQueriesContext(connection) as large_move:
+            self.move(self.hives[1:])
+        self.assertEqual(len(small_move), len(large_move))
+        self.assertEqual(Hives.objects.filter(place=self.target, active=True).count(), 8)
+
+
+class ConcurrentMoveHiveTestCase(TransactionTestCase):
+    # Souběžné přesuny potřebují vlastní spojení a potvrzené transakce
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.places = [HivesPlaces.objects.create(beekeeper=self.user, name=name, type='Stálé', location='',
+                                                  comment='') for name in ('A', 'B')]
+        self.hives = [Hives.objects.create(place=place, number=1, type='Langstroth', comment='')
+                      for place in self.places]
+
+    def test_opposite_moves_do_not_deadlock(self):
+        paused = threading.Event()
+        errors = []
+
+        def slow_free_hive_numbers(place_id, count=1):
+            if not paused.is_set():
+                # Opačný přesun začne, zatímco první drží zámky stanovišť
+                paused.set()
+                time.sleep(0.3)
+            return free_hive_numbers(place_id, count)
+
+        def move(source, target, hive):
+            client = Client()
+            try:
+                client.login(username='testuser', password='testpassword')
+                response = client.post(reverse('move_hive', args=[source.id]), {
+                    'selected_hives': [hive.id], 'new_hives_place': target.id,
+                })
+                self.assertRedirects(response, reverse('hives_place', args=[target.id]),
+                                     fetch_redirect_response=False)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                paused.set()
+                connection.close()
+
+        with mock.patch('myapp.views.free_hive_numbers', side_effect=slow_free_hive_numbers):
+            first = threading.Thread(target=move, args=(self.places[0], self.places[1], self.hives[0]))
+            first.start()
+            paused.wait(5)
+            second = threading.Thread(target=move, args=(self.places[1], self.places[0], self.hives[1]))
+            second.start()
+            first.join()
+            second.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Hives.objects.get(id=self.hives[0].id).place_id, self.places[1].id)
+        self.assertEqual(Hives.objects.get(id=self.hives[1].id).place_id, self.places[0].id)
+
+
+class OwnershipTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.other = Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        place = HivesPlaces.objects.create(beekeeper=self.other, name='Cizí', type='Stálé', location='', comment='')
+        self.hive = Hives.objects.create(place=place, number=1, type='Langstroth', comment='')
+        self.mother = Mothers.objects.create(hive=self.hive, mark='M1', year=2023, male_line='', female_line='',
+                                             comment='')
+        self.visit = Visits.objects.create(hive=self.hive, date='2023-05-01', inspection_type='Běžná',
+                                           hive_body_size=2, honey_supers_size=1)
+        self.urls = [
+            reverse('edit_hives_place', args=[place.id]), reverse('add_hive', args=[place.id]),
+            reverse('remove_hives_place', args=[place.id]), reverse('move_hive', args=[place.id]),
+            reverse('add_visits', args=[place.id]), reverse('remove_hive', args=[self.hive.id]),
+            reverse('add_mother', args=[self.hive.id]), reverse('add_visit', args=[self.hive.id]),
+            reverse('edit_mother', args=[self.mother.id]), reverse('move_mother', args=[self.mother.id]),
+            reverse('remove_mother', args=[self.mother.id]), reverse('remove_visit', args=[self.visit.id]),
+            reverse('edit_visit', args=[self.visit.id]),
+        ]
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_foreign_objects_are_rejected(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                # Session, uživatel a jediný dotaz na objekt včetně kontroly vlastníka
+                with self.assertNumQueries(3):
+                    response = self.client.post(url)
+                self.assertRedirects(response, reverse('overview'), fetch_redirect_response=False)
+        self.assertTrue(HivesPlaces.objects.get(id=self.hive.place_id).active)
+        self.assertTrue(Visits.objects.get(id=self.visit.id).active)
+        self.assertEqual(Mothers.objects.get(id=self.mother.id).hive_id, self.hive.id)
+
+    def test_owner_gets_loaded_object(self):
+        self.client.login(username='other', password='testpassword')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('edit_visit', args=[self.visit.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user_hive'], self.hive)
+        # Prohlídka se načte jen jednou i se včelstvem, stanovištěm a včelařem
+        visit_queries = [query for query in context.captured_queries
+                         if query['sql'].startswith(f'SELECT "{Visits._meta.db_table}"."id"')]
+        self.assertEqual(len(visit_queries), 1)
+
+
+class HiveNumberingTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        for number in (2, 3, 6):
+            Hives.objects.create(place=self.hives_place, number=number, type='Langstroth', comment='')
+        Hives.objects.create(place=self.hives_place, number=1, type='Langstroth', comment='', active=False)
+
+    def test_free_numbers_fill_gaps_first(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(free_hive_numbers(self.hives_place.id, 5), [1, 4, 5, 7, 8])
+
+    def test_free_number_run_is_contiguous(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(free_hive_number_run(self.hives_place.id, 2), [4, 5])
+        self.assertEqual(free_hive_number_run(self.hives_place.id, 1), [1])
+        self.assertEqual(free_hive_number_run(self.hives_place.id, 3), [7, 8, 9])
+
+    def test_create_hives_reserves_numbers(self):
+        hives = create_hives(self.hives_place.id, [Hives(type='Dadant', comment='') for _ in range(3)])
+        self.assertEqual([hive.number for hive in hives], [1, 4, 5])
+        self.assertTrue(all(hive.pk for hive in hives))
+
+    def test_create_hives_retries_on_conflict(self):
+        real_free_hive_numbers = free_hive_numbers
+        results = iter([[2], None])
+
+        def conflicting_free_hive_numbers(place_id, count=1):
+            return next(results) or real_free_hive_numbers(place_id, count)
+
+        with mock.patch('myapp.numbering.free_hive_numbers', side_effect=conflicting_free_hive_numbers):
+            hive, = create_hives(self.hives_place.id, [Hives(type='Dadant', comment='')])
+        self.assertEqual(hive.number, 1)
+
+
+class HiveBatchTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_add_hive_batch_with_mothers_and_visits(self):
+        response = self.client.post(reverse('add_hive', args=[self.hives_place.id]), {
+            'type': 'Langstroth', 'count': 5, 'mother_mark_prefix': 'Z24-', 'mother_year': 2024,
+            'visit_date': '2024-05-01', 'visit_hive_body_size': 2, 'visit_honey_supers_size': 0,
+        })
+        self.assertRedirects(response, reverse('hives_place', args=[self.hives_place.id]),
+                             fetch_redirect_response=False)
+
+        hives = Hives.objects.filter(place=self.hives_place).order_by('number')
+        self.assertEqual([hive.number for hive in hives], [1, 2, 3, 4, 5])
+        mother = Mothers.objects.get(mark='Z24-3')
+        self.assertEqual(mother.hive.number, 3)
+        self.assertEqual(mother.lineage_path, f'/{mother.id}/')
+        self.assertEqual(Visits.objects.filter(hive__place=self.hives_place).count(), 5)
+        self.assertEqual(HiveStatus.objects.filter(hive__place=self.hives_place).count(), 5)
+
+    def test_add_hive_batch_takes_contiguous_numbers(self):
+        for number in (1, 3, 5):
+            Hives.objects.create(place=self.hives_place, number=number, type='Langstroth', comment='')
+        self.client.post(reverse('add_hive', args=[self.hives_place.id]), {'type': 'Langstroth', 'count': 3})
+        self.assertEqual(list(Hives.objects.filter(place=self.hives_place).order_by('number')
+                              .values_list('number', flat=True)), [1, 3, 5, 6, 7, 8])
+
+    def test_add_hive_batch_rolls_back_on_taken_mark(self):
+        Mothers.objects.create(mark='Z24-2', year=2023, male_line='', female_line='', comment='')
+        response = self.client.post(reverse('add_hive', args=[self.hives_place.id]), {
+            'type': 'Langstroth', 'count': 3, 'mother_mark_prefix': 'Z24-', 'mother_year': 2024,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Z24-2')
+        self.assertFalse(Hives.objects.filter(place=self.hives_place).exists())
+
+    def test_add_hive_batch_reports_mark_taken_concurrently(self):
+        # Značku obsadí souběžný zápis až po kontrole, těsně před vložením matek
+        real_filter = Mothers.objects.filter
+        checks = iter([True])
+
+        def racing_filter(*args, **kwargs):
+            if next(checks, False):
+                Mothers.objects.create(mark='Z24-1', year=2023, male_line='', female_line='', comment='')
+                return Mothers.objects.none()
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Mothers.objects, 'filter', side_effect=racing_filter):
+            response = self.client.post(reverse('add_hive', args=[self.hives_place.id]), {
+                'type': 'Langstroth', 'count': 2, 'mother_mark_prefix': 'Z24-', 'mother_year': 2024,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Z24-1')
+        self.assertFalse(Hives.objects.filter(place=self.hives_place).exists())
+
+
+class BulkVisitTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.hives_place = HivesPlaces.objects.create(beekeeper=self.user, name='TestPlace', type='TestType',
+                                                      location='TestLocation', comment='TestComment', active=True)
+        self.hives = [Hives.objects.create(place=self.hives_place, number=number, type='Langstroth', comment='')
+                      for number in range(1, 4)]
+        Visits.objects.create(hive=self.hives[0], date='2024-04-01', inspection_type='Jarní', condition=4,
+                              hive_body_size=2, honey_supers_size=1)
+        HiveStatus.objects.refresh([self.hives[0].id])
+        self.tasks = [Tasks.objects.create(name='Krmení'), Tasks.objects.create(name='Léčení')]
+        self.client.login(username='testuser', password='testpassword')
+
+    def row(self, index, hive, include=True, **values):
+        data = {f'form-{index}-hive': hive.id, f'form-{index}-hive_body_size': 2,
+                f'form-{index}-honey_supers_size': 1, f'form-{index}-condition': 3}
+        if include:
+            data[f'form-{index}-include'] = 'on'
+        data.update({f'form-{index}-{key}': value for key, value in values.items()})
+        return data
+
+    def test_prefill_from_last_status(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('add_visits', args=[self.hives_place.id]))
+        self.assertEqual(response.status_code, 200)
+        forms = response.context['formset'].forms
+        self.assertEqual(len(forms), 3)
+        self.assertEqual(forms[0].initial['condition'], 4)
+        self.assertNotIn('condition', forms[1].initial)
+
+    def test_save_selected_rows_in_bulk(self):
+        data = {'date': '2024-05-10', 'inspection_type': 'Běžná', 'form-TOTAL_FORMS': 3,
+                'form-INITIAL_FORMS': 3}
+        data.update(self.row(0, self.hives[0], performed_tasks=[task.id for task in self.tasks]))
+        data.update(self.row(1, self.hives[1], mite_drop=12))
+        data.update(self.row(2, self.hives[2], include=False, hive_body_size=''))
+        response = self.client.post(reverse('add_visits', args=[self.hives_place.id]), data)
+        self.assertRedirects(response, reverse('hives_place', args=[self.hives_place.id]),
+                             fetch_redirect_response=False)
+
+        new_visits = Visits.objects.filter(date='2024-05-10')
+        self.assertEqual(new_visits.count(), 2)
+        self.assertFalse(new_visits.filter(hive=self.hives[2]).exists())
+        self.assertEqual(new_visits.get(hive=self.hives[0]).performed_tasks.count(), 2)
+        self.assertEqual(HiveStatus.objects.get(hive=self.hives[1]).mite_drop, 12)
+
+    def test_repeated_task_is_saved_once(self):
+        task = self.tasks[0]
+        data = {'date': '2024-05-10', 'inspection_type': 'Běžná', 'form-TOTAL_FORMS': 1,
+                'form-INITIAL_FORMS': 1}
+        data.update(self.row(0, self.hives[0], performed_tasks=[task.id, task.id]))
+        response = self.client.post(reverse('add_visits', args=[self.hives_place.id]), data)
+        self.assertRedirects(response, reverse('hives_place', args=[self.hives_place.id]),
+                             fetch_redirect_response=False)
+        visit = Visits.objects.get(hive=self.hives[0], date='2024-05-10')
+        self.assertEqual(list(visit.performed_tasks.all()), [task])
+
+
+class ImportVisitsTestCase(TestCase):
+    CSV = (
+        'place,hive,date,inspection_type,condition,hive_body_size,honey_supers_size,honey_yield,mite_drop,tasks\n'
+        'Zahrada,1,2019-05-01,Jarní,4,2,1,12.5,,Krmení;Léčení\n'
+        'Zahrada,9,2019-05-01,Jarní,4,2,1,,,\n'
+        'Zahrada,2,2019-05-01,Jarní,7,2,1,,,\n'
+        'Zahrada,2,2019-06-01,Letní,3,2,2,,15,Vrtání\n'
+        'Zahrada,2,2019-07-01,Letní,3,2,2,,15,\n'
+    )
+
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='',
+                                                comment='')
+        self.hives = [Hives.objects.create(place=self.place, number=number, type='Langstroth', comment='')
+                      for number in (1, 2)]
+        Tasks.objects.create(name='Krmení')
+        Tasks.objects.create(name='Léčení')
+
+    def test_csv_import_reports_row_errors(self):
+        result = import_visits(self.user, iter_records(StringIO(self.CSV), 'csv'), batch_size=1)
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, message in result.errors], [3, 4, 5])
+        visit = Visits.objects.get(hive=self.hives[0])
+        self.assertEqual(visit.honey_yield, 12.5)
+        self.assertEqual(visit.performed_tasks.count(), 2)
+        self.assertEqual(HiveStatus.objects.get(hive=self.hives[1]).mite_drop, 15)
+
+    def test_json_is_read_incrementally(self):
+        records = [{'place': 'Zahrada', 'hive': 1, 'date': f'2020-0{month}-01', 'inspection_type': 'Běžná',
+                    'condition': 3, 'hive_body_size': 2, 'honey_supers_size': 1, 'tasks': ['Krmení']}
+                   for month in range(1, 10)]
+        array = json.dumps(records, indent=2, ensure_ascii=False)
+        lines = '\n'.join(json.dumps(record) for record in records)
+        for content in (array, lines):
+            parsed = [record for index, record in iter_json(StringIO(content), chunk_size=16)]
+            self.assertEqual(parsed, records)
+
+        result = import_visits(self.user, iter_records(StringIO(array), 'json'), batch_size=4)
+        self.assertEqual((result.created, result.failed), (9, 0))
+
+    def test_malformed_json_is_reported_per_record(self):
+        record = {'place': 'Zahrada', 'hive': 2, 'date': '2020-05-01', 'inspection_type': 'Běžná', 'condition': 3,
+                  'hive_body_size': 2, 'honey_supers_size': 1}
+        lines = '\n'.join([json.dumps(record), '{"place": "Zahrada", "hive": ', '{"comment": "' + 'x' * 300,
+                           json.dumps(dict(record, condition=5))])
+        parsed = list(iter_json(StringIO(lines), chunk_size=16, max_record_size=200))
+        self.assertEqual([index for index, item in parsed], [1, 2, 3, 4])
+        self.assertEqual([item['condition'] for index, item in (parsed[0], parsed[3])], [3, 5])
+        self.assertIn('delší než 200', parsed[2][1].message)
+
+        result = import_visits(self.user, iter_records(StringIO(lines), 'json'), batch_size=1)
+        self.assertEqual((result.created, [line for line, message in result.errors]), (2, [2, 3]))
+        self.assertEqual(HiveStatus.objects.get(hive=self.hives[1]).condition, 5)
+
+        # Pole po neplatném záznamu dál číst nelze, uložené záznamy ale mají souhrny
+        array = '[' + json.dumps(dict(record, hive=1)) + ', {"hive": 1,, ' + json.dumps(record) + ']'
+        result = import_visits(self.user, iter_records(StringIO(array), 'json'), batch_size=1)
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(HiveStatus.objects.get(hive=self.hives[0]).last_visit_date.isoformat(), '2020-05-01')
+        self.assertTrue(HiveSeasonRollup.objects.filter(hive=self.hives[0], season=2020).exists())
+
+    def test_oversized_csv_field_is_reported_as_row_error(self):
+        content = self.CSV.splitlines(keepends=True)
+        content.insert(2, 'Zahrada,2,2019-05-01,Jarní,4,2,1,,,"' + 'x' * (csv.field_size_limit() + 1) + '"\n')
+        content = ''.join(content)
+        result = import_visits(self.user, iter_records(StringIO(content), 'csv'), batch_size=1)
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(result.errors[0][0], 3)
+        self.assertIn('Zbytek souboru se nenačetl', result.errors[0][1])
+
+        self.client.login(username='testuser', password='testpassword')
+        upload = SimpleUploadedFile('prohlidky.csv', content.encode('utf-8'))
+        response = self.client.post(reverse('import_visits'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].failed, 1)
+
+    def test_hive_number_is_not_truncated(self):
+        record = {'place': 'Zahrada', 'date': '2020-05-01', 'inspection_type': 'Běžná', 'condition': 3,
+                  'hive_body_size': 2, 'honey_supers_size': 1}
+        lines = '\n'.join(json.dumps(dict(record, hive=hive)) for hive in (1.7, True, '2', 1))
+        result = import_visits(self.user, iter_records(StringIO(lines), 'json'))
+        self.assertEqual((result.created, [line for line, message in result.errors]), (2, [1, 2]))
+        self.assertEqual(Visits.objects.filter(hive=self.hives[0]).count(), 1)
+
+    def test_repeated_task_is_stored_once(self):
+        content = (
+            'place,hive,date,inspection_type,condition,hive_body_size,honey_supers_size,tasks\n'
+            'Zahrada,1,2019-05-01,Jarní,4,2,1,Krmení;Krmení;Léčení\n'
+            'Zahrada,2,2019-05-01,Jarní,4,2,1,Léčení\n'
+        )
+        result = import_visits(self.user, iter_records(StringIO(content), 'csv'))
+        self.assertEqual((result.created, result.failed), (2, 0))
+        visit = Visits.objects.get(hive=self.hives[0])
+        self.assertEqual(sorted(visit.performed_tasks.values_list('name', flat=True)), ['Krmení', 'Léčení'])
+
+        self.client.login(username='testuser', password='testpassword')
+        upload = SimpleUploadedFile('prohlidky.csv', content.encode('utf-8'))
+        response = self.client.post(reverse('import_visits'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+
+    def test_import_command_and_upload_view(self):
+        self.client.login(username='testuser', password='testpassword')
+        upload = SimpleUploadedFile('prohlidky.csv', self.CSV.encode('utf-8'))
+        response = self.client.post(reverse('import_visits'), {'file': upload})
+        self.assertEqual(response.context['result'].created, 2)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as csv_file:
+            csv_file.write(self.CSV)
+        self.addCleanup(os.remove, csv_file.name)
+        call_command('import_visits', csv_file.name, beekeeper='testuser', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Visits.objects.filter(hive__place=self.place).count(), 4)
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.other = Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        self.foreign_place = HivesPlaces.objects.create(beekeeper=self.other, name='Cizí', type='Stálé',
+                                                        location='', comment='')
+        self.hives = [Hives.objects.create(place=self.place, number=number, type='Langstroth', comment='')
+                      for number in range(1, 6)]
+        self.mothers = [Mothers.objects.create(hive=hive, mark=f'M{hive.number}', year=2023, male_line='',
+                                               female_line='Carnica', comment='') for hive in self.hives]
+        self.task = Tasks.objects.create(name='Krmení')
+        self.visit = Visits.objects.create(hive=self.hives[0], date='2023-05-01', inspection_type='Běžná',
+                                           condition=3, hive_body_size=2, honey_supers_size=1)
+        self.visit.performed_tasks.add(self.task)
+        HiveStatus.objects.refresh([hive.id for hive in self.hives])
+        self.client.login(username='testuser', password='testpassword')
+
+    def collection(self, resource):
+        return reverse('api_collection', args=[resource])
+
+    def item(self, resource, object_id):
+        return reverse('api_item', args=[resource, object_id])
+
+    def test_cursor_pagination_and_fields(self):
+        response = self.client.get(self.collection('hives'), {'limit': 2, 'fields': 'number'})
+        content = response.json()
+        self.assertEqual(content['data'], [{'id': self.hives[0].id, 'number': 1},
+                                           {'id': self.hives[1].id, 'number': 2}])
+        numbers = [row['number'] for row in content['data']]
+        while content['next']:
+            content = self.client.get(self.collection('hives'), {'limit': 2, 'cursor': content['next']}).json()
+            numbers += [row['number'] for row in content['data']]
+        self.assertEqual(numbers, [1, 2, 3, 4, 5])
+
+        visits = self.client.get(self.collection('visits'), {'hive': self.hives[0].id}).json()['data']
+        self.assertEqual(visits[0]['tasks'], [self.task.id])
+        self.assertEqual(visits[0]['date'], '2023-05-01')
+        self.assertEqual(self.client.get(self.collection('hives'), {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get(self.collection('hives'), {'include': 'visits'}).status_code, 400)
+        self.assertEqual(self.client.get(self.collection('beekeepers')).status_code, 404)
+
+    def test_place_with_hives_mothers_and_statuses(self):
+        # Druhá aktivní matka včelstva není aktuální, přiloží se jen aktuální matky
+        Mothers.objects.create(hive=self.hives[0], mark='N1', year=2024, male_line='', female_line='Carnica',
+                               comment='')
+        # Stanoviště, včelstva, matky a souhrny stavu: session, uživatel a jeden dotaz na každý zdroj
+        with self.assertNumQueries(6):
+            response = self.client.get(self.item('places', self.place.id), {
+                'include': 'hives,mothers,statuses', 'fields[statuses]': 'last_visit_date,condition',
+            })
+        content = response.json()
+        self.assertEqual(content['data']['name'], 'Zahrada')
+        self.assertEqual(len(content['included']['hives']), 5)
+        self.assertEqual([row['mark'] for row in content['included']['mothers']], ['M1', 'M2', 'M3', 'M4', 'M5'])
+        self.assertEqual(content['included']['statuses'],
+                         [{'hive': self.hives[0].id, 'last_visit_date': '2023-05-01', 'condition': 3}])
+        response = self.client.get(self.item('hives', self.hives[0].id), {'include': 'mothers'})
+        self.assertEqual([row['mark'] for row in response.json()['included']['mothers']], ['M1'])
+
+    def test_ownership(self):
+        self.assertEqual(self.client.get(self.item('places', self.foreign_place.id)).status_code, 404)
+        self.assertNotIn(self.foreign_place.id,
+                         [row['id'] for row in self.client.get(self.collection('places')).json()['data']])
+        response = self.client.post(self.collection('hives'), {'place': self.foreign_place.id, 'type': 'Dadant'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('place', response.json()['errors'])
+        self.assertEqual(self.client.delete(self.item('places', self.foreign_place.id)).status_code, 404)
+        self.assertTrue(HivesPlaces.objects.get(id=self.foreign_place.id).active)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.collection('places')).status_code, 401)
+
+    def test_writes(self):
+        response = self.client.post(self.collection('visits'), {
+            'hive': self.hives[1].id, 'date': '2023-06-01', 'inspection_type': 'Letní', 'condition': 4,
+            'hive_body_size': 2, 'honey_supers_size': 2, 'tasks': [self.task.id],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        visit_id = response.json()['data']['id']
+        self.assertEqual(response.json()['data']['tasks'], [self.task.id])
+        self.assertEqual(HiveStatus.objects.get(hive=self.hives[1]).condition, 4)
+
+        response = self.client.patch(self.item('visits', visit_id), {'condition': 1, 'tasks': []},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['data']['condition'], response.json()['data']['tasks']), (1, []))
+        self.assertEqual(response.json()['data']['inspection_type'], 'Letní')
+
+        response = self.client.patch(self.item('visits', visit_id), {'hive_body_size': -1},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('hive_body_size', response.json()['errors'])
+
+        response = self.client.post(self.collection('hives'), {'place': self.place.id, 'type': 'Dadant'},
+                                    content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['data']['number']), (201, 6))
+
+        self.assertEqual(self.client.delete(self.item('hives', self.hives[0].id)).status_code, 204)
+        self.assertFalse(Mothers.objects.get(id=self.mothers[0].id).active)
+        self.assertEqual(self.client.get(self.item('hives', self.hives[0].id)).status_code, 404)
+        self.assertEqual(self.client.delete(self.item('tasks', self.task.id)).status_code, 405)
+        response = self.client.post(self.collection('tasks'), {'name': 'Vrtání'}, content_type='application/json')
+        self.assertEqual(response.status_code, 405)
+        response = self.client.patch(self.item('tasks', self.task.id), {'name': 'Vrtání'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(list(Tasks.objects.values_list('name', flat=True)), ['Krmení'])
+
+
+class SyncTestCase(TransactionTestCase):
+    # Verze záznamů jsou id transakcí, testy proto potřebují skutečně potvrzené transakce
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.other = Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        HivesPlaces.objects.create(beekeeper=self.other, name='Cizí', type='Stálé', location='', comment='')
+        self.hives = [Hives.objects.create(place=self.place, number=number, type='Langstroth', comment='')
+                      for number in range(1, 4)]
+        self.mother = Mothers.objects.create(hive=self.hives[0], mark='M1', year=2023, male_line='',
+                                             female_line='Carnica', comment='')
+        self.task = Tasks.objects.create(name='Krmení')
+        self.client.login(username='testuser', password='testpassword')
+
+    def pull(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get(reverse('api_sync'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def push(self, *changes):
+        response = self.client.post(reverse('api_sync'), {'changes': list(changes)}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_pull_returns_only_changes_since_token(self):
+        content = self.pull()
+        self.assertFalse(content['more'])
+        self.assertEqual([row['name'] for row in content['changes']['places']], ['Zahrada'])
+        self.assertEqual([row['number'] for row in content['changes']['hives']], [1, 2, 3])
+        self.assertEqual([row['name'] for row in content['changes']['tasks']], ['Krmení'])
+        self.assertEqual(self.pull(content['token'])['changes'], {})
+
+        # Stránkování po jedné změně vrátí stejné záznamy
+        token, hives = None, []
+        while True:
+            page = self.pull(token, limit=1)
+            hives += [row['id'] for row in page['changes'].get('hives', [])]
+            token = page['token']
+            if not page['more']:
+                break
+        self.assertEqual(hives, [hive.id for hive in self.hives])
+
+        # Hromadný update() zachytí trigger, zrušené záznamy přijdou s active=False
+        Hives.objects.filter(id__in=[self.hives[1].id, self.hives[2].id]).update(comment='Slabé')
+        self.assertEqual(self.client.delete(reverse('api_item', args=['places', self.place.id])).status_code, 204)
+        content = self.pull(token)
+        self.assertEqual([(row['comment'], row['active']) for row in content['changes']['hives']],
+                         [('', False), ('Slabé', False), ('Slabé', False)])
+        self.assertFalse(content['changes']['places'][0]['active'])
+        self.assertEqual(content['deleted'], {})
+
+        token = content['token']
+        self.client.post(reverse('erase_mother', args=[self.mother.id]))
+        content = self.pull(token)
+        self.assertEqual(content['deleted'], {'mothers': [self.mother.id]})
+
+        self.assertEqual(self.client.get(reverse('api_sync'), {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_sync'), {'since': '1.2.3.4'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_sync')).status_code, 401)
+
+    def test_pull_pages_past_open_transaction(self):
+        token = self.pull()['token']
+        written = threading.Event()
+        finish = threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    Hives.objects.filter(id=self.hives[0].id).update(comment='Rojí se')
+                    written.set()
+                    finish.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        written.wait(5)
+        try:
+            # Novější potvrzené změny leží nad hranicí dokončených transakcí, stránky je vrátí celé
+            hives = [Hives.objects.create(place=self.place, number=number, type='Langstroth', comment='')
+                     for number in range(4, 8)]
+            pages, received = 0, []
+            while True:
+                page = self.pull(token, limit=2)
+                pages += 1
+                received += [row['id'] for row in page['changes'].get('hives', [])]
+                token = page['token']
+                if not page['more']:
+                    break
+            self.assertEqual(received, [hive.id for hive in hives])
+            self.assertEqual(pages, 2)
+        finally:
+            finish.set()
+            thread.join()
+
+        # Změna z transakce, která při synchronizaci ještě běžela, přijde příště (spolu s již poslanými)
+        content = self.pull(token)
+        self.assertFalse(content['more'])
+        rows = {row['id']: row for row in content['changes']['hives']}
+        self.assertEqual(rows[self.hives[0].id]['comment'], 'Rojí se')
+        self.assertEqual(set(rows), {self.hives[0].id} | {hive.id for hive in hives})
+        self.assertEqual(self.pull(content['token'])['changes'], {})
+
+    def test_push_detects_conflicts(self):
+        hive = self.pull()['changes']['hives'][0]
+        results = self.push(
+            {'resource': 'hives', 'id': hive['id'], 'version': hive['version'], 'data': {'comment': 'Offline'}},
+            {'resource': 'visits', 'client_id': 'v1', 'data': {
+                'hive': hive['id'], 'date': '2023-06-01', 'inspection_type': 'Letní', 'condition': 4,
+                'hive_body_size': 2, 'honey_supers_size': 1, 'tasks': [self.task.id]}},
+        )
+        self.assertEqual([result['status'] for result in results], ['updated', 'created'])
+        self.assertEqual(results[0]['data']['comment'], 'Offline')
+        self.assertGreater(results[0]['data']['version'], hive['version'])
+        self.assertEqual(results[1]['client_id'], 'v1')
+        self.assertEqual(results[1]['data']['tasks'], [self.task.id])
+        self.assertEqual(HiveStatus.objects.get(hive_id=hive['id']).condition, 4)
+
+        # Druhé zařízení vychází ze staré verze, úprava se neuloží
+        results = self.push(
+            {'resource': 'hives', 'id': hive['id'], 'version': hive['version'], 'data': {'comment': 'Jiné'}},
+            {'resource': 'hives', 'id': hive['id'], 'version': hive['version'], 'delete': True},
+            {'resource': 'tasks', 'data': {'name': 'Nová'}},
+        )
+        self.assertEqual([result['status'] for result in results], ['conflict', 'conflict', 'error'])
+        self.assertEqual(results[0]['data']['comment'], 'Offline')
+        hive = Hives.objects.get(id=hive['id'])
+        self.assertEqual((hive.comment, hive.active), ('Offline', True))
+
+        foreign = HivesPlaces.objects.get(beekeeper=self.other)
+        results = self.push({'resource': 'places', 'id': foreign.id, 'version': 0, 'delete': True})
+        self.assertEqual(results[0]['status'], 'error')
+        self.assertTrue(HivesPlaces.objects.get(id=foreign.id).active)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        self.hive = Hives.objects.create(place=self.place, number=1, type='Langstroth', comment='')
+        Mothers.objects.create(hive=self.hive, mark='Z1', year=2023, male_line='', female_line='Carnica',
+                               comment='')
+        task = Tasks.objects.create(name='Krmení')
+        for month in (4, 5, 6):
+            visit = Visits.objects.create(hive=self.hive, date=f'2023-0{month}-01', inspection_type='Běžná',
+                                          condition=3, hive_body_size=2, honey_supers_size=1)
+            visit.performed_tasks.add(task)
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_visits_csv_export_can_be_imported_again(self):
+        response = self.client.get(reverse('export_records', args=['visits', 'csv']))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="visits.csv"')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines()[1], 'Zahrada,1,Z1,2023-04-01,Běžná,3,2,1,,,,,,Krmení')
+
+        result = import_visits(self.user, iter_records(StringIO(content), 'csv'))
+        self.assertEqual((result.created, result.failed), (3, 0))
+
+    def test_ndjson_exports_and_command(self):
+        response = self.client.get(reverse('export_records', args=['mothers', 'ndjson']))
+        record = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual((record['mark'], record['place'], record['hive']), ('Z1', 'Zahrada', 1))
+
+        output = StringIO()
+        call_command('export_records', 'hives', beekeeper='testuser', format='ndjson', stdout=output)
+        self.assertEqual(json.loads(output.getvalue())['mother'], 'Z1')
+
+    def test_current_mother_matches_hive_table(self):
+        # Se dvěma aktivními matkami export uvádí stejnou matku jako tabulka včelstev
+        Mothers.objects.create(hive=self.hive, mark='Z2', year=2024, male_line='', female_line='', comment='')
+        output = StringIO()
+        call_command('export_records', 'hives', beekeeper='testuser', format='ndjson', stdout=output)
+        self.assertEqual(json.loads(output.getvalue())['mother'], hive_rows(self.place)[0].mother.mark)
+        response = self.client.get(reverse('export_records', args=['visits', 'csv']))
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8').splitlines()[1].split(',')[2], 'Z1')
+
+    def test_unknown_export(self):
+        response = self.client.get(reverse('export_records', args=['beekeepers', 'csv']))
+        self.assertRedirects(response, reverse('overview'), fetch_redirect_response=False)
+
+
+class AnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        self.hive = Hives.objects.create(place=self.place, number=1, type='Langstroth', comment='')
+        self.other_hive = Hives.objects.create(place=self.place, number=2, type='Langstroth', comment='')
+        for hive, day, year, condition, honey_yield, mite_drop in [
+            (self.hive, '2022-05-03', 2022, 2, 10, 4),
+            (self.hive, '2023-04-04', 2023, 3, None, 2),
+            (self.hive, '2023-05-02', 2023, 4, 12, 6),
+            (self.other_hive, '2023-05-20', 2023, 2, 8, None),
+        ]:
+            Visits.objects.create(hive=hive, date=day, inspection_type='Běžná', condition=condition,
+                                  hive_body_size=2, honey_supers_size=1, honey_yield=honey_yield,
+                                  mite_drop=mite_drop)
+        Visits.objects.create(hive=self.hive, date='2023-06-01', inspection_type='Běžná', condition=1,
+                              hive_body_size=2, honey_supers_size=1, honey_yield=100, active=False)
+        HiveSeasonRollup.objects.rebuild()
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_monthly_place_series(self):
+        series = time_series(self.user, 'month', window=2, place_id=self.place.id)
+        self.assertEqual([str(period) for period in series['period']], ['2022-05-01', '2023-04-01', '2023-05-01'])
+        self.assertEqual(series['visits'], [1, 1, 2])
+        self.assertEqual(series['honey_yield'], [10, None, 20])
+        self.assertEqual(series['condition'], [2.0, 3.0, 3.0])
+        self.assertEqual(series['mite_drop_rolling'], [4.0, 2.0, 4.0])
+        self.assertEqual(series['honey_yield_previous_year'], [None, None, 10])
+
+    def test_rolling_window_spans_periods_not_rows(self):
+        # Mezi květnem 2022 a dubnem 2023 nejsou žádné prohlídky, do okna se tedy nezapočítají
+        series = time_series(self.user, 'month', window=3, hive_id=self.hive.id)
+        self.assertEqual([str(period) for period in series['period']], ['2022-05-01', '2023-04-01', '2023-05-01'])
+        self.assertEqual(series['condition_rolling'], [2.0, 3.0, 3.5])
+        series = time_series(self.user, 'week', window=3, hive_id=self.hive.id)
+        self.assertEqual(series['condition_rolling'], [2.0, 3.0, 4.0])
+
+    def test_seasonal_hive_series(self):
+        series = time_series(self.user, 'season', window=1, hive_id=self.hive.id)
+        self.assertEqual(series['visits'], [1, 2])
+        self.assertEqual(series['honey_yield'], [10, 12])
+        self.assertEqual(series['condition_previous_year'], [None, 2.0])
+
+    def test_analytics_view(self):
+        response = self.client.get(reverse('analytics_scope', args=['hive', self.other_hive.id]),
+                                   {'bucket': 'week'})
+        data = response.json()
+        self.assertEqual((data['scope'], data['bucket'], data['window']), ('hive', 'week', 3))
+        self.assertEqual(data['series']['period'], ['2023-05-15'])
+
+        response = self.client.get(reverse('analytics'), {'bucket': 'day'})
+        self.assertEqual(response.status_code, 400)
+
+        other = Beekeepers.objects.create_user(username='other', password='testpassword', beekeeper_id=2)
+        foreign_place = HivesPlaces.objects.create(beekeeper=other, name='Les', type='Stálé', location='Obec',
+                                                   comment='')
+        response = self.client.get(reverse('analytics_scope', args=['place', foreign_place.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SeasonRollupTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        self.other_place = HivesPlaces.objects.create(beekeeper=self.user, name='Louka', type='Stálé',
+                                                      location='Obec', comment='')
+        self.hive = Hives.objects.create(place=self.place, number=1, type='Langstroth', comment='')
+        self.client.login(username='testuser', password='testpassword')
+
+    def add_visit(self, day, **data):
+        data = {'date': day, 'inspection_type': 'Běžná', 'hive_body_size': 2, 'honey_supers_size': 1, **data}
+        self.client.post(reverse('add_visit', args=[self.hive.id]), data)
+        return Visits.objects.filter(hive=self.hive, date=day).get()
+
+    def rollup(self, model=HiveSeasonRollup, **filters):
+        return model.objects.filter(**filters).values_list('season', 'visits_count', 'honey_yield_sum',
+                                                           'condition_count')
+
+    def test_write_paths_update_rollups(self):
+        self.add_visit('2023-05-01', condition=3, honey_yield=10)
+        visit = self.add_visit('2023-06-01', condition=4, honey_yield=5)
+        self.assertEqual(list(self.rollup(hive=self.hive)), [(2023, 2, 15.0, 2)])
+        self.assertEqual(list(self.rollup(PlaceSeasonRollup, place=self.place)), [(2023, 2, 15.0, 2)])
+
+        # Přesun prohlídky do jiné sezóny
+        self.client.post(reverse('edit_visit', args=[visit.id]), {
+            'date': '2024-06-01', 'inspection_type': 'Běžná', 'hive_body_size': 2, 'honey_supers_size': 1,
+            'honey_yield': 5,
+        })
+        self.assertEqual(list(self.rollup(hive=self.hive).order_by('season')),
+                         [(2023, 1, 10.0, 1), (2024, 1, 5.0, 0)])
+
+        self.client.get(reverse('remove_visit', args=[visit.id]))
+        self.assertEqual(list(self.rollup(PlaceSeasonRollup, place=self.place)), [(2023, 1, 10.0, 1)])
+
+    def test_move_hive_and_rebuild(self):
+        self.add_visit('2023-05-01', condition=3, honey_yield=10)
+        self.client.post(reverse('move_hive', args=[self.place.id]), {
+            'selected_hives': [self.hive.id], 'new_hives_place': self.other_place.id,
+        })
+        self.assertFalse(PlaceSeasonRollup.objects.filter(place=self.place).exists())
+        self.assertEqual(list(self.rollup(PlaceSeasonRollup, place=self.other_place)), [(2023, 1, 10.0, 1)])
+
+        HiveSeasonRollup.objects.all().delete()
+        call_command('rebuild_season_rollups', stdout=StringIO())
+        self.assertEqual(list(self.rollup(PlaceSeasonRollup, place=self.other_place)), [(2023, 1, 10.0, 1)])
+        self.assertEqual(HiveSeasonRollup.objects.get().average('condition'), 3)
+
+    def test_refresh_recomputes_only_given_seasons(self):
+        self.add_visit('2022-05-01', condition=2)
+        self.add_visit('2023-05-01', condition=3)
+        HiveSeasonRollup.objects.filter(season=2022).update(visits_count=9)
+        with self.assertNumQueries(7):
+            HiveSeasonRollup.objects.refresh([self.hive.id], [2023])
+        self.assertEqual(list(self.rollup(hive=self.hive).order_by('season')),
+                         [(2022, 9, 0.0, 1), (2023, 1, 0.0, 1)])
+
+
+class ConcurrentRollupTestCase(TransactionTestCase):
+    # Souběžné zápisy potřebují vlastní spojení a potvrzené transakce
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        self.hives = [Hives.objects.create(place=self.place, number=number, type='Langstroth', comment='')
+                      for number in (1, 2)]
+
+    def test_visits_to_hives_of_one_place(self):
+        refreshed = threading.Event()
+        errors = []
+
+        def write_visit(hive, hold):
+            try:
+                with transaction.atomic():
+                    Visits.objects.create(hive=hive, date='2023-05-01', inspection_type='Běžná', condition=3,
+                                          hive_body_size=2, honey_supers_size=1)
+                    HiveSeasonRollup.objects.refresh([hive.id], [2023])
+                    if hold:
+                        # Druhý zápis začne, dokud první drží souhrn stanoviště nepotvrzený
+                        refreshed.set()
+                        time.sleep(0.3)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                refreshed.set()
+                connection.close()
+
+        first = threading.Thread(target=write_visit, args=(self.hives[0], True))
+        first.start()
+        refreshed.wait(5)
+        second = threading.Thread(target=write_visit, args=(self.hives[1], False))
+        second.start()
+        first.join()
+        second.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(PlaceSeasonRollup.objects.get(place=self.place, season=2023).visits_count, 2)
+
+    def test_visits_to_one_hive_keep_latest_status(self):
+        refreshed = threading.Event()
+        errors = []
+
+        def write_visit(day, condition, hold):
+            try:
+                with transaction.atomic():
+                    Visits.objects.create(hive=self.hives[0], date=day, inspection_type='Běžná', condition=condition,
+                                          hive_body_size=2, honey_supers_size=1)
+                    refresh_hive_summaries([self.hives[0].id], [2023])
+                    if hold:
+                        # Starší prohlídka se zapíše, dokud novější ještě není potvrzená
+                        refreshed.set()
+                        time.sleep(0.3)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                refreshed.set()
+                connection.close()
+
+        first = threading.Thread(target=write_visit, args=('2023-06-01', 5, True))
+        first.start()
+        refreshed.wait(5)
+        second = threading.Thread(target=write_visit, args=('2023-05-01', 2, False))
+        second.start()
+        first.join()
+        second.join()
+
+        self.assertEqual(errors, [])
+        status = HiveStatus.objects.get(hive=self.hives[0])
+        self.assertEqual((status.last_visit_date.isoformat(), status.condition), ('2023-06-01', 5))
+        self.assertEqual(HiveSeasonRollup.objects.get(hive=self.hives[0], season=2023).visits_count, 2)
+
+
+class IndexUsageTestCase(TestCase):
+    def setUp(self):
+        user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        self.place = HivesPlaces.objects.create(beekeeper=user, name='Zahrada', type='Stálé', location='Obec',
+                                                comment='')
+        hives = Hives.objects.bulk_create([
+            Hives(place=self.place, number=number, type='Langstroth', comment='') for number in range(1, 21)
+        ])
+        self.hive = hives[0]
+        self.mother = Mothers.objects.create(hive=self.hive, mark='Z1', year=2023, male_line='', female_line='',
+                                             comment='')
+        Visits.objects.bulk_create([
+            Visits(hive=hive, date=f'2023-{month:02d}-01', inspection_type='Běžná', hive_body_size=2,
+                   honey_supers_size=1, mite_drop=5 if month == 8 else None, active=month != 1)
+            for hive in hives for month in range(1, 13)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Visits._meta.db_table}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        # Na malých testovacích tabulkách by plánovač zvolil sekvenční čtení a řazení v paměti
+        settings = ['enable_seqscan', 'enable_bitmapscan', 'enable_sort']
+        with connection.cursor() as cursor:
+            cursor.execute('; '.join(f'SET {setting} = off' for setting in settings))
+            try:
+                plan = queryset.explain()
+            finally:
+                cursor.execute('; '.join(f'RESET {setting}' for setting in settings))
+        self.assertIn(index_name, plan)
+
+    def test_indexes_are_used(self):
+        self.assertUsesIndex(Visits.objects.filter(hive=self.hive, active=True).order_by('-date', '-id')[:50],
+                             'visits_hive_active_date_idx')
+        self.assertUsesIndex(
+            Visits.objects.filter(hive=self.hive, active=True, mite_drop__isnull=False).order_by('-date', '-id')[:1],
+            'visits_hive_mite_drop_idx'
+        )
+        self.assertUsesIndex(Hives.objects.filter(place=self.place, active=True).order_by('number'),
+                             'unique_place_hive_number')
+        self.assertUsesIndex(Mothers.objects.current().filter(hive=self.hive)[:1], 'mothers_hive_active_idx')
+        self.assertUsesIndex(Mothers.objects.filter(ancestor=self.mother), 'ancestor_id')
+
+
+# Velikosti testovacích dat: (stanoviště, včelstva na stanovišti, roky prohlídek)
+PERFORMANCE_SCALES = [(1, 10, 1), (10, 25, 2), (1, 100, 3), (100, 10, 3)]
+
+# Strop počtu dotazů na požadavek, stejný pro všechny velikosti dat
+QUERY_BUDGETS = {
+    'index': 2,
+    'login_user': 0,
+    'logout_user': 4,
+    'signup': 0,
+    'login_required_message': 0,
+    'overview': 3,
+    'hives_place': 7,
+    'add_hives_place': 2,
+    'edit_hives_place': 3,
+    'remove_hives_place': 13,
+    'add_hive': 3,
+    'add_hive_post': 10,
+    'remove_hive': 16,
+    'move_hive': 3,
+    'move_hive_post': 20,
+    'mothers': 6,
+    'add_mother': 4,
+    'edit_mother': 4,
+    'remove_mother': 7,
+    'erase_mother': 8,
+    'move_mother': 3,
+    'visits': 7,
+    'add_visit': 7,
+    'add_visits': 5,
+    'add_visits_post': 19,
+    'import_visits': 2,
+    'export_records': 3,
+    'analytics': 3,
+    'analytics_scope': 4,
+    'remove_visit': 16,
+    'edit_visit': 5,
+    'api_collection': 5,
+    'api_item': 5,
+    'api_sync': 5,
+}
+
+
+class QueryBudgetTestCase(TestCase):
+    # Časy požadavků (název, velikost) -> sekundy, vypíší se při PERF_REPORT=1
+    timings = {}
+    max_request_seconds = float(os.environ.get('PERF_MAX_REQUEST_SECONDS', 5))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get('PERF_REPORT'):
+            for (name, scale), seconds in sorted(cls.timings.items()):
+                print(f'{name:<24} {str(scale):<16} {seconds * 1000:8.1f} ms')
+
+    def build(self, places_count, hives_per_place, years):
+        user = Beekeepers.objects.create(username=f'perf-{places_count}-{hives_per_place}-{years}',
+                                         beekeeper_id=places_count * 10000 + hives_per_place * 10 + years)
+        places = HivesPlaces.objects.bulk_create([
+            HivesPlaces(beekeeper=user, name=f'Stanoviště {index}', type='Stálé', location='Obec', comment='')
+            for index in range(places_count + 1)
+        ])
+        # Poslední stanoviště zůstává prázdné jako cíl přesunů
+        target_place = places.pop()
+        hives = Hives.objects.bulk_create([
+            Hives(place=place, number=number, type='Langstroth', comment='')
+            for place in places for number in range(1, hives_per_place + 1)
+        ])
+        mothers = Mothers.objects.bulk_create([
+            Mothers(hive=hive, mark=f'{user.beekeeper_id}-{hive.id}', year=2020, male_line='', female_line='Carnica',
+                    comment='')
+            for hive in hives
+        ])
+        daughter = Mothers.objects.create(hive=hives[1], ancestor=mothers[0], mark=f'{user.beekeeper_id}-D',
+                                          year=2021, male_line='', female_line='Carnica', comment='')
+        removed_mother = Mothers.objects.create(hive=hives[1], mark=f'{user.beekeeper_id}-R', year=2019,
+                                                male_line='', female_line='', comment='', active=False)
+        visits = Visits.objects.bulk_create([
+            Visits(hive=hive, date=f'{2023 - year}-{month:02d}-01', inspection_type='Běžná', condition=3,
+                   hive_body_size=2, honey_supers_size=1, honey_yield=10 if month == 7 else None,
+                   mite_drop=5 if month == 8 else None, medication_application='Gabon' if month == 9 else None)
+            for hive in hives for year in range(years) for month in range(4, 10)
+        ])
+        task = Tasks.objects.get_or_create(name='Krmení')[0]
+        PerformedTasks = Visits.performed_tasks.through
+        PerformedTasks.objects.bulk_create([PerformedTasks(visits_id=visit.id, tasks_id=task.id) for visit in visits])
+        HiveStatus.objects.rebuild()
+        HiveSeasonRollup.objects.rebuild()
+        # Aktuální statistiky jako po autovacuum, jinak plánovač vychází z dat předchozích testů
+        with connection.cursor() as cursor:
+            for model in (HivesPlaces, Hives, Mothers, Visits, PerformedTasks, HiveStatus, HiveSeasonRollup,
+                          PlaceSeasonRollup):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return {
+            'user': user, 'place': places[0], 'target_place': target_place, 'hives': hives[:hives_per_place],
+            'hive': hives[0], 'mother': mothers[0], 'daughter': daughter, 'removed_mother': removed_mother,
+            'visit': Visits.objects.filter(hive=hives[0]).latest('date'), 'task': task,
+        }
+
+    def request_plan(self, data):
+        place, hive, mother, visit = data['place'], data['hive'], data['mother'], data['visit']
+        bulk_visits = {
+            'date': '2024-05-01', 'inspection_type': 'Běžná',
+            'form-TOTAL_FORMS': len(data['hives']), 'form-INITIAL_FORMS': len(data['hives']),
+        }
+        for index, row_hive in enumerate(data['hives']):
+            bulk_visits.update({
+                f'form-{index}-hive': row_hive.id, f'form-{index}-include': 'on', f'form-{index}-condition': 3,
+                f'form-{index}-hive_body_size': 2, f'form-{index}-honey_supers_size': 1,
+                f'form-{index}-performed_tasks': [data['task'].id],
+            })
+        return [
+            ('index', 'get', reverse('index'), None),
+            ('login_required_message', 'get', reverse('login_required_message'), None),
+            ('overview', 'get', reverse('overview'), None),
+            ('hives_place', 'get', reverse('hives_place', args=[place.id]), None),
+            ('add_hives_place', 'get', reverse('add_hives_place'), None),
+            ('edit_hives_place', 'get', reverse('edit_hives_place', args=[place.id]), None),
+            ('remove_hives_place', 'get', reverse('remove_hives_place', args=[place.id]), None),
+            ('add_hive', 'get', reverse('add_hive', args=[place.id]), None),
+            ('add_hive_post', 'post', reverse('add_hive', args=[place.id]),
+             {'type': 'Langstroth', 'comment': '', 'count': 10}),
+            ('remove_hive', 'get', reverse('remove_hive', args=[hive.id]), None),
+            ('move_hive', 'get', reverse('move_hive', args=[place.id]), None),
+            ('move_hive_post', 'post', reverse('move_hive', args=[place.id]),
+             {'selected_hives': [row_hive.id for row_hive in data['hives']],
+              'new_hives_place': data['target_place'].id}),
+            ('mothers', 'get', reverse('mothers', args=[mother.id]), None),
+            ('add_mother', 'get', reverse('add_mother', args=[hive.id]), None),
+            ('edit_mother', 'get', reverse('edit_mother', args=[mother.id]), None),
+            ('remove_mother', 'get', reverse('remove_mother', args=[data['daughter'].id]), None),
+            ('erase_mother', 'get', reverse('erase_mother', args=[data['removed_mother'].id]), None),
+            ('move_mother', 'get', reverse('move_mother', args=[mother.id]), None),
+            ('visits', 'get', reverse('visits', args=[hive.id]), None),
+            ('add_visit', 'get', reverse('add_visit', args=[hive.id]), None),
+            ('add_visits', 'get', reverse('add_visits', args=[place.id]), None),
+            ('add_visits_post', 'post', reverse('add_visits', args=[place.id]), bulk_visits),
+            ('import_visits', 'get', reverse('import_visits'), None),
+            ('export_records', 'get', reverse('export_records', args=['visits', 'csv']), None),
+            ('analytics', 'get', reverse('analytics'), None),
+            ('analytics_scope', 'get', reverse('analytics_scope', args=['place', place.id]), {'bucket': 'season'}),
+            ('remove_visit', 'get', reverse('remove_visit', args=[visit.id]), None),
+            ('edit_visit', 'get', reverse('edit_visit', args=[visit.id]), None),
+            ('api_collection', 'get', reverse('api_collection', args=['hives']),
+             {'place': place.id, 'include': 'mothers,statuses'}),
+            ('api_item', 'get', reverse('api_item', args=['places', place.id]), {'include': 'hives,statuses'}),
+            # První stránka po jedné změně, větší stránka by podle velikosti dat obsahovala různé zdroje
+            ('api_sync', 'get', reverse('api_sync'), {'limit': 1}),
+            # Odhlášení se nevrací (klient zahodí cookie), přihlašovací stránky se proto měří až po něm
+            ('logout_user', 'get', reverse('logout_user'), None),
+            ('login_user', 'get', reverse('login_user'), None),
+            ('signup', 'get', reverse('signup'), None),
+        ]
+
+    def test_every_route_has_budget(self):
+        # Pojmenované routy projektu (admin je vložený resolver bez jména)
+        names = {getattr(pattern, 'name', None) for pattern in get_resolver().url_patterns} - {None}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+        self.assertEqual(names - {name for name, *request in self.request_plan(self.build(1, 2, 1))},
+                         set())
+
+    def test_query_budgets(self):
+        for scale in PERFORMANCE_SCALES:
+            data = self.build(*scale)
+            self.client.force_login(data['user'])
+            for name, method, url, payload in self.request_plan(data):
+                with self.subTest(view=name, scale=scale):
+                    cache.clear()
+                    # Zprávy předchozích zápisů by měnily cestu stránek s podmíněným GET
+                    self.client.cookies.pop('messages', None)
+                    # Zapisující požadavky se vrací zpět, aby další měřily stejná data
+                    with transaction.atomic():
+                        with self.assertNumQueries(QUERY_BUDGETS[name]):
+                            started = time.perf_counter()
+                            response = getattr(self.client, method)(url, payload)
+                            if response.streaming:
+                                b''.join(response.streaming_content)
+                            self.timings[name, scale] = time.perf_counter() - started
+                        transaction.set_rollback(True)
+                    self.assertLess(response.status_code, 400)
+                    self.assertLess(self.timings[name, scale], self.max_request_seconds)
+            self.client.logout()
+
+
+class SyntheticDataTestCase(TestCase):
+    def test_generated_data_is_reproducible(self):
+        first = generate(seed=7, places=2, hives=3, seasons=3, last_season=2023, prefix='a')
+        second = generate(seed=7, places=2, hives=3, seasons=3, last_season=2023, prefix='b')
+        self.assertEqual(first, second)
+        self.assertEqual((first.places, first.hives, first.visits), (2, 6, 6 * 3 * 26))
+
+        def history(prefix):
+            return list(
+                Visits.objects.filter(hive__place__beekeeper__username__startswith=prefix)
+                .order_by('hive__place__name', 'hive__number', 'date')
+                .values_list('date', 'condition', 'honey_yield', 'mite_drop')
+            )
+
+        self.assertEqual(history('a'), history('b'))
+        self.assertEqual(Mothers.objects.filter(mark__startswith='a-', active=True).count(), 6)
+        self.assertTrue(HiveStatus.objects.filter(hive__place__beekeeper__username__startswith='a').exists())
+
+    def test_benchmark_and_commands(self):
+        call_command('generate_data', seed=1, places=1, hives=2, seasons=1, last_season=2023, stdout=StringIO())
+        beekeeper = Beekeepers.objects.get(username__startswith='synth')
+        results = run_benchmark(beekeeper, iterations=3, warmup=0, host='testserver')
+        results = {result.name: result for result in results}
+        self.assertEqual(results['hives_place'].requests, 3)
+        self.assertLessEqual(results['hives_place'].p50, results['hives_place'].p99)
+        self.assertEqual((results['visits'].max_queries, results['visits'].errors), (QUERY_BUDGETS['visits'], 0))
+
+        output = StringIO()
+        call_command('benchmark_views', beekeeper=beekeeper.username, iterations=1, endpoint=['overview'],
+                     host='testserver', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+
+class RequestInstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec', comment='')
+        self.client.login(username='testuser', password='testpassword')
+        cache.clear()
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('myapp.requests', level='INFO') as logs:
+            response = self.client.get(reverse('overview'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="3 queries", tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=[\d.]+$')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['queries']), ('/overview/', 200, 3))
+        self.assertEqual(record['user'], self.user.pk)
+        self.assertEqual((record['duplicate_queries'], record['similar_queries']), (0, 0))
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(record['view_ms'], record['total_ms'])
+        self.assertNotIn('query_list', record)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_logs_queries(self):
+        with self.assertLogs('myapp.requests', level='WARNING') as logs:
+            self.client.get(reverse('overview'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertEqual(len(record['query_list']), record['queries'])
+
+    def test_duplicate_detection(self):
+        stats = RequestStats(max_queries=2)
+        for sql, params in (('SELECT * FROM myapp_mothers WHERE hive_id = %s', (1,)),
+                            ('SELECT * FROM myapp_mothers WHERE hive_id = %s', (2,)),
+                            ('SELECT * FROM myapp_mothers WHERE hive_id = %s', (1,)),
+                            ('SELECT 1', ())):
+            stats.record(sql, params, 0.001)
+        self.assertEqual(stats.duplicate_queries(), 1)
+        self.assertEqual(stats.similar_queries(), {'SELECT * FROM myapp_mothers WHERE hive_id = %s': 3})
+        # Parametry se uchovávají jen u prvních max_queries dotazů
+        self.assertEqual((stats.query_count, len(stats.queries)), (4, 2))
+        self.assertAlmostEqual(stats.db_time, 0.004)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0, SLOW_REQUEST_MAX_QUERIES=1)
+    def test_slow_request_query_list_is_capped(self):
+        with self.assertLogs('myapp.requests', level='WARNING') as logs:
+            self.client.get(reverse('overview'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((len(record['query_list']), record['query_list_omitted']), (1, record['queries'] - 1))
+
+
+class ConnectionReuseTestCase(TransactionTestCase):
+    # Přes WSGI se spojení zavírají na konci požadavku, v transakci TestCase to nejde
+    def setUp(self):
+        self.user = Beekeepers.objects.create_user(username='testuser', password='testpassword', beekeeper_id=1)
+        HivesPlaces.objects.create(beekeeper=self.user, name='Zahrada', type='Stálé', location='Obec', comment='')
+
+    def test_conn_max_age(self):
+        original = connection.settings_dict['CONN_MAX_AGE']
+        transport = WsgiTransport(self.user, 'testserver')
+        try:
+            for max_age, reused in ((0, False), (60, True)):
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                self.assertEqual(transport.get(reverse('overview')), 200)
+                self.assertEqual(connection.connection is not None, reused)
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original
+
+    def test_compare_conn_max_age(self):
+        results = compare_conn_max_age(self.user, [0, 60], iterations=2, warmup=0, names=['overview'],
+                                       host='testserver')
+        self.assertEqual(list(results), [0, 60])
+        self.assertEqual([result.errors for result in results[0] + results[60]], [0, 0])
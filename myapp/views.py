@@ -1,19 +1,33 @@
 from collections import Counter
+from datetime import date
+from django.conf import settings
 from django.contrib.auth import login, logout, authenticate
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.http import Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 from django.db import transaction, models
-from django.db.models import Count, Value, Max, Avg, Subquery, OuterRef, F
-from django.db.models.query_utils import Q
-from django.db.models.functions import Coalesce
+from django.db.models import Max
 from myapp.forms import (
     LoginForm, RegisterForm, AddHivesPlace, AddHive, AddMother, AddVisit,
-    ChangeHivesPlace, ChangeMotherHive, EditVisit, EditHivesPlace
+    ChangeHivesPlace, ChangeMotherHive, EditVisit, EditHivesPlace, BulkVisitHeader, BulkVisitFormSet,
+    ImportVisits
+)
+from myapp.analytics import BUCKETS, time_series
+from myapp.caching import cached_overview_summary, conditional_page, invalidate_overview
+from myapp.dashboard import hive_rows
+from myapp.deactivation import deactivate_hive, deactivate_mother, deactivate_place, deactivate_visit
+from myapp.exporting import EXPORTS, EXPORT_FORMATS, stream_export
+from myapp.genealogy import lineage
+from myapp.importing import detect_format, import_visits as import_visit_records, iter_records, text_stream
+from myapp.bulk import create_hive_batch
+from myapp.numbering import free_hive_numbers
+from myapp.ownership import owned
+from myapp.models import (
+    Hives, HivesPlaces, Beekeepers, Visits, Mothers, Tasks, HiveStatus, PlaceSeasonRollup,
+    lock_places, refresh_hive_summaries
 )
-from myapp.models import Hives, HivesPlaces, Beekeepers, Visits, Mothers, Tasks
 
 
 def index(request):
@@ -77,241 +91,36 @@ def login_required_message(request):
 
 @login_required
 def overview(request):
-    # Přehled aktivních stanovišť
-    hives_places_count = HivesPlaces.objects.filter(beekeeper=request.user, active=True).count()
-    hives_count = Hives.objects.filter(place__beekeeper=request.user, active=True).count()
-    hives_places = HivesPlaces.objects.filter(beekeeper=request.user, active=True)
-    results_to_dicts = HivesPlaces.objects.filter(beekeeper=request.user, active=True).annotate(
-        avg_honey_yield=Avg('hives__visits__honey_yield'),
-        avg_condition=Avg('hives__visits__condition'),
-    )
-
-    avg_honey_yield_dict = {result.name: result.avg_honey_yield for result in results_to_dicts}
-    avg_condition_dict = {result.name: result.avg_condition for result in results_to_dicts}
-
-    hives_places_dict = (
-        HivesPlaces.objects
-        .filter(beekeeper=request.user, active=True)
-        .annotate(hives_count=Coalesce(Count('hives', filter=Q(hives__active=True), distinct=True), Value(0)))
-        .values('name', 'hives_count')
-    )
-    hives_places_dict = {item['name']: item['hives_count'] for item in hives_places_dict}
-
-    mothers_count_list = (
-        Mothers.objects
-        .filter(Q(hive__active=True), hive__place__beekeeper=request.user, active=True)
-        .annotate(mothers_count=Coalesce(Count('id', distinct=True), Value(0)))
-        .values('hive__place__name', 'mothers_count')
-    )
-
-    mothers_count_dict = {}
-    for item in mothers_count_list:
-        place_name = item['hive__place__name']
-        mothers_count = item['mothers_count']  # Corrected variable name
-
-        if place_name in mothers_count_dict:
-            mothers_count_dict[place_name] += mothers_count
-        else:
-            mothers_count_dict[place_name] = mothers_count
-
-    # Poslední návštěvy na aktivních stanovištích
-    last_visit_date = (
-        Visits.objects
-        .filter(hive__place__beekeeper=request.user, active=True)
-        .values('hive__place__name')
-        .annotate(last_visit=Max('date'))
-    )
-
-    last_visit_date = {item['hive__place__name']: item['last_visit'] for item in last_visit_date}
-
-    # Naposledy provedené úkony během návštěvy včelstva
-    last_tasks_subquery = Visits.objects.filter(
-        hive__place=OuterRef('pk'),
-        hive__active=True,
-        active=True,
-        performed_tasks__isnull=False
-    ).order_by('-date', 'hive__number').values(last_performed_task=ArrayAgg('performed_tasks__name'))[:1]
-
-    places_with_last_performed_tasks = HivesPlaces.objects.filter(
-        beekeeper=request.user,
-        active=True
-    ).annotate(
-        last_performed_tasks=Subquery(last_tasks_subquery)
-    ).values('name', 'last_performed_tasks')
-
-    tasks_dict = {item['name']: item['last_performed_tasks'] for item in places_with_last_performed_tasks}
-
-    # Vytvoření slovníku průměrných hodnot 'mite_drop' pro jednotlivá stanoviště
-    last_mite_drop_subquery = (
-        Visits.objects
-        .filter(
-            hive=OuterRef('pk'),
-            mite_drop__isnull=False,
-            active=True
-        )
-        .order_by('-date')
-        .values('mite_drop')[:1]
-    )
-
-    places_with_avg_mite_drop = Hives.objects.filter(
-        place__beekeeper=request.user,
-        active=True,
-    ).annotate(
-        avg_mite_drop=Subquery(last_mite_drop_subquery)
-    ).exclude(
-        avg_mite_drop__isnull=True
-    ).values('place__name').annotate(
-        avg_mite_drop=Avg('avg_mite_drop')
-    )
-
-    mite_drop_dict = {item['place__name']: item['avg_mite_drop'] for item in places_with_avg_mite_drop}
-
-    # Vytvoření slovníků pro poslední datum aplikace léčiva
-    last_medication_subquery = Visits.objects.filter(
-        hive__place=OuterRef('pk'),
-        medication_application__gt='',
-        active=True
-    ).order_by('-date').values('medication_application', 'date')[:1]
-
-    places_with_last_medical_application = HivesPlaces.objects.filter(
-        beekeeper=request.user,
-        active=True,
-    ).annotate(
-        last_medication=Subquery(last_medication_subquery.values('medication_application')),
-        last_medication_date=Subquery(last_medication_subquery.values('date'))
-    ).values('name', 'last_medication', 'last_medication_date')
-
-    medical_application_dict = {item['name']: item['last_medication']
-                                for item in places_with_last_medical_application}
-    medical_application_date_dict = {item['name']: item['last_medication_date']
-                                     for item in places_with_last_medical_application}
+    # Souhrn aktivních stanovišť (počty, průměry, poslední prohlídka, úkony a léčivo), uložený v cache
+    summary = cached_overview_summary(request.user)
 
     # Varování před smazáním stanoviště s aktivními včelstvy
     warning = "Chystáte se odstranit stanoviště i se včelstvy. " \
               "Pokud chcete včelstva zachovat, nejprve je přemístěte na jiné stanoviště."
 
-    # Vykreslení šablony iverview a předání všech potřebných dat
+    # Vykreslení šablony overview a předání všech potřebných dat
     return render(request, 'overview.html', {
-        'hives_places_count': hives_places_count,
-        'hives_count': hives_count,
-        'mothers_count_dict': mothers_count_dict,
-        'avg_honey_yield_dict': avg_honey_yield_dict,
-        'avg_condition_dict': avg_condition_dict,
-        'mite_drop_dict': mite_drop_dict,
-        'hives_places': hives_places,
-        'hives_places_dict': hives_places_dict,
-        'medical_application_dict': medical_application_dict,
-        'medical_application_date_dict': medical_application_date_dict,
-        'tasks_dict': tasks_dict,
-        'last_visit_date': last_visit_date,
+        **summary,
         'warning': warning
     })
 
 
-def get_next_hive_number(hives_place_id):
-    used_numbers = Hives.objects.filter(place__id=hives_place_id, active=True).values_list('number', flat=True)
-    current_number = 1
-    while current_number in used_numbers:
-        current_number += 1
-
-    return current_number
-
-
 @login_required
+@conditional_page
 def hives_place(request, hives_place_id=None):
     try:
         # Získání aktivního stanoviště
         user_hives_place = get_object_or_404(HivesPlaces, id=hives_place_id, beekeeper=request.user, active=True)
-        hives = Hives.objects.filter(place=user_hives_place, active=True)
-        hives_count = hives.count()
-
-        # Poslední návštěvy na aktivních včelstvech na stanovišti
-        last_visits = (
-            Visits.objects
-            .filter(hive__place__beekeeper=request.user, hive__place=hives_place_id, active=True)
-            .values('hive__id', 'hive_body_size', 'honey_supers_size', 'condition')
-            .annotate(last_visit=Max('date'))
-        )
-        last_visits_date = {item['hive__id']: item['last_visit'] for item in last_visits}
-        hive_size = {item['hive__id']: f"{item['hive_body_size']}+{item['honey_supers_size']}" for item in last_visits}
-        hive_condition = {item['hive__id']: item['condition'] for item in last_visits}
-
-        # Získání matky pro aktivní včelstvo
-        hives_dict = {}
-        mothers_dict = {}
-        years_dict = {}
-        for hive in hives:
-            mother = (
-                Mothers.objects
-                .filter(hive=hive, active=True)
-                .first()
-            )
-
-            if mother:
-                hives_dict[hive.id] = mother.mark
-                mothers_dict[hive.id] = mother.id
-                years_dict[hive.id] = mother.year
-            else:
-                hives_dict[hive.id] = None
-
-        # slovník poslední hodnoty medného výnosu zaznamenané při prohlídkách včelstev na stanovišti
-        last_honey_yield_dict = {
-            hive.id: {'value': hive.last_honey_yield().honey_yield if hive.last_honey_yield() else None,
-                      'date': hive.last_honey_yield().date if hive.last_honey_yield() else None}
-            for hive in hives
-        }
-
-        # slovník poslední hodnoty spadu roztočů zaznamenané při prohlídkách včelstev na stanovišti
-        last_mite_drop_dict = {
-            hive.id: {'value': hive.last_mite_drop().mite_drop if hive.last_mite_drop() else None,
-                      'date': hive.last_mite_drop().date if hive.last_mite_drop() else None}
-            for hive in hives
-        }
-
-        # slovník poslední aplikace léčiva při prohlídkách včelstev na stanovišti
-        last_medication_application_dict = {}
-        for hive in hives:
-            last_medication_application_dict[hive.id] = {
-                'value': (
-                    hive.last_medication_application().medication_application
-                    if hive.last_medication_application() else None
-                ),
-                'date': hive.last_medication_application().date if hive.last_medication_application() else None
-            }
-
-        # slovník poslední příznaky nemoci při prohlídkách včelstev na stanovišti
-        last_disease_dict = {
-            hive.id: {'value': hive.last_disease().disease if hive.last_disease() else None,
-                      'date': hive.last_disease().date if hive.last_disease() else None}
-            for hive in hives
-        }
-
-        # slovník poslední komentář při prohlídkách včelstev na stanovišti
-        last_comment_dict = {
-            hive.id: {'value': hive.last_comment().comment if hive.last_comment() else None,
-                      'date': hive.last_comment().date if hive.last_comment() else None}
-            for hive in hives
-        }
+        # Řádky tabulky včelstev včetně matek a posledních hodnot prohlídek ze souhrnů stavu
+        hives = hive_rows(user_hives_place)
 
         form = ChangeHivesPlace(user=request.user, hives_place_id=hives_place_id)
         return render(request, 'overview.html', {
             'overview_spec': 'hives',
             'hives': hives,
-            'hives_count': hives_count,
-            'hives_dict': hives_dict,
-            'mothers_dict': mothers_dict,
-            'years_dict': years_dict,
+            'hives_count': len(hives),
             'hives_place_id': hives_place_id,
             'hives_place_name': user_hives_place.name,
-            'last_visits': last_visits,
-            'last_visits_date': last_visits_date,
-            'hive_size': hive_size,
-            'hive_condition': hive_condition,
-            'last_honey_yield_dict': last_honey_yield_dict,
-            'last_mite_drop_dict': last_mite_drop_dict,
-            'last_medication_application_dict': last_medication_application_dict,
-            'last_disease_dict': last_disease_dict,
-            'last_comment_dict': last_comment_dict,
             'form': form
         })
     except Http404:
@@ -331,6 +140,7 @@ def add_hives_place(request):
             hives_place = form.save(commit=False)
             hives_place.beekeeper = beekeeper_id  # Přiřazení přihlášeného uživatele
             hives_place.save()
+            invalidate_overview(request.user.id)
             messages.success(request, 'Nové stanoviště bylo vytvořeno.')
             return redirect('overview')  # Přesměrování na domovskou stránku nebo jinam po úspěšném vytvoření
     else:
@@ -340,26 +150,10 @@ def add_hives_place(request):
 
 
 @login_required
-def remove_hives_place(request, hives_place_id=None):
-    try:
-        hives_place = get_object_or_404(HivesPlaces, beekeeper=request.user, id=hives_place_id, active=True)
-    except Http404:
-        messages.error(request, "Úprava záznamů pro přihlášeného uživatele není možná.")
-        return redirect('overview')
-
-    with transaction.atomic():
-        # Deaktivace stanoviště
-        hives_place.active = False
-        hives_place.save()
-
-        # Získání všech včelstev na stanovišti
-        hives_in_place = hives_place.hives.all()
-
-        # Deaktivace všech včelstev, matek a návštěv
-        Hives.objects.filter(id__in=hives_in_place).update(active=False)
-        Mothers.objects.filter(hive__in=hives_in_place).update(active=False)
-        Visits.objects.filter(hive__in=hives_in_place).update(active=False)
-
+@owned('place', 'hives_place_id', "Úprava záznamů pro přihlášeného uživatele není možná.", active=True)
+def remove_hives_place(request, hives_place):
+    deactivate_place(hives_place)
+    invalidate_overview(request.user.id)
     if hives_place.hives.count() > 0:
         messages.success(request, f'Stanoviště {hives_place.name} bylo úspěšně smazáno včetně jeho včelstev.')
     else:
@@ -368,17 +162,14 @@ def remove_hives_place(request, hives_place_id=None):
 
 
 @login_required
-def edit_hives_place(request, hives_place_id):
-    try:
-        user_hives_place = get_object_or_404(HivesPlaces, beekeeper=request.user, id=hives_place_id, active=True)
-    except Http404:
-        messages.error(request, "Záznamy o vybraném stanivšti pro přihlášeného uživatele nejsou k dispozici...")
-        return redirect('overview')
-
+@owned('place', 'hives_place_id', "Záznamy o vybraném stanivšti pro přihlášeného uživatele nejsou k dispozici...",
+       active=True)
+def edit_hives_place(request, user_hives_place):
     if request.method == 'POST':
         form = EditHivesPlace(request.POST, instance=user_hives_place)
         if form.is_valid():
             form.save()
+            invalidate_overview(request.user.id)
             messages.success(request, "Editace stanoviště proběhla úspěšně.")
             return redirect('overview')
 
@@ -389,28 +180,32 @@ def edit_hives_place(request, hives_place_id):
 
 
 @login_required
-def add_hive(request, hives_place_id=None):
-    try:
-        hives_place = get_object_or_404(HivesPlaces, id=hives_place_id, active=True)
-    except Http404:
-        messages.error(request, "Záznamy o stanovišti pro přihlášeného uživatele nejsou k dispozici.")
-        return redirect('overview')
-
-    # Kontrola, zda přihlášený uživatel odpovídá beekeeperovi v HivesPlaces
-    if request.user.id != hives_place.beekeeper.id:
-        messages.error(request, 'Nemáte oprávnění přidávat včelstvo na toto stanoviště.')
-        return redirect('overview')
-
+@owned('place', 'hives_place_id', "Záznamy o stanovišti pro přihlášeného uživatele nejsou k dispozici.", active=True)
+def add_hive(request, hives_place):
     if request.method == 'POST':
         form = AddHive(request.POST)
         if form.is_valid():
-            hive = form.save(commit=False)
-            hive.number = get_next_hive_number(hives_place_id)
-            hive.place_id = hives_place.id
-            hive.save()
-            messages.success(request, f'Bylo vytvořeno včelstvo č. {hive.number} '
-                                      f'na stanovišti {hives_place.name}')
-            return redirect('hives_place', hives_place_id)
+            try:
+                hives = create_hive_batch(
+                    hives_place.id,
+                    hive_type=form.cleaned_data['type'],
+                    comment=form.cleaned_data['comment'],
+                    count=form.cleaned_data.get('count') or 1,
+                    mother_data=form.mother_data(),
+                    visit_data=form.visit_data(),
+                )
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                invalidate_overview(request.user.id)
+                if len(hives) == 1:
+                    messages.success(request, f'Bylo vytvořeno včelstvo č. {hives[0].number} '
+                                              f'na stanovišti {hives_place.name}')
+                else:
+                    messages.success(request, f'Bylo vytvořeno {len(hives)} včelstev '
+                                              f'(č. {", ".join(str(hive.number) for hive in hives)}) '
+                                              f'na stanovišti {hives_place.name}')
+                return redirect('hives_place', hives_place.id)
     else:
         form = AddHive()
 
@@ -418,53 +213,55 @@ def add_hive(request, hives_place_id=None):
 
 
 @login_required
-def remove_hive(request, hive_id=None):
-    try:
-        hive = get_object_or_404(Hives, place__beekeeper=request.user, id=hive_id, active=True)
-    except Http404:
-        messages.error(request, "Úprava záznamů o včelstvu pro přihlášeného uživatele není možná.")
-        return redirect('overview')
-
-    with transaction.atomic():
-        # Deaktivace stanoviště
-        hive.active = False
-        hive.save()
-
-        # Deaktivace matky a návštěv
-        Mothers.objects.filter(hive=hive).update(active=False)
-        Visits.objects.filter(hive=hive).update(active=False)
-
-        messages.success(request, f'Včelstvo {hive.number} na stanovišti {hive.place.name} bylo úspěšně smazáno.')
+@owned('hive', 'hive_id', "Úprava záznamů o včelstvu pro přihlášeného uživatele není možná.", active=True)
+def remove_hive(request, hive):
+    deactivate_hive(hive)
+    invalidate_overview(request.user.id)
+    messages.success(request, f'Včelstvo {hive.number} na stanovišti {hive.place.name} bylo úspěšně smazáno.')
     return redirect('hives_place', hive.place_id)
 
 
 @login_required
+@owned('place', 'old_hives_place', "Úprava záznamů o včelstvu není možná.")
 def move_hive(request, old_hives_place):
     try:
         user = request.user
-        hive_ids = Hives.objects.filter(place__beekeeper=user, active=True)
-        hive_place_ids = list(HivesPlaces.objects.filter(beekeeper=user, active=True).values_list('id', flat=True))
-        old_hives_place = HivesPlaces.objects.filter(id=old_hives_place).first()
-
         if request.method == 'POST':
             form = ChangeHivesPlace(user=request.user, hives_place_id=old_hives_place.id, data=request.POST)
             if form.is_valid():
-                selected_hive_ids = form.cleaned_data['selected_hives']
+                selected_hive_ids = [hive.id for hive in form.cleaned_data['selected_hives']]
                 new_hives_place = form.cleaned_data['new_hives_place']
 
-                if not set(selected_hive_ids).issubset(set(hive_ids)) or new_hives_place.id not in hive_place_ids:
-                    messages.error(request, f"Vybraná včelstva nebo nové stanoviště nepatří přihlášenému uživateli.")
-                    return redirect('overview')
-                new_numbers = []
                 with transaction.atomic():
-                    for selected_hive_id in selected_hive_ids:
-                        selected_hive = Hives.objects.get(id=selected_hive_id.id)
+                    # Zdrojová i cílová stanoviště se zamknou najednou ve stejném pořadí jako při přepočtu
+                    # souhrnů, opačné přesuny (A→B a B→A) na sebe tak nemohou čekat do kruhu. Zámek cílového
+                    # stanoviště zároveň serializuje souběžné přesuny a zakládání včelstev na něj.
+                    old_place_ids = set(
+                        Hives.objects.filter(id__in=selected_hive_ids).values_list('place_id', flat=True)
+                    )
+                    place_ids = lock_places(old_place_ids | {new_hives_place.id})
+                    # Vlastnictví a aktivita se ověří až na zamčených stanovištích
+                    new_hives_place = get_object_or_404(HivesPlaces, id=new_hives_place.id, beekeeper=user, active=True)
+                    selected_hives = list(
+                        Hives.objects
+                        .filter(id__in=selected_hive_ids, place_id__in=place_ids, place__beekeeper=user, active=True)
+                        .order_by('place_id', 'number')
+                    )
+                    if len(selected_hives) != len(selected_hive_ids):
+                        messages.error(request, "Vybraná včelstva nebo nové stanoviště nepatří přihlášenému uživateli.")
+                        return redirect('overview')
+
+                    old_numbers = [hive.number for hive in selected_hives]
+                    new_numbers = free_hive_numbers(new_hives_place.id, len(selected_hives))
+                    for selected_hive, new_number in zip(selected_hives, new_numbers):
                         selected_hive.place = new_hives_place
-                        selected_hive.number = get_next_hive_number(new_hives_place.id)
-                        new_numbers.append(selected_hive.number)
-                        selected_hive.save()
+                        selected_hive.number = new_number
+                    Hives.objects.bulk_update(selected_hives, ['place', 'number'])
+                    HiveStatus.objects.recompute(selected_hive_ids)
+                    PlaceSeasonRollup.objects.recompute(place_ids)
 
-                    messages.success(request, f'Včelstva ({", ".join(map(str, selected_hive_ids))}'
+                    invalidate_overview(request.user.id)
+                    messages.success(request, f'Včelstva ({", ".join(map(str, old_numbers))}'
                                               f') byla přemístěna ze stanoviště {old_hives_place.name}'
                                               f' na stanoviště {new_hives_place.name}'
                                               f' a očíslována({", ".join(map(str, new_numbers))}).'
@@ -476,32 +273,32 @@ def move_hive(request, old_hives_place):
             return redirect('hives_place', old_hives_place.id)
     except Http404:
         messages.error(request, "Úprava záznamů o včelstvu není možná.")
-        return redirect('hives_place', old_hives_place.id)
+        return redirect('overview')
 
     return redirect('hives_place', old_hives_place.id)
 
 
 @login_required
+@conditional_page
 def mothers(request, mother_id=None):
     try:
-        mother = get_object_or_404(Mothers, id=mother_id, hive__place__beekeeper=request.user)
-        ancestors = []
-        current_ancestor = mother.ancestor
-        while current_ancestor:
-            ancestors.append(current_ancestor)
-            current_ancestor = current_ancestor.ancestor
-
-        descendants = Mothers.objects.filter(ancestor=mother_id)
-        sisters = Mothers.objects.filter(ancestor=mother.ancestor, ancestor__isnull=False).exclude(id=mother.id)
+        mother = get_object_or_404(
+            Mothers.objects.select_related('hive__place'),
+            id=mother_id,
+            hive__place__beekeeper=request.user
+        )
+        # Předci, potomci a ostatní příbuzní jedním dotazem přes cesty rodokmenu
+        mother_lineage = lineage(mother)
 
         form = ChangeMotherHive(user=request.user, mother=mother)
 
         return render(request, 'overview.html', {
             'overview_spec': 'mothers',
             'mother': mother,
-            'ancestors': ancestors,
-            'descendants': descendants,
-            'sisters': sisters,
+            'ancestors': mother_lineage.ancestors,
+            'descendants': mother_lineage.descendants,
+            'sisters': mother_lineage.sisters,
+            'collaterals': mother_lineage.collaterals,
             'form': form
         })
 
@@ -511,88 +308,62 @@ def mothers(request, mother_id=None):
 
 
 @login_required
-def remove_mother(request, mother_id=None):
-    try:
-        mother = get_object_or_404(Mothers, hive__place__beekeeper=request.user, id=mother_id, active=True)
-    except Http404:
-        messages.error(request, "Úprava záznamů o matce pro přihlášeného uživatele není možná.")
-        return redirect('overview')
-
-    with transaction.atomic():
-        # Deaktivace matky
-        mother.active = False
-        mother.save()
-
-        messages.success(request, f'Matka {mother.mark} na stanovišti {mother.hive.place.name} byla zrušena.')
+@owned('mother', 'mother_id', "Úprava záznamů o matce pro přihlášeného uživatele není možná.", active=True)
+def remove_mother(request, mother):
+    deactivate_mother(mother)
+    invalidate_overview(request.user.id)
+    messages.success(request, f'Matka {mother.mark} na stanovišti {mother.hive.place.name} byla zrušena.')
     return redirect('hives_place', mother.hive.place_id)
 
 
 @login_required
-def erase_mother(request, mother_id=None):
-    try:
-        mother = get_object_or_404(Mothers, id=mother_id, hive__place__beekeeper=request.user, active=False)
-        mother.delete()
-        messages.success(request, f'Záznamy o matce {mother.mark}({mother.year}) byly úspěšně odstraněny.')
-
-    except Http404:
-        messages.error(request, "Záznamy o matce pro přihlášeného uživatele nejsou k dispozici.")
+@owned('mother', 'mother_id', "Záznamy o matce pro přihlášeného uživatele nejsou k dispozici.", active=False)
+def erase_mother(request, mother):
+    mother.delete()
+    invalidate_overview(request.user.id)
+    messages.success(request, f'Záznamy o matce {mother.mark}({mother.year}) byly úspěšně odstraněny.')
     return redirect('overview')
 
 
 @login_required
-def move_mother(request, mother_id=None):
+@owned('mother', 'mother_id', "Záznamy o matce pro přihlášeného uživatele nejsou k dispozici.", active=True)
+def move_mother(request, mother):
     try:
-        user = request.user
-        mother = Mothers.objects.get(hive__place__beekeeper=user, active=True, id=mother_id)
-
         if request.method == 'POST':
-            form = ChangeMotherHive(data=request.POST, user=user, mother=mother)
+            form = ChangeMotherHive(data=request.POST, user=request.user, mother=mother)
             if form.is_valid():
-
                 new_hive = form.cleaned_data['new_hive']
 
                 with transaction.atomic():
-                    if mother.hive_id:
-                        old_hive = Hives.objects.get(id=mother.hive_id)
-                        old_hive.mother = None
-                        old_hive.save()
+                    mother.hive = new_hive
+                    mother.save()
 
-                        mother.hive_id = new_hive.id
-                        mother.save()
-
-                        messages.success(request, f"Matka {mother.mark} byla úspěšně přemístěna do včelstva č."
-                                                  f"{new_hive.number} na stanovišti {new_hive.place.name}.")
-                    return redirect('hives_place', new_hive.place_id)
+                invalidate_overview(request.user.id)
+                messages.success(request, f"Matka {mother.mark} byla úspěšně přemístěna do včelstva č."
+                                          f"{new_hive.number} na stanovišti {new_hive.place.name}.")
+                return redirect('hives_place', new_hive.place_id)
             else:
                 messages.error(request, form.errors)
     except Exception as e:
         messages.error(request, f'Chyba při přemisťování matky: {e}')
 
-    return redirect('mothers', mother_id)
+    return redirect('mothers', mother.id)
 
 
 @login_required
-def add_mother(request, hive_id=None):
-    try:
-        selected_hive = get_object_or_404(Hives, id=hive_id, active=True)
-    except Http404:
-        messages.error(request, "Uživatel může přidávat matky pouze do svých včelstev.")
-        return redirect('overview')
-
-    if request.user.id != selected_hive.place.beekeeper.id:
-        messages.error(request, 'Nemáte oprávnění přidávat matku do požadovaného včelstva.')
-        return redirect('overview')
-
+@owned('hive', 'hive_id', "Uživatel může přidávat matky pouze do svých včelstev.", active=True)
+def add_mother(request, selected_hive):
     if request.method == 'POST':
         form = AddMother(request.user, request.POST)
         if form.is_valid():
             mother = form.save(commit=False)
             mother.hive = selected_hive
             mother.save()
+            invalidate_overview(request.user.id)
             messages.success(request, f'Matka byla přidána do včelstva {selected_hive.number} '
                                       f'na stanovišti {selected_hive.place.name} .'
                              )
-            return redirect('hives_place', selected_hive.place.id)
+            return redirect('hives_place', selected_hive.place_id)
     else:
         form = AddMother(request.user)
 
@@ -600,23 +371,19 @@ def add_mother(request, hive_id=None):
 
 
 @login_required
-def edit_mother(request, mother_id=None):
-    try:
-        selected_mother = get_object_or_404(Mothers, id=mother_id, hive__place__beekeeper=request.user, active=True)
-    except Http404:
-        messages.error(request, "Uživatel může editovat údaje pouze o svých matkách.")
-        return redirect('overview')
-
+@owned('mother', 'mother_id', "Uživatel může editovat údaje pouze o svých matkách.", active=True)
+def edit_mother(request, selected_mother):
     if request.method == 'POST':
         form = AddMother(request.user, request.POST, instance=selected_mother)
         if form.is_valid():
             form.save()
+            invalidate_overview(request.user.id)
             messages.success(request, f'Údaje o matce {selected_mother.mark}'
                                       f' ve včelstvu {selected_mother.hive.number} '
                                       f'na stanovišti {selected_mother.hive.place.name} '
                                       f'byly aktualizovány.'
                              )
-            return redirect('hives_place', selected_mother.hive.place.id)
+            return redirect('hives_place', selected_mother.hive.place_id)
     else:
         form = AddMother(request.user, instance=selected_mother)
 
@@ -626,18 +393,51 @@ def edit_mother(request, mother_id=None):
     })
 
 
+def parse_visit_cursor(value):
+    # Kurzor má tvar "<datum>_<id>" poslední zobrazené prohlídky
+    try:
+        cursor_date, cursor_id = value.split('_')
+        return date.fromisoformat(cursor_date), int(cursor_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def visits_page_size(value):
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return settings.VISITS_PAGE_SIZE
+    return max(1, min(page_size, settings.VISITS_MAX_PAGE_SIZE))
+
+
 @login_required
+@conditional_page
 def visits(request, hive_id=None):
     try:
-        user_hive = get_object_or_404(Hives, id=hive_id, place__beekeeper=request.user)
-        user_visits = Visits.objects.filter(hive=user_hive, active=True).order_by('-date')
-        user_hive.mother = Mothers.objects.filter(hive=user_hive, active=True)
+        user_hive = get_object_or_404(Hives.objects.select_related('place'), id=hive_id, place__beekeeper=request.user)
+        user_hive.mother = Mothers.objects.current().filter(hive=user_hive)
+
+        # Jedna stránka prohlídek starších než kurzor, o řádek navíc pro zjištění, zda existují další
+        page_size = visits_page_size(request.GET.get('page_size'))
+        user_visits = list(
+            Visits.objects
+            .filter(hive=user_hive, active=True)
+            .older_than(parse_visit_cursor(request.GET.get('before')))
+            .prefetch_related('performed_tasks')[:page_size + 1]
+        )
+        next_cursor = None
+        if len(user_visits) > page_size:
+            user_visits = user_visits[:page_size]
+            last_visit = user_visits[-1]
+            next_cursor = f'{last_visit.date.isoformat()}_{last_visit.id}'
 
         return render(request, 'overview.html', {
             'overview_spec': 'visits',
             'hive_id': hive_id,
             'user_hive': user_hive,
-            'user_visits': user_visits
+            'user_visits': user_visits,
+            'page_size': page_size,
+            'next_cursor': next_cursor
         })
     except Http404:
         messages.error(request, "Záznamy o včelstvu pro přihlášeného uživatele nejsou k dispozici.")
@@ -645,25 +445,20 @@ def visits(request, hive_id=None):
 
 
 @login_required
-def add_visit(request, hive_id=None):
-    try:
-        user_hive = get_object_or_404(Hives, id=hive_id, place__beekeeper=request.user, active=True)
-        user_hive.mother = Mothers.objects.filter(hive=user_hive, active=True)
-    except Http404:
-        messages.error(request, "Záznamy o vybraném včelstvu nejsou k dispozici.")
-        return redirect('overview')
-
-    if request.user.id != user_hive.place.beekeeper.id:
-        messages.error(request, "Uživatel může zapisovat prohlídky pouze u svých včelstev.")
-        return redirect('overview')
+@owned('hive', 'hive_id', "Záznamy o vybraném včelstvu nejsou k dispozici.", active=True)
+def add_visit(request, user_hive):
+    user_hive.mother = Mothers.objects.current().filter(hive=user_hive)
 
     if request.method == 'POST':
         form = AddVisit(request.POST)
         if form.is_valid():
-            visit = form.save(commit=False)
-            visit.hive_id = user_hive.id
-            visit.save()
-            visit.performed_tasks.add(*form.cleaned_data['performed_tasks'])
+            with transaction.atomic():
+                visit = form.save(commit=False)
+                visit.hive_id = user_hive.id
+                visit.save()
+                visit.performed_tasks.add(*form.cleaned_data['performed_tasks'])
+                refresh_hive_summaries([user_hive.id], [visit.date.year])
+            invalidate_overview(request.user.id)
             messages.success(request, f'U včelstva {user_hive.number} '
                                       f'na stanovišti {user_hive.place.name} '
                                       f'byla zapsána prohlídka.')
@@ -671,15 +466,13 @@ def add_visit(request, hive_id=None):
     else:
         try:
             latest_visit = Visits.objects.filter(
-                hive__place__beekeeper=request.user,
-                hive_id=hive_id,
+                hive=user_hive,
                 active=True
             ).aggregate(latest_visit_date=Max('date'))['latest_visit_date']
 
             visit_instance = get_object_or_404(
                 Visits,
-                hive__place__beekeeper=request.user,
-                hive_id=hive_id,
+                hive=user_hive,
                 date=latest_visit,
                 active=True
             )
@@ -701,38 +494,172 @@ def add_visit(request, hive_id=None):
 
 
 @login_required
-def remove_visit(request, visit_id=None):
-    try:
-        user = request.user
-        visit = get_object_or_404(Visits, id=visit_id, hive__place__beekeeper=user, active=True)
+@owned('place', 'hives_place_id', "Záznamy o stanovišti pro přihlášeného uživatele nejsou k dispozici.", active=True)
+def add_visits(request, hives_place):
+    # Aktivní včelstva stanoviště i s posledním stavem pro předvyplnění jedním dotazem
+    hives = list(
+        Hives.objects
+        .filter(place=hives_place, active=True)
+        .select_related('status')
+        .order_by('number')
+    )
+    hives_by_id = {hive.id: hive for hive in hives}
+    task_choices = list(Tasks.objects.values_list('id', 'name'))
 
-        with transaction.atomic():
-            visit.active = False
-            visit.save()
+    if request.method == 'POST':
+        header = BulkVisitHeader(request.POST)
+        formset = BulkVisitFormSet(request.POST, form_kwargs={'task_choices': task_choices})
+        if header.is_valid() and formset.is_valid():
+            rows = [form for form in formset if form.cleaned_data.get('include')]
+            if any(form.cleaned_data['hive'] not in hives_by_id for form in rows):
+                messages.error(request, "Uživatel může zapisovat prohlídky pouze u svých včelstev.")
+                return redirect('overview')
 
-        formatted_date = visit.date.strftime('%d. %m. %Y')
-        messages.success(request, f"Prohlídka z {formatted_date} byla smazána.")
-        return redirect('visits', visit.hive_id)
+            new_visits = []
+            for form in rows:
+                visit = form.save(commit=False)
+                visit.hive_id = form.cleaned_data['hive']
+                visit.date = header.cleaned_data['date']
+                visit.inspection_type = header.cleaned_data['inspection_type']
+                new_visits.append(visit)
+
+            with transaction.atomic():
+                Visits.objects.bulk_create(new_visits)
+                # Provedené úkony všech prohlídek jedním vložením do spojovací tabulky
+                PerformedTasks = Visits.performed_tasks.through
+                PerformedTasks.objects.bulk_create([
+                    PerformedTasks(visits_id=visit.id, tasks_id=task_id)
+                    for visit, form in zip(new_visits, rows)
+                    for task_id in form.cleaned_data['performed_tasks']
+                ])
+                refresh_hive_summaries((visit.hive_id for visit in new_visits), [header.cleaned_data['date'].year])
+
+            invalidate_overview(request.user.id)
+            messages.success(request, f'Na stanovišti {hives_place.name} byla zapsána prohlídka '
+                                      f'{len(new_visits)} včelstev.')
+            return redirect('hives_place', hives_place.id)
+    else:
+        header = BulkVisitHeader()
+        initial = []
+        for hive in hives:
+            row = {'hive': hive.id, 'include': True}
+            status = getattr(hive, 'status', None)
+            if status:
+                row.update({
+                    'condition': status.condition,
+                    'hive_body_size': status.hive_body_size,
+                    'honey_supers_size': status.honey_supers_size,
+                })
+            initial.append(row)
+        formset = BulkVisitFormSet(initial=initial, form_kwargs={'task_choices': task_choices})
+
+    # Dvojice (včelstvo, formulář) pro vykreslení řádků; hodnoty z POST jsou řetězce
+    hives_by_key = {str(hive_id): hive for hive_id, hive in hives_by_id.items()}
+    rows = [(hives_by_key.get(str(form['hive'].value())), form) for form in formset]
+    return render(request, 'create_visits.html', {
+        'hives_place': hives_place,
+        'header': header,
+        'formset': formset,
+        'rows': rows
+    })
 
-    except Http404:
-        messages.error(request, f"Záznam o prohlídce přihlášeného uživatele neexistuje.")
-    return redirect('overview')
+
+@login_required
+def import_visits(request):
+    result = None
+    if request.method == 'POST':
+        form = ImportVisits(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format'] or detect_format(upload.name)
+            try:
+                result = import_visit_records(request.user, iter_records(text_stream(upload.file), fmt))
+            except (UnicodeDecodeError, ValueError) as error:
+                messages.error(request, f'Soubor se nepodařilo načíst: {error}')
+            else:
+                messages.success(request, f'Importováno {result.created} prohlídek, '
+                                          f'chybných záznamů: {result.failed}.')
+            finally:
+                # Dávky uložené před chybou souboru v databázi zůstávají
+                invalidate_overview(request.user.id)
+    else:
+        form = ImportVisits()
+
+    return render(request, 'import_visits.html', {
+        'form': form,
+        'result': result
+    })
 
 
 @login_required
-def edit_visit(request, visit_id):
-    try:
-        user_hive = get_object_or_404(Hives, visits__id=visit_id, place__beekeeper=request.user, active=True)
-        visit_instance = get_object_or_404(Visits, id=visit_id, hive__place__beekeeper=request.user, active=True)
-    except Http404:
-        messages.error(request, "Požadované záznamy o vybraném včelstvu nejsou k dispozici...")
+def export_records(request, kind, fmt):
+    if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+        messages.error(request, 'Požadovaný export není k dispozici.')
         return redirect('overview')
 
+    content_type, extension = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(stream_export(kind, request.user, fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+    return response
+
+
+@login_required
+def analytics(request, scope=None, object_id=None):
+    # Časové řady pro grafy: celý včelař, stanoviště (scope=place) nebo včelstvo (scope=hive)
+    user = request.user
+    bucket = request.GET.get('bucket', 'month')
+    try:
+        window = int(request.GET.get('window', settings.ANALYTICS_ROLLING_WINDOW))
+    except ValueError:
+        window = 0
+    if bucket not in BUCKETS or not 1 <= window <= settings.ANALYTICS_MAX_ROLLING_WINDOW:
+        return JsonResponse({'error': 'Neplatné období nebo délka klouzavého průměru.'}, status=400)
+
+    filters = {}
+    if scope == 'place':
+        get_object_or_404(HivesPlaces, id=object_id, beekeeper=user)
+        filters['place_id'] = object_id
+    elif scope == 'hive':
+        get_object_or_404(Hives, id=object_id, place__beekeeper=user)
+        filters['hive_id'] = object_id
+    elif scope is not None:
+        raise Http404
+
+    return JsonResponse({
+        'scope': scope or 'beekeeper',
+        'id': object_id,
+        'bucket': bucket,
+        'window': window,
+        'series': time_series(user, bucket, window, **filters),
+    })
+
+
+@login_required
+@owned('visit', 'visit_id', "Záznam o prohlídce přihlášeného uživatele neexistuje.", active=True)
+def remove_visit(request, visit):
+    deactivate_visit(visit)
+    formatted_date = visit.date.strftime('%d. %m. %Y')
+    invalidate_overview(request.user.id)
+    messages.success(request, f"Prohlídka z {formatted_date} byla smazána.")
+    return redirect('visits', visit.hive_id)
+
+
+@login_required
+@owned('visit', 'visit_id', "Požadované záznamy o vybraném včelstvu nejsou k dispozici...", active=True,
+       hive__active=True)
+def edit_visit(request, visit_instance):
+    user_hive = visit_instance.hive
+    # Formulář přepisuje instanci už při validaci, původní sezóna se musí uložit předem
+    old_season = visit_instance.date.year
+
     if request.method == 'POST':
         form = EditVisit(request.POST, instance=visit_instance)
         if form.is_valid():
-            form.save()
-            form.instance.performed_tasks.set(form.cleaned_data['performed_tasks'])
+            with transaction.atomic():
+                form.save()
+                form.instance.performed_tasks.set(form.cleaned_data['performed_tasks'])
+                refresh_hive_summaries([user_hive.id], [old_season, form.instance.date.year])
+            invalidate_overview(request.user.id)
             messages.success(request, f'Prohlídka u včelstva {visit_instance.hive.number} '
                                       f'na stanovišti {visit_instance.hive.place.name} '
                                       f'byla úspěšně upravena.')